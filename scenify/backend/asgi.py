@@ -0,0 +1,275 @@
+# ASGI entry point serving the same API as app.py, with the route pipeline running on asyncio.
+# A slow Overpass query only holds a coroutine instead of a whole worker, so one process keeps serving
+# other trips while it waits:
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# CPU work (solving, simplifying and encoding the paths, compressing the responses) goes to the default
+# executor, so it never stalls the other requests on the loop.
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from geocoding import geocode_cache
+from overpass import tile_cache, overpass_flights
+from routing import leg_cache
+from pipeline import (
+    plan_routes_async, stream_routes_async, sse_event, route_flights, RoutePlanningError,
+    requested_path_zoom, requested_tags, compact_routes, compact_event
+)
+from compression import choose_encoding, should_compress, compress
+from upstream import UpstreamUnavailable, upstream_stats
+import metrics
+
+# All the upstream calls (Nominatim, Overpass and OSRM) share one pool of keep-alive connections
+UPSTREAM_CONNECTIONS = int(os.environ.get("SCENIFY_UPSTREAM_CONNECTIONS", 64))
+
+client = None
+
+
+def get_client():
+    global client
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=UPSTREAM_CONNECTIONS, max_keepalive_connections=UPSTREAM_CONNECTIONS),
+            timeout=30
+        )
+    return client
+
+
+async def read_json(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body or b"null")
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+            *headers
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_route_request(receive, send):
+    # Returns ((start_location, end_location, max_pois, categories), path zoom, include tags), or None after
+    # answering with a 400
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await send_json(send, 400, {"error": "The request body must be a JSON object"})
+        return None
+    start_location = data.get('startLocation')
+    end_location = data.get('endLocation')
+    max_pois = data.get('poiCount', 15)
+    categories = data.get('categories', [])
+    if not start_location or not end_location:
+        await send_json(send, 400, {"error": "Start and end locations are required"})
+        return None
+    return (start_location, end_location, max_pois, categories), requested_path_zoom(data), requested_tags(data)
+
+
+async def generate_routes(receive, send):
+    route_request = await read_route_request(receive, send)
+    if route_request is None:
+        return
+    route_request, zoom, include_tags = route_request
+    try:
+        routes = await plan_routes_async(get_client(), *route_request)
+    except RoutePlanningError as e:
+        return await send_json(send, 400, {"error": str(e)})
+    except UpstreamUnavailable as e:
+        return await send_json(send, 503, {"error": str(e)})
+    # Simplifying a cross-country path can take a few hundred milliseconds
+    payload = await asyncio.get_running_loop().run_in_executor(None, compact_routes, routes, zoom, include_tags)
+    await send_json(send, 200, payload)
+
+
+async def stream_generated_routes(receive, send):
+    route_request = await read_route_request(receive, send)
+    if route_request is None:
+        return
+    route_request, zoom, include_tags = route_request
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*")
+        ]
+    })
+    loop = asyncio.get_running_loop()
+    events = stream_routes_async(get_client(), *route_request)
+    try:
+        async for event, payload in events:
+            body = await loop.run_in_executor(None, encode_event, event, payload, zoom, include_tags)
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        # The client went away, closing the events stops the planning
+        pass
+    finally:
+        await events.aclose()
+
+
+def encode_event(event, payload, zoom, include_tags):
+    return sse_event(*compact_event(event, payload, zoom, include_tags)).encode()
+
+
+async def cache_stats(receive, send):
+    await send_json(send, 200, {
+        "geocode": geocode_cache.stats(),
+        "overpass_tiles": tile_cache.stats(),
+        "osrm_legs": leg_cache.stats()
+    })
+
+
+async def coalescing_stats(receive, send):
+    await send_json(send, 200, {
+        "routes": route_flights.stats(),
+        "overpass": overpass_flights.stats()
+    })
+
+
+async def upstream_statistics(receive, send):
+    await send_json(send, 200, upstream_stats())
+
+
+async def metrics_endpoint(receive, send):
+    body = metrics.render().encode()
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+            (b"content-length", str(len(body)).encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+ROUTES = {
+    ('POST', '/api/routes'): generate_routes,
+    ('POST', '/api/routes/stream'): stream_generated_routes,
+    ('GET', '/api/cache/stats'): cache_stats,
+    ('GET', '/api/coalescing/stats'): coalescing_stats,
+    ('GET', '/api/upstream/stats'): upstream_statistics,
+    ('GET', '/metrics'): metrics_endpoint,
+}
+
+
+async def lifespan(receive, send):
+    global client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if client is not None:
+                await client.aclose()
+                client = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def compressing(send, encoding):
+    # Wraps send to compress a JSON response sent in one piece. Responses sent in several pieces
+    # (the event streams) go out as they are.
+    start = None
+
+    async def send_compressed(message):
+        nonlocal start
+        if message["type"] == "http.response.start":
+            start = message
+            return
+        if start is not None:
+            body = message.get("body", b"")
+            headers = dict(start["headers"])
+            content_type = headers.get(b"content-type", b"").decode()
+            if not message.get("more_body") and should_compress(content_type, body):
+                body = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding)
+                headers[b"content-length"] = str(len(body)).encode()
+                headers[b"content-encoding"] = encoding.encode()
+                headers[b"vary"] = b"Accept-Encoding"
+                start = {**start, "headers": list(headers.items())}
+                message = {**message, "body": body}
+            await send(start)
+            start = None
+        await send(message)
+
+    return send_compressed
+
+
+def timing(send, started, timings, response):
+    # Wraps send to keep the status of the response in response and, with SCENIFY_SERVER_TIMING=1, add
+    # the Server-Timing header to the JSON responses. The event streams start before any stage ran.
+    async def send_timed(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            headers = dict(message["headers"])
+            if metrics.SERVER_TIMING and headers.get(b"content-type") != b"text/event-stream":
+                value = metrics.server_timing(timings, time.perf_counter() - started)
+                message = {**message, "headers": message["headers"] + [(b"server-timing", value.encode())]}
+        await send(message)
+
+    return send_timed
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    encoding = choose_encoding(dict(scope["headers"]).get(b"accept-encoding", b"").decode())
+    if encoding is not None:
+        send = compressing(send, encoding)
+
+    method, path = scope["method"], scope["path"].rstrip("/")
+    started = time.perf_counter()
+    response = {"status": 500}
+    send = timing(send, started, metrics.request_timings(), response)
+    try:
+        await route_request(scope, method, path, receive, send)
+    finally:
+        endpoint = path if (method, path) in ROUTES else "other"
+        metrics.REQUESTS.inc(endpoint=endpoint, status=response["status"])
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+
+async def route_request(scope, method, path, receive, send):
+    if method == "OPTIONS":
+        # CORS preflight, the frontend runs on another origin like with flask-cors
+        requested = dict(scope["headers"]).get(b"access-control-request-headers", b"")
+        return await send_json(send, 200, {}, [
+            (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+            (b"access-control-allow-headers", requested)
+        ])
+
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        return await send_json(send, 404, {"error": "Not found"})
+    try:
+        await handler(receive, send)
+    except Exception as e:
+        print(f"Error handling {method} {path}: {str(e)}")
+        await send_json(send, 500, {"error": "Internal server error"})
@@ -0,0 +1,311 @@
+# Plans the routes of many trips at once, e.g. to precompute popular city pairs overnight:
+#
+#   python batch_routes.py trips.jsonl routes.jsonl [--categories categories.json] [--processes 8]
+#
+# Every line of the input is a request like the body of POST /api/routes: {"startLocation", "endLocation"},
+# with optional "poiCount", "categories" (the ones of --categories otherwise), "pathFormat"/"pathZoom" and
+# an "id" copied to the output. Every line of the output is {"index", "id", "startLocation", "endLocation"}
+# with "routes" (the /api/routes response) or "error", written as soon as the trip is planned, so the lines
+# are not in the order of the input.
+#
+# Compared with one request per trip, the work the trips share is done once:
+#   - every place is geocoded once, however many trips start or end there, and identical trips are planned once
+#   - trips whose search areas overlap are grouped, and the Overpass tiles of a group are fetched together,
+#     each tile once, before the POIs of its trips are read from the tile cache
+#   - the scenic routes of all the trips are solved in a pool of --processes worker processes (one per core
+#     by default), while the next trips are searched and the solved ones get their roads from OSRM
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import solver_pool
+from geocoding import geocode_location, normalize_location_query
+from overpass import warm_tiles
+from pipeline import (
+    RoutePlanningError, build_response, check_locations, compact_routes, direct_path, profile_limits,
+    requested_path_zoom, requested_tags, route_request_key
+)
+from poi_store import poi_store
+from pois import fetch_search_pois, search_tiles
+from routing import OSRM_WORKERS, get_route_legs
+from scenic import order_scenic_route, route_from_order
+
+# Tiles fetched together at most, the tile cache has to hold them until the POIs of their trips are read
+GROUP_MAX_TILES = 256
+
+
+def read_trips(path, categories):
+    trips = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                trips.append({
+                    "index": len(trips),
+                    "id": data.get('id'),
+                    "start_location": data.get('startLocation'),
+                    "end_location": data.get('endLocation'),
+                    "max_pois": data.get('poiCount', 15),
+                    "categories": data.get('categories', categories),
+                    "zoom": requested_path_zoom(data),
+                    "include_tags": requested_tags(data)
+                })
+    return trips
+
+
+def geocode_places(trips):
+    # Every place once, one after the other: Nominatim asks for no more than one request per second
+    places = {}
+    for trip in trips:
+        for location in (trip["start_location"], trip["end_location"]):
+            if location:
+                places.setdefault(normalize_location_query(location), location)
+    print(f"Geocoding {len(places)} places for {len(trips)} trips")
+    coordinates = {}
+    for key, location in places.items():
+        try:
+            coordinates[key] = geocode_location(location)
+        except Exception as e:
+            print(f"Could not geocode {location}: {e}")
+    return coordinates
+
+
+def trip_search(plan):
+    # The direct route of the trip is routed first in corridor mode, we only keep its search area: the legs
+    # of hundreds of trips would take a lot of memory, they are fetched again (from the leg cache) at the end
+    try:
+        legs = get_route_legs([plan["start"], plan["end"]])
+        plan["search"] = search_tiles(plan["start"], plan["end"], direct_path(legs))
+    except Exception as e:
+        plan["error"] = f"Unable to generate routes: {e}"
+    return plan
+
+
+def group_plans(plans):
+    # Groups the trips sharing tiles, with a union-find on the tiles. A group with too many tiles for the
+    # tile cache is cut into parts of neighbouring trips.
+    parent = list(range(len(plans)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for i, plan in enumerate(plans):
+        for tile in plan["search"][1]:
+            if tile in owner:
+                parent[find(i)] = find(owner[tile])
+            else:
+                owner[tile] = i
+
+    components = {}
+    for i, plan in enumerate(plans):
+        components.setdefault(find(i), []).append(plan)
+    groups = []
+    for component in components.values():
+        component.sort(key=lambda plan: min(plan["search"][1]) if plan["search"][1] else (0, 0))
+        group, tiles = [], set()
+        for plan in component:
+            if group and len(tiles | set(plan["search"][1])) > GROUP_MAX_TILES:
+                groups.append((group, tiles))
+                group, tiles = [], set()
+            group.append(plan)
+            tiles.update(plan["search"][1])
+        groups.append((group, tiles))
+    return groups
+
+
+class BatchPlanner:
+
+    def __init__(self, output, processes):
+        self.output = output
+        self.processes = processes
+        self.lock = threading.Lock()
+        self.planned = 0
+        self.failed = 0
+        # Trips handed to the solvers and not written yet
+        self.unfinished = 0
+        self.all_finished = threading.Condition(self.lock)
+        # Fetches the roads of the solved trips and writes them out
+        self.finishers = ThreadPoolExecutor(max_workers=max(2, OSRM_WORKERS), thread_name_prefix="batch")
+
+    def write(self, plan, result):
+        with self.lock:
+            for trip in plan["trips"]:
+                line = {
+                    "index": trip["index"],
+                    "id": trip["id"],
+                    "startLocation": trip["start_location"],
+                    "endLocation": trip["end_location"]
+                }
+                if "routes" in result:
+                    line["routes"] = compact_routes(result["routes"], trip["zoom"], trip["include_tags"])
+                    self.planned += 1
+                else:
+                    line["error"] = result["error"]
+                    self.failed += 1
+                self.output.write(json.dumps(line) + "\n")
+            self.output.flush()
+
+    def fail(self, plan, error):
+        trip = plan["trips"][0]
+        print(f"Could not plan {trip['start_location']} -> {trip['end_location']}: {error}")
+        self.write(plan, {"error": error})
+
+    def solve(self, plan):
+        # Searches the POIs of the trip and hands its scenic route profiles to the solver pool,
+        # the trip is finished when all of them are solved
+        trip = plan["trips"][0]
+        pois = fetch_search_pois(plan["start"], plan["end"], trip["categories"], plan["search"])
+        plan["search"] = None
+        plan["profiles"] = profile_limits(trip["max_pois"])
+        plan["pois"], plan["problem"] = [], None
+        if pois:
+            plan["pois"], plan["problem"] = solver_pool.compact_problem(plan["start"], plan["end"], pois)
+        with self.lock:
+            self.unfinished += 1
+
+        if not pois:
+            self.finishers.submit(self.finish, plan, [None] * len(plan["profiles"]))
+        elif self.processes == 0 or not self.submit_to_pool(plan):
+            self.finishers.submit(self.finish, plan, None)
+
+    def submit_to_pool(self, plan):
+        try:
+            pool = solver_pool.get_pool()
+            futures = [
+                pool.submit(solver_pool.order_scenic_route_recorded, *plan["problem"], detour, max_pois)
+                for detour, max_pois in plan["profiles"]
+            ]
+        except BrokenProcessPool:
+            self.solve_in_process()
+            return False
+        remaining = [len(futures)]
+
+        def solved(_):
+            with self.lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                self.finishers.submit(self.finish, plan, futures)
+
+        for future in futures:
+            future.add_done_callback(solved)
+        return True
+
+    def solve_in_process(self):
+        print("The solver pool broke down, solving the rest of the batch in this process")
+        self.processes = 0
+
+    def finish(self, plan, orders):
+        # orders holds a solver pool future per profile, None per profile when the trip has no POIs,
+        # or is None when the profiles are solved here
+        try:
+            start, end = plan["start"], plan["end"]
+            if orders is not None:
+                try:
+                    orders = [order if order is None else solver_pool.recorded_order(order) for order in orders]
+                except BrokenProcessPool:
+                    self.solve_in_process()
+                    orders = None
+            if orders is None:
+                orders = [
+                    order_scenic_route(*plan["problem"], detour, max_pois) for detour, max_pois in plan["profiles"]
+                ]
+            scenic_routes = [
+                ([start, end], 0) if order is None else route_from_order(start, end, plan["pois"], order)
+                for order in orders
+            ]
+            fastest_route = [start, end]
+            route_legs = [get_route_legs(fastest_route)] + [get_route_legs(route) for route, _ in scenic_routes]
+            self.write(plan, {"routes": build_response(fastest_route, scenic_routes, route_legs)})
+        except Exception as e:
+            self.fail(plan, f"Unable to generate routes: {e}")
+        finally:
+            with self.lock:
+                self.unfinished -= 1
+                self.all_finished.notify_all()
+
+    def run(self, trips):
+        started = time.time()
+        coordinates = geocode_places(trips)
+
+        # Identical trips are planned once
+        plans = {}
+        for trip in trips:
+            if not trip["start_location"] or not trip["end_location"]:
+                self.write({"trips": [trip]}, {"error": "Start and end locations are required"})
+                continue
+            key = route_request_key(
+                trip["start_location"], trip["end_location"], trip["max_pois"], trip["categories"])
+            plans.setdefault(key, {"trips": []})["trips"].append(trip)
+
+        ready = []
+        for plan in plans.values():
+            trip = plan["trips"][0]
+            start = coordinates.get(normalize_location_query(trip["start_location"]))
+            end = coordinates.get(normalize_location_query(trip["end_location"]))
+            try:
+                check_locations(trip["start_location"], trip["end_location"], start, end)
+            except RoutePlanningError as e:
+                self.fail(plan, str(e))
+                continue
+            # Every trip gets its own copies, check_locations names them
+            plan["start"], plan["end"] = dict(start), dict(end)
+            ready.append(plan)
+
+        print(f"Routing the direct routes of {len(ready)} trips")
+        with ThreadPoolExecutor(max_workers=OSRM_WORKERS, thread_name_prefix="batch-osrm") as pool:
+            ready = list(pool.map(trip_search, ready))
+        for plan in ready:
+            if "error" in plan:
+                self.fail(plan, plan["error"])
+        ready = [plan for plan in ready if "error" not in plan]
+
+        groups = group_plans(ready)
+        print(f"Searching for POIs in {len(groups)} groups of trips")
+        for i, (group, tiles) in enumerate(groups):
+            print(f"Group {i + 1}/{len(groups)}: {len(group)} trips, {len(tiles)} tiles")
+            if poi_store is None:
+                warm_tiles(sorted(tiles))
+            for plan in group:
+                try:
+                    self.solve(plan)
+                except Exception as e:
+                    self.fail(plan, f"Unable to generate routes: {e}")
+
+        with self.lock:
+            self.all_finished.wait_for(lambda: self.unfinished == 0)
+        self.finishers.shutdown(wait=True)
+        elapsed = time.time() - started
+        print(f"Planned {self.planned} of {len(trips)} trips in {elapsed:.1f}s "
+              f"({self.planned / elapsed * 60:.1f} trips per minute), {self.failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan the routes of many trips, written as JSON Lines")
+    parser.add_argument("trips", help="JSON Lines file, one /api/routes request per line")
+    parser.add_argument("output", help="JSON Lines file to write the routes to")
+    parser.add_argument("--categories", help="JSON file with the categories of the trips that have none")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="worker processes solving the scenic routes, 0 solves them in this process")
+    args = parser.parse_args()
+
+    categories = []
+    if args.categories:
+        with open(args.categories, encoding='utf-8') as f:
+            categories = json.load(f)
+    # The batch has the machine to itself, the solver pool gets a worker per core instead of the web default
+    solver_pool.SOLVER_PROCESSES = args.processes
+    with open(args.output, 'w', encoding='utf-8') as output:
+        BatchPlanner(output, args.processes).run(read_trips(args.trips, categories))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Plans the same trips one request at a time (what a script posting to /api/routes does) and with
+# batch_routes.py for a few pool sizes, against the stub upstreams: trips per minute, and the requests
+# Nominatim, Overpass and OSRM got. The trips go between a few dozen places in France, so places repeat
+# and search areas overlap like for a list of popular city pairs. Every run is a fresh process with cold caches.
+#
+#   python -m benchmarks.bench_batch [--trips 60] [--processes 1 2 4]
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load_routes import CATEGORIES
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from benchmarks.stub_upstreams import StubNominatim, StubOSRM
+from geo import haversine
+
+SEQUENTIAL_SCRIPT = """
+import json, sys
+from pipeline import plan_routes
+
+with open(sys.argv[1]) as f:
+    for line in f:
+        trip = json.loads(line)
+        plan_routes(trip["startLocation"], trip["endLocation"], trip["poiCount"], trip["categories"])
+"""
+
+
+def make_trips(count, places=30, seed=7):
+    # Trips of 100 to 500 km between random places, geocoded by the stub from their "lat,lon" names
+    rng = random.Random(seed)
+    points = [(rng.uniform(43.5, 49.5), rng.uniform(-1, 7)) for _ in range(places)]
+    trips = []
+    while len(trips) < count:
+        start, end = rng.sample(points, 2)
+        if 100 <= haversine(*start, *end) <= 500:
+            trips.append({
+                "startLocation": f"{start[0]:.4f},{start[1]:.4f}", "endLocation": f"{end[0]:.4f},{end[1]:.4f}",
+                "poiCount": 10, "categories": CATEGORIES
+            })
+    return trips
+
+
+def run(command, env, stubs):
+    before = [stub.queries if hasattr(stub, "queries") else stub.requests for stub in stubs]
+    started = time.perf_counter()
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    elapsed = time.perf_counter() - started
+    after = [stub.queries if hasattr(stub, "queries") else stub.requests for stub in stubs]
+    return elapsed, [b - a for a, b in zip(before, after)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trips", type=int, default=60)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--overpass-latency", type=float, default=0.5)
+    parser.add_argument("--osrm-latency", type=float, default=0.05)
+    parser.add_argument("--geocode-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    trips = make_trips(args.trips)
+    places = {trip[key] for trip in trips for key in ("startLocation", "endLocation")}
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubOverpass(make_elements(20000, 40, -5, 52, 10), args.overpass_latency, 0.0) as stub_overpass, \
+            StubNominatim(args.geocode_latency) as stub_nominatim, StubOSRM(args.osrm_latency) as stub_osrm:
+        trips_path = os.path.join(tmp, "trips.jsonl")
+        with open(trips_path, 'w') as f:
+            f.writelines(json.dumps(trip) + "\n" for trip in trips)
+        env = {
+            **os.environ,
+            "SCENIFY_OVERPASS_URL": stub_overpass.url,
+            "SCENIFY_GEOCODING_URL": stub_nominatim.url,
+            "SCENIFY_OSRM_URL": stub_osrm.url,
+            "SCENIFY_NOMINATIM_RATE": "0",
+        }
+        env.pop("SCENIFY_CACHE_DB", None)
+        env.pop("SCENIFY_POI_STORE", None)
+        stubs = [stub_nominatim, stub_overpass, stub_osrm]
+
+        print(f"{len(trips)} trips between {len(places)} places, {os.cpu_count()} CPUs")
+        print(f"{'run':<28}{'time':>8}{'trips/min':>11}{'geocodes':>10}{'Overpass':>10}{'OSRM':>6}{'planned':>9}")
+        elapsed, requests = run([sys.executable, "-c", SEQUENTIAL_SCRIPT, trips_path], env, stubs)
+        print(f"{'one request per trip':<28}{elapsed:>7.1f}s{len(trips) / elapsed * 60:>11.1f}"
+              f"{requests[0]:>10}{requests[1]:>10}{requests[2]:>6}{len(trips):>9}")
+        for processes in args.processes:
+            output_path = os.path.join(tmp, f"routes-{processes}.jsonl")
+            elapsed, requests = run(
+                [sys.executable, "batch_routes.py", trips_path, output_path, "--processes", str(processes)], env, stubs)
+            with open(output_path) as f:
+                planned = sum("routes" in json.loads(line) for line in f)
+            print(f"{f'batch, {processes} processes':<28}{elapsed:>7.1f}s{len(trips) / elapsed * 60:>11.1f}"
+                  f"{requests[0]:>10}{requests[1]:>10}{requests[2]:>6}{planned:>9}")
+
+
+if __name__ == '__main__':
+    main()
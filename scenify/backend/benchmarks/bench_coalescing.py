@@ -0,0 +1,69 @@
+# A trending trip: a burst of requests for the same trip arrives at once, some with the same categories and
+# some with others. Compares the upstream traffic and the latency with and without request coalescing, for
+# the Flask app and the ASGI app, against stub upstreams. The stub Overpass only runs a few queries at a time
+# and rate limits the others.
+#
+#   python -m benchmarks.bench_coalescing [--requests 24] [--slots 4]
+import argparse
+import asyncio
+import contextlib
+import io
+
+import geocoding
+import overpass
+import pipeline
+import routing
+from benchmarks.load_routes import CATEGORIES, asgi_server, clear_caches, flask_server, percentile, run_load
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from benchmarks.stub_upstreams import StubNominatim, StubOSRM
+
+TRIP = ("48.8566,2.3522", "45.7640,4.8357")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--slots", type=int, default=4, help="queries the stub Overpass runs at once")
+    parser.add_argument("--overpass-latency", type=float, default=1.0)
+    parser.add_argument("--backoff", type=float, default=0.5, help="Overpass backoff in seconds")
+    args = parser.parse_args()
+
+    overpass.OVERPASS_BACKOFF = args.backoff
+    # Half of the burst asks for the trip with all the categories, the other half with only the first one
+    trips = [
+        ("same", *TRIP) if i % 2 == 0 else ("other categories", *TRIP)
+        for i in range(args.requests)
+    ]
+    other_categories = CATEGORIES[:1]
+
+    with StubOverpass(make_elements(20000, 40, -5, 52, 10), args.overpass_latency, 0.0, slots=args.slots) as stub, \
+            StubNominatim(0.05) as stub_nominatim, StubOSRM(0.05) as stub_osrm:
+        overpass.OVERPASS_API_URL = stub.url
+        geocoding.GEOCODING_API_URL = stub_nominatim.url
+        geocoding.nominatim.set_rate(0)
+        routing.OSRM_API_URL = stub_osrm.url
+
+        print(f"{args.requests} requests for the same trip at once, Overpass runs {args.slots} queries at a time")
+        print(f"{'server':<16}{'coalescing':>11}{'Overpass queries':>18}{'429s':>6}{'OSRM calls':>12}"
+              f"{'deduplicated':>14}{'p50':>8}{'max':>8}")
+        for name, server in [("Flask", lambda: flask_server(args.requests)), ("ASGI", asgi_server)]:
+            for enabled in [False, True]:
+                clear_caches()
+                for flights in [pipeline.route_flights, overpass.overpass_flights]:
+                    flights.enabled = enabled
+                    flights.calls = flights.deduplicated = 0
+                queries, rate_limited, osrm_calls = stub.queries, stub.rate_limited, stub_osrm.requests
+                with server() as url, contextlib.redirect_stdout(io.StringIO()):
+                    _, latencies, failures = asyncio.run(run_load(url, trips, args.requests, {
+                        "other categories": other_categories
+                    }))
+                assert not failures
+                latencies = latencies["same"] + latencies["other categories"]
+                deduplicated = pipeline.route_flights.deduplicated + overpass.overpass_flights.deduplicated
+                print(f"{name:<16}{'on' if enabled else 'off':>11}{stub.queries - queries:>18}"
+                      f"{stub.rate_limited - rate_limited:>6}{stub_osrm.requests - osrm_calls:>12}"
+                      f"{deduplicated:>14}{percentile(latencies, 0.5):>7.2f}s{max(latencies):>7.2f}s")
+
+
+if __name__ == '__main__':
+    main()
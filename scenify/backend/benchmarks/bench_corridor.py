@@ -0,0 +1,67 @@
+# Compares the bounding box search with the corridor search along the direct route's road, against the stub
+# Overpass and OSRM: sub-queries, bytes sent by Overpass, fetch and parse time, peak memory of the Python
+# objects, and the POIs found. The stub OSRM road is a straight line, so the corridor is a band along it.
+#
+#   python -m benchmarks.bench_corridor [--elements 200000]
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+import overpass
+import pois
+import routing
+from benchmarks.bench_overpass import TRIPS
+from benchmarks.load_routes import CATEGORIES
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from benchmarks.stub_upstreams import StubOSRM
+from corridor import route_path
+
+DIAGONAL_TRIPS = [
+    ("1300 km diagonal (Amsterdam -> Rome)", {"lat": 52.3676, "lon": 4.9041}, {"lat": 41.9028, "lon": 12.4964}),
+    ("1000 km diagonal (Barcelona -> Munich)", {"lat": 41.3874, "lon": 2.1686}, {"lat": 48.1351, "lon": 11.5820}),
+]
+
+
+def measure(stub, fn, *args):
+    # Runs fn with a cold tile cache and returns (sub-queries, MB sent, seconds, peak MB, result)
+    overpass.tile_cache.clear()
+    queries, sent = stub.queries, stub.bytes_sent
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return stub.queries - queries, (stub.bytes_sent - sent) / 1e6, elapsed, peak / 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=200000)
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--latency-per-sq-degree", type=float, default=0.005)
+    args = parser.parse_args()
+
+    with StubOverpass(make_elements(args.elements), args.base_latency, args.latency_per_sq_degree) as stub, \
+            StubOSRM(0.01) as stub_osrm:
+        overpass.OVERPASS_API_URL = stub.url
+        routing.OSRM_API_URL = stub_osrm.url
+        print(f"{'trip':<40}{'search':>9}{'queries':>9}{'MB sent':>9}{'time':>8}{'peak MB':>9}{'POIs':>6}"
+              f"{'shared':>8}")
+        for name, start, end in TRIPS + DIAGONAL_TRIPS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                path = route_path(routing.get_route_legs([start, end]))
+            bbox_run = measure(stub, pois.fetch_all_pois, start, end, CATEGORIES)
+            corridor_run = measure(stub, pois.fetch_all_pois, start, end, CATEGORIES, path)
+            bbox_names = {poi['name'] for poi in bbox_run[4]}
+            for search, (queries, sent, elapsed, peak, found) in [("bbox", bbox_run), ("corridor", corridor_run)]:
+                shared = sum(poi['name'] in bbox_names for poi in found)
+                print(f"{name if search == 'bbox' else '':<40}{search:>9}{queries:>9}{sent:>9.1f}{elapsed:>7.2f}s"
+                      f"{peak:>9.1f}{len(found):>6}{shared:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Microbenchmark of the scalar distance helpers in scenic.py against their vectorized versions in geo.py.
+#
+#   python -m benchmarks.bench_distance [--sizes 100 1000 10000]
+import argparse
+import random
+import time
+
+import numpy as np
+
+import geo
+import scenic
+
+START = {"lat": 48.8566, "lon": 2.3522}
+END = {"lat": 43.2965, "lon": 5.3698}
+# The full matrix needs n * n floats, above this size we skip it
+MATRIX_LIMIT = 2000
+
+
+def random_pois(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {"lat": rng.uniform(43, 49), "lon": rng.uniform(2, 6)}
+        for _ in range(count)
+    ]
+
+
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'operation':<28}{'n':>7}{'scalar':>12}{'numpy':>12}{'speedup':>9}{'max diff (km)':>15}")
+    for n in args.sizes:
+        pois = random_pois(n)
+        lats, lons = geo.coordinates(pois)
+        rows = []
+
+        scalar_time, expected = best_of(lambda: [scenic.is_poi_on_reasonable_path(START, END, p, 2.0) for p in pois])
+        vector_time, mask = best_of(lambda: geo.reasonable_path_mask(START, END, lats, lons, 2.0))
+        assert list(mask) == expected
+        rows.append(("reasonable path filter", scalar_time, vector_time, 0.0))
+
+        scalar_time, expected = best_of(lambda: [scenic.distance_to_line(START, END, p) for p in pois])
+        vector_time, result = best_of(lambda: geo.distances_to_line(START, END, lats, lons))
+        rows.append(("distance to line", scalar_time, vector_time, float(np.abs(result - expected).max())))
+
+        scalar_time, expected = best_of(lambda: sum(
+            scenic.calculate_distance(pois[i], pois[i + 1]) for i in range(n - 1)))
+        vector_time, result = best_of(lambda: geo.path_length(lats, lons))
+        rows.append(("path length", scalar_time, vector_time, abs(result - expected)))
+
+        if n <= MATRIX_LIMIT:
+            scalar_time, expected = best_of(
+                lambda: [[scenic.calculate_distance(a, b) for b in pois] for a in pois], repeat=1)
+            vector_time, result = best_of(lambda: geo.distance_matrix(lats, lons))
+            rows.append(("distance matrix", scalar_time, vector_time, float(np.abs(result - expected).max())))
+
+        for name, scalar_time, vector_time, diff in rows:
+            print(f"{name:<28}{n:>7}{scalar_time * 1000:>10.2f}ms{vector_time * 1000:>10.2f}ms"
+                  f"{scalar_time / vector_time:>8.1f}x{diff:>15.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Size of a route response's path as [lon, lat] pairs against the encoded polylines simplified for a few zooms,
+# raw and compressed, with the largest distance of the full path to the simplified one. The road is synthetic:
+# a point every ~30 m with bends and curves like an OSRM overview=full geometry, and the repeated points of
+# the leg joins.
+#
+#   python -m benchmarks.bench_geometry [--km 800] [--legs 15]
+import argparse
+import json
+import random
+import time
+from math import cos, radians, sin
+
+import numpy as np
+
+from compression import compress
+from polyline import (
+    METERS_PER_DEGREE, compact_path, decode_polyline, encode_polyline, without_repeats, zoom_tolerance
+)
+
+ZOOMS = [8, 12, 14, 16, 18]
+
+
+def make_road(km, legs, seed=5, step_m=30):
+    # A random walk of the heading with long straight stretches, from Paris towards the south east
+    rng = random.Random(seed)
+    lat, lon, heading = 48.8566, 2.3522, 150.0
+    points = [[round(lon, 5), round(lat, 5)]]
+    steps = int(km * 1000 / step_m)
+    turn = 0.0
+    for _ in range(steps):
+        if rng.random() < 0.02:
+            turn = rng.choice([0.0, 0.0, rng.uniform(-6, 6), rng.uniform(-25, 25)])
+        heading += turn + rng.gauss(0, 0.5)
+        heading += (150.0 - heading) * 0.01
+        lat += step_m * cos(radians(heading)) / METERS_PER_DEGREE
+        lon += step_m * sin(radians(heading)) / METERS_PER_DEGREE / cos(radians(lat))
+        points.append([round(lon, 5), round(lat, 5)])
+    # Every leg ends with the point the next one starts with
+    joins = sorted(rng.sample(range(1, len(points) - 1), legs - 1))
+    for join in reversed(joins):
+        points.insert(join, list(points[join]))
+    return points
+
+
+def max_deviation_m(path, simplified):
+    # Largest distance in meters from a point of the full path to the simplified path
+    points = np.asarray(path, dtype=float)
+    kept = np.asarray(simplified, dtype=float)
+    scale = cos(radians(float(points[:, 1].mean())))
+    x, y = points[:, 0] * scale, points[:, 1]
+    sx, sy = kept[:, 0] * scale, kept[:, 1]
+    best = np.full(len(points), np.inf)
+    for i in range(len(kept) - 1):
+        dx, dy = sx[i + 1] - sx[i], sy[i + 1] - sy[i]
+        length_sq = dx * dx + dy * dy or 1.0
+        t = np.clip(((x - sx[i]) * dx + (y - sy[i]) * dy) / length_sq, 0, 1)
+        best = np.minimum(best, np.hypot(x - sx[i] - t * dx, y - sy[i] - t * dy))
+    return float(best.max()) * METERS_PER_DEGREE
+
+
+def sizes(body):
+    return len(body), len(compress(body, "gzip")), len(compress(body, "br"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--km", type=float, default=800)
+    parser.add_argument("--legs", type=int, default=15)
+    args = parser.parse_args()
+
+    path = make_road(args.km, args.legs)
+    deduped = without_repeats(path)
+    assert decode_polyline(encode_polyline(deduped)) == deduped, "the polyline round trip changed the path"
+
+    full = json.dumps({"path": path}).encode()
+    print(f"{len(path)} points over {args.km:.0f} km, {len(path) - len(deduped)} repeated at the leg joins\n")
+    print(f"{'format':<22}{'points':>8}{'bytes':>10}{'gzip':>9}{'br':>9}{'smaller':>9}{'max error':>11}"
+          f"{'half px':>9}{'time':>9}")
+    full_sizes = sizes(full)
+    print(f"{'[lon, lat] pairs':<22}{len(path):>8}{full_sizes[0]:>10}{full_sizes[1]:>9}{full_sizes[2]:>9}")
+    deduped_sizes = sizes(json.dumps({"path": deduped}).encode())
+    print(f"{'pairs without repeats':<22}{len(deduped):>8}{deduped_sizes[0]:>10}{deduped_sizes[1]:>9}"
+          f"{deduped_sizes[2]:>9}{len(full) / deduped_sizes[0]:>8.1f}x")
+    latitude = max(abs(lat) for _, lat in deduped)
+    for zoom in ZOOMS:
+        started = time.perf_counter()
+        encoded = compact_path(deduped, zoom)
+        elapsed = time.perf_counter() - started
+        simplified = decode_polyline(encoded)
+        body = json.dumps({"polyline": encoded}).encode()
+        raw, gzipped, brotlied = sizes(body)
+        half_pixel = zoom_tolerance(zoom, latitude) * METERS_PER_DEGREE
+        print(f"{'polyline zoom ' + str(zoom):<22}{len(simplified):>8}{raw:>10}{gzipped:>9}{brotlied:>9}"
+              f"{len(full) / raw:>8.1f}x{max_deviation_m(deduped, simplified):>9.2f} m{half_pixel:>7.2f} m"
+              f"{elapsed * 1000:>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Scaling benchmark of filter_pois_by_min_distance: the original nested loop, the vectorized NumPy scan
+# over the accepted POIs, and the spatial grid now used by scenic.py. All three must keep the same POIs.
+#
+#   python -m benchmarks.bench_min_distance [--sizes 1000 5000 10000 20000 50000]
+import argparse
+import contextlib
+import io
+import random
+import time
+
+import numpy as np
+
+import geo
+import scenic
+
+# The nested loop gets really slow, we only run it up to this size
+NESTED_LIMIT = 10000
+
+
+def dense_pois(count, seed=11):
+    # Mostly clustered around a few towns, like churches and memorials in a dense heritage region
+    rng = random.Random(seed)
+    towns = [(rng.uniform(44, 48), rng.uniform(2, 6)) for _ in range(40)]
+    pois = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            lat, lon = rng.choice(towns)
+            lat, lon = rng.gauss(lat, 0.15), rng.gauss(lon, 0.2)
+        else:
+            lat, lon = rng.uniform(43, 49), rng.uniform(2, 6)
+        pois.append({"lat": lat, "lon": lon, "is_notable": rng.random() < 0.6})
+    return pois
+
+
+def nested_loop(pois, min_distance_km=5):
+    sorted_pois = sorted(pois, key=lambda x: x.get('is_notable', False), reverse=True)
+    filtered = [sorted_pois[0]]
+    for poi in sorted_pois[1:]:
+        if not any(scenic.are_pois_too_close(poi, selected, min_distance_km) for selected in filtered):
+            filtered.append(poi)
+    return filtered
+
+
+def numpy_scan(pois, min_distance_km=5):
+    sorted_pois = sorted(pois, key=lambda x: x.get('is_notable', False), reverse=True)
+    lats, lons = geo.coordinates(sorted_pois)
+    selected_lats = np.empty(len(sorted_pois))
+    selected_lons = np.empty(len(sorted_pois))
+    selected_lats[0], selected_lons[0] = lats[0], lons[0]
+    filtered = [sorted_pois[0]]
+    for i in range(1, len(sorted_pois)):
+        count = len(filtered)
+        distances = geo.one_to_many(sorted_pois[i], selected_lats[:count], selected_lons[:count])
+        if not (distances < min_distance_km).any():
+            filtered.append(sorted_pois[i])
+            selected_lats[count], selected_lons[count] = lats[i], lons[i]
+    return filtered
+
+
+def timed(fn, pois):
+    started = time.perf_counter()
+    result = fn(pois)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 20000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'n':>7}{'kept':>7}{'nested loop':>14}{'numpy scan':>13}{'grid':>11}")
+    for n in args.sizes:
+        pois = dense_pois(n)
+        with contextlib.redirect_stdout(io.StringIO()):
+            grid_time, kept = timed(scenic.filter_pois_by_min_distance, pois)
+        numpy_time, expected = timed(numpy_scan, pois)
+        assert kept == expected
+        nested = "-"
+        if n <= NESTED_LIMIT:
+            nested_time, expected = timed(nested_loop, pois)
+            assert kept == expected
+            nested = f"{nested_time * 1000:.0f}ms"
+        print(f"{n:>7}{len(kept):>7}{nested:>14}{numpy_time * 1000:>11.0f}ms{grid_time * 1000:>9.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
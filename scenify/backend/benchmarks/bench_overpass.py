@@ -0,0 +1,57 @@
+# Compares the wall-clock time of one big Overpass query over the whole search area with the tiled,
+# parallel fetch in overpass.fetch_catalog, against the local stub server.
+#
+#   python -m benchmarks.bench_overpass [--elements 20000] [--latency-per-sq-degree 0.02]
+import argparse
+import contextlib
+import io
+import time
+
+import overpass
+import pois
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from catalog import catalog_size, classify_element
+
+TRIPS = [
+    ("short (Vienna -> Bratislava)", {"lat": 48.2082, "lon": 16.3738}, {"lat": 48.1486, "lon": 17.1077}),
+    ("500 km (Paris -> Lyon)", {"lat": 48.8566, "lon": 2.3522}, {"lat": 45.7640, "lon": 4.8357}),
+    ("1000 km (Hamburg -> Milan)", {"lat": 53.5511, "lon": 9.9937}, {"lat": 45.4642, "lon": 9.1900}),
+    ("1500 km diagonal (Lisbon -> Lyon)", {"lat": 38.7223, "lon": -9.1393}, {"lat": 45.7640, "lon": 4.8357}),
+]
+
+
+def timed(fn, *args):
+    # The fetch code prints progress, we keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=20000)
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--latency-per-sq-degree", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with StubOverpass(make_elements(args.elements), args.base_latency, args.latency_per_sq_degree) as stub:
+        overpass.OVERPASS_API_URL = stub.url
+        print(f"{'trip':<36}{'single query':>14}{'tiled cold':>12}{'tiled warm':>12}{'elements':>10}")
+        for name, start, end in TRIPS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                bbox = pois.search_area(start, end)
+            single_time, single = timed(overpass.query_overpass, *bbox)
+            overpass.tile_cache.clear()
+            cold_time, tiled = timed(overpass.fetch_catalog, *bbox)
+            warm_time, _ = timed(overpass.fetch_catalog, *bbox)
+            inside = [
+                el for el in single
+                if bbox[0] <= el['lat'] <= bbox[2] and bbox[1] <= el['lon'] <= bbox[3] and classify_element(el)
+            ]
+            assert len(inside) == catalog_size(tiled), (len(inside), catalog_size(tiled))
+            print(f"{name:<36}{single_time:>13.2f}s{cold_time:>11.2f}s{warm_time:>11.3f}s{catalog_size(tiled):>10}")
+
+
+if __name__ == '__main__':
+    main()
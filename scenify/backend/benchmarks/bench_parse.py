@@ -0,0 +1,141 @@
+# Parse time and peak memory of an Overpass answer: loading it whole with json.loads (what response.json()
+# did) against the streaming ElementParser, on an answer with the skeleton nodes of the old query
+# (">; out skel qt;") and on one without. Every run is a child process reading the answer from a file, its
+# peak RSS is the VmHWM of the child (Linux). Also compares the memory of the POI records with the dicts
+# the POIs used to be.
+#
+#   python -m benchmarks.bench_parse [--pois 50000] [--ways 5000] [--response recorded.json]
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.stub_overpass import make_elements
+from pois import Poi, pois_from_elements
+
+CHILD_SCRIPT = """
+import json, sys, time
+import overpass
+
+def rss(field):
+    with open("/proc/self/status") as f:
+        return int(next(line.split()[1] for line in f if line.startswith(field + ":")))
+
+mode, path = sys.argv[1], sys.argv[2]
+baseline = rss("VmRSS")
+started = time.perf_counter()
+if mode == "json.loads":
+    with open(path, "rb") as f:
+        elements = json.loads(f.read()).get("elements", [])
+    elements = [el for el in elements if overpass.is_poi_element(el)]
+else:
+    with open(path, "rb") as f:
+        elements = overpass.parse_elements(iter(lambda: f.read(overpass.RESPONSE_CHUNK_SIZE), b""))
+elapsed = time.perf_counter() - started
+print(elapsed, rss("VmHWM") - baseline, len(elements))
+"""
+
+
+def write_answer(path, elements, ways, skeleton, seed=11):
+    # Pretty-printed like the real Overpass JSON output. Every way is a park with 20 to 200 nodes, the old
+    # query also returned all of those nodes without tags.
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n  "version": 0.6,\n  "generator": "Overpass API 0.7.62",\n'
+                '  "osm3s": {\n    "timestamp_osm_base": "2024-05-01T00:00:00Z"\n  },\n  "elements": [\n')
+        items = []
+        for el in elements:
+            items.append(json.dumps(el, indent=2, ensure_ascii=False))
+        next_node = len(elements) + 1
+        members = []
+        for i in range(ways):
+            count = rng.randint(20, 200)
+            nodes = list(range(next_node, next_node + count))
+            next_node += count
+            items.append(json.dumps({
+                "type": "way", "id": i + 1, "nodes": nodes,
+                "tags": {"name": f"Park {i}", "leisure": "park", "wikipedia": f"en:Park_{i}"}
+            }, indent=2))
+            lat, lon = rng.uniform(35, 60), rng.uniform(-10, 30)
+            members.extend((node, lat + rng.uniform(-0.01, 0.01), lon + rng.uniform(-0.01, 0.01)) for node in nodes)
+        if skeleton:
+            items.extend(
+                json.dumps({"type": "node", "id": node, "lat": round(lat, 7), "lon": round(lon, 7)}, indent=2)
+                for node, lat, lon in members
+            )
+        f.write(",\n".join(items))
+        f.write('\n  ]\n}\n')
+
+
+def run_child(mode, path):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, mode, path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    elapsed, peak_kb, kept = result.stdout.split()[-3:]
+    return float(elapsed), int(peak_kb) / 1024, int(kept)
+
+
+SUBTYPE_NAMES = [
+    ('historic', 'Castle'), ('historic', 'Church'), ('historic', 'Monument'), ('historic', 'Ruins'),
+    ('natural', 'Peak'), ('leisure', 'Park'), ('tourism', 'Museum'), ('tourism', 'Viewpoint')
+]
+
+
+def record_memory(elements):
+    # Bytes per POI of the records and of the dicts they replace
+    start, end = {"lat": 35.0, "lon": -10.0}, {"lat": 60.0, "lon": 30.0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        records = pois_from_elements(elements, start, end, [{"type": t, "subtype": s} for t, s in SUBTYPE_NAMES])
+    copies = [
+        lambda: [poi.as_dict() for poi in records],
+        lambda: [Poi(*(getattr(poi, field) for field in Poi.__slots__)) for poi in records]
+    ]
+    sizes = []
+    for build in copies:
+        tracemalloc.start()
+        built = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sizes.append(size / max(1, len(built)))
+    return len(records), sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pois", type=int, default=50000)
+    parser.add_argument("--ways", type=int, default=5000)
+    parser.add_argument("--response", help="a recorded Overpass answer to parse instead of the synthetic ones")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.response:
+            answers = [("recorded", args.response)]
+        else:
+            elements = make_elements(args.pois)
+            answers = []
+            for name, skeleton in [("with skeleton", True), ("without skeleton", False)]:
+                path = os.path.join(tmp, f"{name}.json")
+                write_answer(path, elements, args.ways, skeleton)
+                answers.append((name, path))
+
+        print(f"{'answer':<18}{'MB':>7}{'parser':>12}{'time':>8}{'peak RSS':>10}{'kept':>8}")
+        for name, path in answers:
+            for mode in ["json.loads", "stream"]:
+                elapsed, peak, kept = run_child(mode, path)
+                print(f"{name:<18}{os.path.getsize(path) / 1e6:>7.1f}{mode:>12}{elapsed:>7.2f}s{peak:>8.1f}MB"
+                      f"{kept:>8}")
+
+    if not args.response:
+        count, (dict_size, record_size) = record_memory(make_elements(args.pois))
+        print(f"\n{count} POIs: {dict_size:.0f} bytes per POI dict, {record_size:.0f} per record")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Imports a synthetic OSM extract into the local POI store and compares the store with the (stub) Overpass
+# fetch: the import time and peak memory for growing extracts, the query time for a few trips, and whether
+# both give the same POIs. The extract mixes the POIs with untagged nodes, other tagged nodes and ways,
+# like a real one.
+#
+#   python -m benchmarks.bench_poi_store [--pois 20000] [--noise 10]
+import argparse
+import contextlib
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import quoteattr
+
+import overpass
+import pois
+from benchmarks.bench_overpass import TRIPS
+from benchmarks.load_routes import CATEGORIES
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from catalog import catalog_size
+from poi_store import PoiStore
+
+# Run in a child process, so the peak memory is the one of the import alone. ru_maxrss would keep the peak
+# of the benchmark process across the exec, VmHWM (Linux) starts over.
+IMPORT_SCRIPT = """
+import sys
+import import_osm
+import_osm.import_extract(sys.argv[1], sys.argv[2])
+with open("/proc/self/status") as f:
+    print(next(line.split()[1] for line in f if line.startswith("VmHWM:")))
+"""
+
+
+def write_tags(f, tags):
+    for key, value in tags.items():
+        f.write(f'    <tag k={quoteattr(key)} v={quoteattr(value)}/>\n')
+
+
+def write_extract(path, elements, noise, seed=7):
+    # Every POI comes with `noise` other nodes: mostly untagged, some shops and some castles without a
+    # wikipedia tag, which the import drops. Every tenth POI also gets a way with the same tags.
+    rng = random.Random(seed)
+    next_id = max(el['id'] for el in elements) + 1
+    ways = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="bench_poi_store">\n')
+        for el in elements:
+            f.write(f'  <node id="{el["id"]}" lat="{el["lat"]:.7f}" lon="{el["lon"]:.7f}">\n')
+            write_tags(f, el['tags'])
+            f.write('  </node>\n')
+            for _ in range(noise):
+                lat, lon = el['lat'] + rng.uniform(-0.05, 0.05), el['lon'] + rng.uniform(-0.05, 0.05)
+                kind = rng.random()
+                if kind < 0.8:
+                    f.write(f'  <node id="{next_id}" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+                else:
+                    tags = {"name": f"Shop {next_id}", "shop": "bakery"} if kind < 0.95 else \
+                        {"name": f"Castle {next_id}", "historic": "castle"}
+                    f.write(f'  <node id="{next_id}" lat="{lat:.7f}" lon="{lon:.7f}">\n')
+                    write_tags(f, tags)
+                    f.write('  </node>\n')
+                next_id += 1
+            if el['id'] % 10 == 0:
+                ways.append((next_id - 2, next_id - 1, el['tags']))
+        for i, (first, second, tags) in enumerate(ways):
+            f.write(f'  <way id="{i + 1}">\n    <nd ref="{first}"/>\n    <nd ref="{second}"/>\n')
+            write_tags(f, tags)
+            f.write('  </way>\n')
+        f.write('</osm>\n')
+    return next_id - 1 + len(ways)
+
+
+def run_import(extract, store):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, extract, store],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    return time.perf_counter() - started, int(result.stdout.split()[-1])
+
+
+def timed(fn, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def osm_elements(count):
+    # OSM keeps 7 decimals for the coordinates
+    elements = make_elements(count, 35, -10, 60, 30)
+    for el in elements:
+        el['lat'], el['lon'] = round(el['lat'], 7), round(el['lon'], 7)
+    return elements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pois", type=int, default=20000)
+    parser.add_argument("--noise", type=int, default=10, help="other OSM elements per POI in the extract")
+    parser.add_argument("--queries", type=int, default=20, help="store queries per trip")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'extract':>12}{'elements':>11}{'MB':>8}{'import':>9}{'peak RSS':>10}{'store MB':>10}")
+        for scale in [1, 4]:
+            elements = osm_elements(args.pois * scale)
+            extract = os.path.join(tmp, f"extract-{scale}.osm")
+            store = os.path.join(tmp, f"pois-{scale}.sqlite")
+            written = write_extract(extract, elements, args.noise)
+            import_time, peak_kb = run_import(extract, store)
+            print(f"{f'{scale}x':>12}{written:>11}{os.path.getsize(extract) / 1e6:>8.1f}{import_time:>8.2f}s"
+                  f"{peak_kb / 1024:>8.1f}MB{os.path.getsize(store) / 1e6:>10.1f}")
+
+        # The stub Overpass serves the same POIs as the first extract, we compare the POIs of all the categories
+        elements = osm_elements(args.pois)
+        store = PoiStore(os.path.join(tmp, "pois-1.sqlite"))
+        print()
+        print(f"{'trip':<36}{'Overpass (stub)':>16}{'store':>10}{'elements':>10}{'same POIs':>11}")
+        with StubOverpass(elements) as stub:
+            overpass.OVERPASS_API_URL = stub.url
+            for name, start, end in TRIPS:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    bbox = pois.search_area(start, end)
+                overpass.tile_cache.clear()
+                pois.poi_store = None
+                overpass_time, from_overpass = timed(pois.fetch_all_pois, start, end, CATEGORIES)
+                pois.poi_store = store
+                _, from_store = timed(pois.fetch_all_pois, start, end, CATEGORIES)
+                query_times = [timed(store.query, *bbox)[0] for _ in range(args.queries)]
+                same = [poi.as_dict() for poi in from_overpass] == [poi.as_dict() for poi in from_store]
+                print(f"{name:<36}{overpass_time * 1000:>14.0f}ms{min(query_times) * 1000:>8.1f}ms"
+                      f"{catalog_size(store.query(*bbox)):>10}{str(same):>11}")
+                assert same
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Compares the POI selection of solve_scenic_route: the old greedy that always appends the POI before the end
+# (in its original scalar form and in its vectorized form), and the cheapest insertion now used by scenic.py.
+# Reports the number of selected POIs and the runtime.
+#
+#   python -m benchmarks.bench_selection [--recorded trip.json ...]
+#
+# A recorded trip is a JSON file {"start": {...}, "end": {...}, "pois": [...]} with the POIs as returned by
+# fetch_all_pois. Without recorded trips we use generated ones.
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+
+import numpy as np
+
+import geo
+import scenic
+
+DETOURS = [(1.5, 7), (2.0, 15)]
+
+
+def generated_trips():
+    rng = random.Random(5)
+    trips = []
+    for name, start, end, count in [
+        ("Paris -> Lyon", {"lat": 48.8566, "lon": 2.3522}, {"lat": 45.7640, "lon": 4.8357}, 800),
+        ("Hamburg -> Milan", {"lat": 53.5511, "lon": 9.9937}, {"lat": 45.4642, "lon": 9.1900}, 3000),
+        ("Lisbon -> Lyon", {"lat": 38.7223, "lon": -9.1393}, {"lat": 45.7640, "lon": 4.8357}, 6000),
+    ]:
+        pois = []
+        for i in range(count):
+            t = rng.random()
+            lat = start["lat"] + t * (end["lat"] - start["lat"]) + rng.gauss(0, 0.8)
+            lon = start["lon"] + t * (end["lon"] - start["lon"]) + rng.gauss(0, 0.8)
+            tags = {"heritage": "1"} if rng.random() < 0.02 else {}
+            pois.append({"name": f"POI {i}", "lat": lat, "lon": lon, "is_notable": rng.random() < 0.7, "tags": tags})
+        trips.append((name, start, end, pois))
+    return trips
+
+
+def scalar_append_greedy(start, end, sorted_pois, lats, lons, max_total_distance, max_pois):
+    # The original loop, re-summing the whole path for every candidate
+    selected = []
+    current_distance = scenic.calculate_distance(start, end)
+    for poi in sorted_pois:
+        if len(selected) >= max_pois:
+            break
+        route_with_poi = [start] + selected + [poi] + [end]
+        new_distance = 0
+        for i in range(len(route_with_poi) - 1):
+            new_distance += scenic.calculate_distance(route_with_poi[i], route_with_poi[i + 1])
+        if new_distance <= max_total_distance:
+            selected.append(poi)
+            current_distance = new_distance
+    return selected, current_distance
+
+
+def append_greedy(start, end, sorted_pois, lats, lons, max_total_distance, max_pois):
+    # The selection used before: a POI is only ever added between the last selected POI and the end
+    selected = []
+    current_distance = scenic.calculate_distance(start, end)
+    to_end = geo.one_to_many(end, lats, lons)
+    path_so_far = 0
+    last_point = start
+    position = 0
+    while position < len(sorted_pois) and len(selected) < max_pois:
+        to_candidate = geo.one_to_many(last_point, lats[position:], lons[position:])
+        new_distances = path_so_far + to_candidate + to_end[position:]
+        fitting = np.flatnonzero(new_distances <= max_total_distance)
+        if not len(fitting):
+            break
+        first = fitting[0]
+        selected.append(sorted_pois[position + first])
+        current_distance = float(new_distances[first])
+        path_so_far += float(to_candidate[first])
+        last_point = selected[-1]
+        position += first + 1
+    return selected, current_distance
+
+
+def sorted_candidates(start, end, pois):
+    # The same filtering and scoring solve_scenic_route does before selecting
+    with contextlib.redirect_stdout(io.StringIO()):
+        pois = scenic.filter_pois_by_min_distance(pois, min_distance_km=5)
+    lats, lons, base_scores = scenic.poi_arrays(pois)
+    order = np.argsort(-(base_scores - geo.distances_to_line(start, end, lats, lons)), kind='stable')
+    return [pois[i] for i in order], lats[order], lons[order]
+
+
+def timed(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recorded", nargs="*", default=[])
+    args = parser.parse_args()
+
+    trips = []
+    for path in args.recorded:
+        with open(path) as f:
+            trip = json.load(f)
+        trips.append((path, trip["start"], trip["end"], trip["pois"]))
+    trips = trips or generated_trips()
+
+    print(f"{'trip':<22}{'detour':>7}{'candidates':>11}{'append POIs':>13}{'insert POIs':>13}"
+          f"{'scalar append':>15}{'numpy append':>14}{'insert':>11}")
+    for name, start, end, pois in trips:
+        sorted_pois, lats, lons = sorted_candidates(start, end, pois)
+        for detour, max_pois in DETOURS:
+            max_total = scenic.calculate_distance(start, end) * detour
+            args_ = (start, end, sorted_pois, lats, lons, max_total, max_pois)
+            scalar_time, (expected, _) = timed(scalar_append_greedy, *args_, repeat=1)
+            append_time, (appended, _) = timed(append_greedy, *args_)
+            assert appended == expected
+            insert_time, (inserted, length) = timed(
+                scenic.select_pois_by_insertion, start, end, lats, lons, max_total, max_pois)
+            inserted = [sorted_pois[i] for i in inserted]
+            assert geo.path_length(*geo.coordinates([start] + inserted + [end])) <= max_total + 1e-6
+            assert abs(length - geo.path_length(*geo.coordinates([start] + inserted + [end]))) < 1e-6
+            print(f"{name:<22}{detour:>7}{len(sorted_pois):>11}{len(appended):>13}{len(inserted):>13}"
+                  f"{scalar_time * 1000:>13.2f}ms{append_time * 1000:>12.2f}ms{insert_time * 1000:>9.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
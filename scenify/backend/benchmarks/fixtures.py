@@ -0,0 +1,218 @@
+# Recorded upstream answers for the benchmark suite (benchmarks/suite.py), one file per trip in
+# benchmarks/fixtures/<trip>.json.gz:
+#   {"trip", "source", "recorded_at", "upstreams": {"geocode", "overpass", "osrm": URL recorded from},
+#    "geocode": {query: Nominatim answer},
+#    "overpass_elements": [every element Overpass sent with coordinates], "osrm": {path?query: OSRM answer}}
+#
+# A fixture is recorded once against the real servers (python -m benchmarks.suite record) through
+# RecordingProxy, then replayed by local stub servers. Overpass is replayed by StubOverpass from the recorded
+# elements, so it answers any tile layout; Nominatim and OSRM answer the recorded requests, and OSRM falls
+# back to a straight line for routes through other points (after a change of the POI selection), which is
+# counted as a miss. A trip without a recorded fixture gets a synthetic one, seeded so every run is the same.
+# No recorded fixtures are part of the repository for now, every trip runs on its synthetic fixture until one
+# is recorded. `upstreams` says which servers a fixture was recorded from (the record command follows
+# SCENIFY_*_URL).
+import datetime
+import gzip
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from benchmarks.stub_overpass import make_elements
+from benchmarks.stub_upstreams import StubServer, StubOSRM
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CATEGORIES = [
+    {"type": "historic", "subtype": "castle"}, {"type": "historic", "subtype": "church"},
+    {"type": "historic", "subtype": "monument"}, {"type": "historic", "subtype": "ruins"},
+    {"type": "tourism", "subtype": "museum"}, {"type": "tourism", "subtype": "viewpoint"},
+    {"type": "natural", "subtype": "peak"}
+]
+
+# The coordinates are only used for the synthetic fixtures, a recording geocodes the names. A synthetic fixture
+# has `density` POIs per square degree, `heritage_share` of them UNESCO sites, over the bounding box of the
+# trip grown by `padding` degrees (enough for the widest search corridor of the trip). The pipeline never picks
+# POIs within 30 km of either end, so the short urban trip (`search_only`) times geocoding and the search in a
+# dense city but selects nothing; the other trips are long enough for POIs to be selected and ordered, so
+# `compare` also sees the select_pois and tsp stages.
+TRIPS = [
+    {"name": "short_urban", "start": "Paris", "end": "Versailles",
+     "start_coords": (48.8566, 2.3522), "end_coords": (48.8049, 2.1204),
+     "density": 5000, "heritage_share": 0.02, "padding": 1.0, "search_only": True},
+    {"name": "short_regional", "start": "Paris", "end": "Reims",
+     "start_coords": (48.8566, 2.3522), "end_coords": (49.2583, 4.0317),
+     "density": 2000, "heritage_share": 0.02, "padding": 1.0},
+    {"name": "500km", "start": "Paris", "end": "Bordeaux",
+     "start_coords": (48.8566, 2.3522), "end_coords": (44.8378, -0.5792),
+     "density": 400, "heritage_share": 0.02, "padding": 2.0},
+    {"name": "1500km_diagonal", "start": "Hamburg", "end": "Barcelona",
+     "start_coords": (53.5511, 9.9937), "end_coords": (41.3874, 2.1686),
+     "density": 400, "heritage_share": 0.02, "padding": 3.0},
+    {"name": "dense_heritage", "start": "Florence", "end": "Rome",
+     "start_coords": (43.7696, 11.2558), "end_coords": (41.9028, 12.4964),
+     "density": 2500, "heritage_share": 0.1, "padding": 1.5},
+]
+for trip in TRIPS:
+    trip.setdefault("categories", CATEGORIES)
+    trip.setdefault("poi_count", 10)
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURES_DIR, f"{name}.json.gz")
+
+
+def load_fixture(trip):
+    # The recorded fixture of the trip, or a synthetic one when none was recorded
+    path = fixture_path(trip["name"])
+    if os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    return synthetic_fixture(trip)
+
+
+def save_fixture(fixture):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with gzip.open(fixture_path(fixture["trip"]), 'wt', encoding='utf-8') as f:
+        json.dump(fixture, f, separators=(',', ':'))
+
+
+def synthetic_fixture(trip):
+    # The stub elements spread over the trip's bounding box with some padding, no recorded OSRM routes
+    (start_lat, start_lon), (end_lat, end_lon) = trip["start_coords"], trip["end_coords"]
+    padding = trip["padding"]
+    min_lat, max_lat = min(start_lat, end_lat) - padding, max(start_lat, end_lat) + padding
+    min_lon, max_lon = min(start_lon, end_lon) - padding, max(start_lon, end_lon) + padding
+    count = int(trip["density"] * (max_lat - min_lat) * (max_lon - min_lon))
+    elements = make_elements(count, min_lat, min_lon, max_lat, max_lon, seed=len(trip["name"]))
+    rng = random.Random(7)
+    for el in elements:
+        el["lat"], el["lon"] = round(el["lat"], 7), round(el["lon"], 7)
+        if rng.random() < trip["heritage_share"]:
+            el["tags"]["heritage"] = "1"
+    return {
+        "trip": trip["name"],
+        "source": "synthetic",
+        "geocode": {
+            trip["start"]: [{"lat": str(start_lat), "lon": str(start_lon)}],
+            trip["end"]: [{"lat": str(end_lat), "lon": str(end_lon)}]
+        },
+        "overpass_elements": elements,
+        "osrm": {}
+    }
+
+
+class ReplayNominatim(StubServer):
+
+    def __init__(self, answers, latency=0.05, port=0):
+        super().__init__(latency, "/search", port)
+        self.answers = answers
+        self.misses = 0
+
+    def respond(self, path, query):
+        place = query.get('q', [''])[0]
+        if place not in self.answers:
+            self.misses += 1
+            return 200, []
+        return 200, self.answers[place]
+
+
+class ReplayOSRM(StubOSRM):
+
+    def __init__(self, answers, latency=0.05, port=0):
+        super().__init__(latency, port)
+        self.answers = answers
+        self.misses = 0
+
+    def respond(self, path, query):
+        key = osrm_key(path, query)
+        if key in self.answers:
+            return 200, self.answers[key]
+        if self.answers:
+            self.misses += 1
+        return super().respond(path, query)
+
+
+def osrm_key(path, query):
+    return path + "?" + "&".join(f"{name}={values[0]}" for name, values in sorted(query.items()))
+
+
+class RecordingProxy:
+    # Forwards every request to the real server at `target` and keeps what it answered. POST requests are
+    # Overpass queries, we keep the elements; GET requests are Nominatim or OSRM, we keep the answers.
+
+    def __init__(self, target, headers=None):
+        self.target = target
+        self.headers = headers or {}
+        self.elements = {}
+        self.answers = {}
+        self.lock = threading.Lock()
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                response = requests.get(
+                    proxy.target + url.path.replace(proxy.path_prefix, "", 1),
+                    params=url.query, headers=proxy.headers, timeout=120)
+                if response.status_code == 200:
+                    query = parse_qs(url.query)
+                    key = query['q'][0] if 'q' in query else osrm_key(url.path, query)
+                    with proxy.lock:
+                        proxy.answers[key] = response.json()
+                self.reply(response)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                response = requests.post(
+                    proxy.target, data=body, headers={'Content-Type': self.headers.get('Content-Type')},
+                    timeout=600)
+                if response.status_code == 200:
+                    with proxy.lock:
+                        for el in response.json().get('elements', []):
+                            # Ways and relations come without coordinates, the pipeline skips them
+                            if 'lat' in el:
+                                proxy.elements[(el['type'], el['id'])] = el
+                self.reply(response)
+
+            def reply(self, response):
+                self.send_response(response.status_code)
+                self.send_header('Content-Type', response.headers.get('Content-Type', 'application/json'))
+                self.send_header('Content-Length', str(len(response.content)))
+                self.end_headers()
+                self.wfile.write(response.content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        # The path of the target (e.g. /search) is kept, so the proxy URL ends the same way
+        self.path_prefix = urlsplit(target).path
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}{self.path_prefix}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def recorded_fixture(trip, geocoder, overpass, router):
+    return {
+        "trip": trip["name"],
+        "source": "recorded",
+        "recorded_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "upstreams": {"geocode": geocoder.target, "overpass": overpass.target, "osrm": router.target},
+        "geocode": geocoder.answers,
+        "overpass_elements": sorted(overpass.elements.values(), key=lambda el: (el['type'], el['id'])),
+        "osrm": router.answers
+    }
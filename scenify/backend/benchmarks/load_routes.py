@@ -0,0 +1,184 @@
+# Load test of /api/routes against local stub upstreams: the Flask app on a fixed number of worker threads
+# (like a sync gunicorn deployment) against the ASGI app in asgi.py on a single event loop.
+# Part of the requests are popular trips whose tiles are already cached, the others are new trips that wait
+# for Overpass. Before each server is tested the caches are cleared and the popular trips are planned once.
+#
+#   python -m benchmarks.load_routes [--requests 64] [--concurrency 16] [--workers 4] [--cached-share 0.5]
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+import app
+import asgi
+import geocoding
+import overpass
+import pipeline
+import routing
+from benchmarks.stub_overpass import StubOverpass, make_elements
+from benchmarks.stub_upstreams import StubNominatim, StubOSRM
+
+CATEGORIES = [
+    {"type": "historic", "subtype": "castle"}, {"type": "historic", "subtype": "church"},
+    {"type": "tourism", "subtype": "museum"}, {"type": "natural", "subtype": "peak"}
+]
+
+
+class BoundedWSGIServer(BaseWSGIServer):
+    # Handles requests on a fixed pool of threads, a request waits when all of them are busy
+
+    def __init__(self, host, port, wsgi_app, workers):
+        super().__init__(host, port, wsgi_app)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_in_thread, request, client_address)
+
+    def handle_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+@contextlib.contextmanager
+def flask_server(workers):
+    server = BoundedWSGIServer('127.0.0.1', 0, app.app, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.pool.shutdown()
+
+
+@contextlib.contextmanager
+def asgi_server():
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host='127.0.0.1', port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def random_trips(count, rng):
+    # Trips of 150 to 400 km inside France, geocoded by the stub from their "lat,lon" names
+    trips = []
+    for _ in range(count):
+        start = (rng.uniform(44, 49), rng.uniform(0, 6))
+        end = (start[0] + rng.choice([-1, 1]) * rng.uniform(1, 2.5), start[1] + rng.uniform(-2, 2))
+        trips.append((f"{start[0]:.4f},{start[1]:.4f}", f"{end[0]:.4f},{end[1]:.4f}"))
+    return trips
+
+
+def route_request(start, end, categories=CATEGORIES):
+    return {"startLocation": start, "endLocation": end, "poiCount": 10, "categories": categories}
+
+
+async def run_load(url, trips, concurrency, categories_by_kind={}):
+    # trips is a list of (kind, start, end), returns the total time and the latencies of every kind.
+    # The requests use CATEGORIES unless categories_by_kind has other ones for their kind.
+    latencies = {}
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=concurrency)) as client:
+
+        async def one(kind, start, end):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(f"{url}/api/routes", json=route_request(
+                    start, end, categories_by_kind.get(kind, CATEGORIES)))
+                latencies.setdefault(kind, []).append(time.perf_counter() - started)
+                if response.status_code != 200 or len(response.json()["scenic_routes"]) != 2:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(*trip) for trip in trips))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, failures
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def clear_caches():
+    geocoding.geocode_cache.clear()
+    overpass.tile_cache.clear()
+    routing.leg_cache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="worker threads of the Flask server")
+    parser.add_argument("--cached-share", type=float, default=0.5, help="share of requests for popular trips")
+    parser.add_argument("--overpass-workers", type=int, default=32,
+                        help="concurrent Overpass sub-queries, like against a self-hosted Overpass")
+    parser.add_argument("--overpass-latency", type=float, default=2.0)
+    parser.add_argument("--osrm-latency", type=float, default=0.1)
+    parser.add_argument("--geocode-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    overpass.OVERPASS_WORKERS = args.overpass_workers
+    overpass.overpass_pool = ThreadPoolExecutor(max_workers=args.overpass_workers)
+    overpass.overpass_api.set_slots(args.overpass_workers)
+    # The stub is not the public Nominatim, it takes more than a request per second
+    geocoding.nominatim.set_rate(0)
+
+    rng = random.Random(3)
+    popular = random_trips(4, rng)
+    cached_count = int(args.requests * args.cached_share)
+    trips = [("cached", *rng.choice(popular)) for _ in range(cached_count)]
+    trips += [("new", *trip) for trip in random_trips(args.requests - cached_count, rng)]
+    rng.shuffle(trips)
+
+    with StubOverpass(make_elements(20000, 40, -5, 52, 10), args.overpass_latency, 0.0) as stub_overpass, \
+            StubNominatim(args.geocode_latency) as stub_nominatim, StubOSRM(args.osrm_latency) as stub_osrm:
+        overpass.OVERPASS_API_URL = stub_overpass.url
+        geocoding.GEOCODING_API_URL = stub_nominatim.url
+        routing.OSRM_API_URL = stub_osrm.url
+
+        print(f"{args.requests} requests ({cached_count} for cached trips), {args.concurrency} at a time")
+        print(f"{'server':<22}{'requests/s':>11}{'cached p50':>12}{'cached p95':>12}"
+              f"{'new p50':>9}{'new p95':>9}{'failed':>8}")
+        for name, server in [
+            (f"Flask, {args.workers} threads", lambda: flask_server(args.workers)),
+            ("ASGI, 1 event loop", asgi_server),
+        ]:
+            clear_caches()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for start, end in popular:
+                    request = route_request(start, end)
+                    pipeline.plan_routes(start, end, request["poiCount"], request["categories"])
+                with server() as url:
+                    elapsed, latencies, failures = asyncio.run(run_load(url, trips, args.concurrency))
+            columns = "".join(
+                f"{percentile(latencies.get(kind, [0]), 0.5):>{width - 1}.2f}s"
+                f"{percentile(latencies.get(kind, [0]), 0.95):>{width - 1}.2f}s"
+                for kind, width in [("cached", 12), ("new", 9)]
+            )
+            print(f"{name:<22}{len(trips) / elapsed:>11.2f}{columns}{failures:>8}")
+
+
+if __name__ == '__main__':
+    main()
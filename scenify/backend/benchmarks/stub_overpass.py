@@ -0,0 +1,104 @@
+# A local stand-in for the Overpass API used by the benchmarks.
+# It answers the bounding box queries built by overpass.build_overpass_query with a fixed, seeded set of
+# elements and sleeps for a time that grows with the queried area, like the real server does.
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BBOX_PATTERN = re.compile(r'node\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)')
+
+SUBTYPES = [
+    ('historic', 'castle'), ('historic', 'church'), ('historic', 'monument'), ('historic', 'ruins'),
+    ('natural', 'peak'), ('leisure', 'park'), ('tourism', 'museum'), ('tourism', 'viewpoint')
+]
+
+
+def make_elements(count, min_lat=35.0, min_lon=-10.0, max_lat=60.0, max_lon=30.0, seed=42):
+    rng = random.Random(seed)
+    elements = []
+    for i in range(count):
+        key, value = rng.choice(SUBTYPES)
+        tags = {"name": f"POI {i}", key: value, "wikipedia": f"en:POI_{i}"}
+        if rng.random() < 0.02:
+            tags["heritage"] = "1"
+        elements.append({
+            "type": "node",
+            "id": i + 1,
+            "lat": rng.uniform(min_lat, max_lat),
+            "lon": rng.uniform(min_lon, max_lon),
+            "tags": tags
+        })
+    return elements
+
+
+class StubOverpass:
+    # latency = base_latency + latency_per_sq_degree * queried area, in seconds.
+    # With `slots` set, queries beyond that many running at once are rate limited with a 429, like the real server.
+
+    def __init__(self, elements, base_latency=0.05, latency_per_sq_degree=0.02, port=0, slots=None):
+        self.elements = elements
+        self.base_latency = base_latency
+        self.latency_per_sq_degree = latency_per_sq_degree
+        self.slots = slots
+        self.queries = 0
+        self.rate_limited = 0
+        self.running = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                query = parse_qs(self.rfile.read(length).decode()).get('data', [''])[0]
+                match = BBOX_PATTERN.search(query)
+                if not match:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                min_lat, min_lon, max_lat, max_lon = map(float, match.groups())
+                with stub.lock:
+                    stub.queries += 1
+                    if stub.slots is not None and stub.running >= stub.slots:
+                        stub.rate_limited += 1
+                        self.send_response(429)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    stub.running += 1
+                try:
+                    area = (max_lat - min_lat) * (max_lon - min_lon)
+                    time.sleep(stub.base_latency + stub.latency_per_sq_degree * area)
+                finally:
+                    with stub.lock:
+                        stub.running -= 1
+                elements = [
+                    el for el in stub.elements
+                    if min_lat <= el['lat'] <= max_lat and min_lon <= el['lon'] <= max_lon
+                ]
+                body = json.dumps({"elements": elements}).encode()
+                with stub.lock:
+                    stub.bytes_sent += len(body)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/interpreter"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
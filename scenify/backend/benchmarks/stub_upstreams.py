@@ -0,0 +1,97 @@
+# Local stand-ins for Nominatim and OSRM used by the benchmarks, next to the Overpass one in stub_overpass.py.
+# The geocoder understands queries written as "lat,lon" and the router answers with a straight line through
+# the waypoints. Both sleep for a fixed latency like a remote server.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from geo import coordinates, haversine
+
+
+class StubServer:
+    # Serves respond(path, query) -> (status, payload) as JSON after `latency` seconds
+
+    def __init__(self, latency, url_path, port=0):
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real servers
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                stub.requests += 1
+                time.sleep(stub.latency)
+                status, payload = stub.respond(url.path, parse_qs(url.query))
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}{url_path}"
+
+    def respond(self, path, query):
+        raise NotImplementedError
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubNominatim(StubServer):
+
+    def __init__(self, latency=0.05, port=0):
+        super().__init__(latency, "/search", port)
+
+    def respond(self, path, query):
+        try:
+            lat, lon = (float(value) for value in query['q'][0].split(','))
+        except (KeyError, ValueError):
+            return 200, []
+        return 200, [{"lat": str(lat), "lon": str(lon)}]
+
+
+class StubOSRM(StubServer):
+    # Roads are 1.2 times longer than the straight line
+
+    def __init__(self, latency=0.05, port=0):
+        super().__init__(latency, "", port)
+
+    def respond(self, path, query):
+        points = [
+            {"lon": float(lon), "lat": float(lat)}
+            for lon, lat in (pair.split(',') for pair in path.rsplit('/', 1)[1].split(';'))
+        ]
+        lats, lons = coordinates(points)
+        lengths = haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]) * 1200
+        geometry = []
+        for i in range(len(points) - 1):
+            # Ten points per leg, the last one is the next waypoint
+            geometry.extend(
+                [lons[i] + (lons[i + 1] - lons[i]) * step / 10, lats[i] + (lats[i + 1] - lats[i]) * step / 10]
+                for step in range(0 if i == 0 else 1, 11)
+            )
+        return 200, {
+            "code": "Ok",
+            "routes": [{
+                "geometry": {"type": "LineString", "coordinates": [[float(x), float(y)] for x, y in geometry]},
+                "distance": float(lengths.sum()),
+                "legs": [{"distance": float(length)} for length in lengths]
+            }],
+            "waypoints": [{"location": [point["lon"], point["lat"]]} for point in points]
+        }
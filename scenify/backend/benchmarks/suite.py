@@ -0,0 +1,291 @@
+# The offline benchmark suite: plans the representative trips of benchmarks/fixtures.py against stub servers
+# replaying recorded upstream answers, and times every stage of the pipeline with cold caches:
+#   geocode            geocode_location of both ends
+#   route_direct       the OSRM legs of the direct route (with SCENIFY_POI_SEARCH=corridor its road is the search area)
+#   fetch_pois         fetch_all_pois: the Overpass sub-queries, parsing and filtering
+#   filter_pois        fetch_all_pois again from the tile cache, only merging the tiles and filtering
+#   min_distance       filter_pois_by_min_distance
+#   select_pois        the POI selection of every scenic profile (order_scenic_route without the TSP)
+#   tsp                ordering the selected POIs (tsp.order_path)
+#   route_paths        the OSRM legs of the scenic routes and the response (route_with_paths)
+# Every stage runs --repeat times, the results are written as JSON to compare versions:
+#
+#   python -m benchmarks.suite record [--trips short_urban ...]      # once, against the real servers
+#   python -m benchmarks.suite run [--repeat 5] [--output results.json]
+#   python -m benchmarks.suite compare before.json after.json [--threshold 0.1]
+#
+# The latencies of the stubs are set with --geocode-latency, --osrm-latency, --overpass-latency and
+# --overpass-latency-per-sq-degree, 0 for all of them times only our own code.
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import geocoding
+import overpass
+import routing
+import scenic
+from benchmarks.fixtures import (
+    TRIPS, RecordingProxy, ReplayNominatim, ReplayOSRM, load_fixture, recorded_fixture, save_fixture
+)
+from benchmarks.stub_overpass import StubOverpass
+from corridor import CORRIDOR_SEARCH
+from pipeline import build_response, direct_path, profile_limits
+from pois import fetch_all_pois
+from scenic import filter_pois_by_min_distance, order_scenic_route
+from solver_pool import compact_problem
+
+STAGES = [
+    "geocode", "route_direct", "fetch_pois", "filter_pois", "min_distance", "select_pois", "tsp", "route_paths"
+]
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.times = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - started
+
+    def timed(self, name, fn):
+        # fn, adding the time of every call to the stage
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def clear_caches():
+    geocoding.geocode_cache.clear()
+    overpass.tile_cache.clear()
+    routing.leg_cache.clear()
+
+
+def plan_trip(trip, timer):
+    # The steps of pipeline.compute_routes one by one, in this process. Returns the response.
+    with timer.stage("geocode"):
+        start = geocoding.geocode_location(trip["start"])
+        end = geocoding.geocode_location(trip["end"])
+    if not start or not end:
+        raise RuntimeError(f"Could not geocode {trip['start']} -> {trip['end']}")
+    start["name"], end["name"] = trip["start"], trip["end"]
+
+    with timer.stage("route_direct"):
+        fastest_legs = routing.get_route_legs([start, end])
+    path = direct_path(fastest_legs)
+    with timer.stage("fetch_pois"):
+        fetch_all_pois(start, end, trip["categories"], path)
+    with timer.stage("filter_pois"):
+        pois = fetch_all_pois(start, end, trip["categories"], path)
+
+    scenic_routes = []
+    if pois:
+        with timer.stage("min_distance"):
+            filter_pois_by_min_distance(pois, min_distance_km=5)
+        pois, problem = compact_problem(start, end, pois)
+        # order_scenic_route selects the POIs then orders them with tsp.order_path, which is timed on its own
+        original_order_path = scenic.order_path
+        scenic.order_path = timer.timed("tsp", original_order_path)
+        try:
+            for detour, max_pois in profile_limits(trip["poi_count"]):
+                with timer.stage("select_pois"):
+                    order = order_scenic_route(*problem, detour, max_pois)
+                scenic_routes.append(scenic.route_from_order(start, end, pois, order))
+        finally:
+            scenic.order_path = original_order_path
+        timer.times["select_pois"] -= timer.times.get("tsp", 0.0)
+    else:
+        scenic_routes = [([start, end], 0) for _ in profile_limits(trip["poi_count"])]
+
+    with timer.stage("route_paths"):
+        route_legs = [fastest_legs] + [routing.get_route_legs(route) for route, _ in scenic_routes]
+        return build_response([start, end], scenic_routes, route_legs)
+
+
+def summary(values):
+    return {
+        "median": statistics.median(values), "min": min(values), "max": max(values),
+        "runs": [round(value, 6) for value in values]
+    }
+
+
+def run_trip(trip, args):
+    fixture = load_fixture(trip)
+    with StubOverpass(fixture["overpass_elements"], args.overpass_latency,
+                      args.overpass_latency_per_sq_degree) as stub_overpass, \
+            ReplayNominatim(fixture["geocode"], args.geocode_latency) as stub_nominatim, \
+            ReplayOSRM(fixture["osrm"], args.osrm_latency) as stub_osrm:
+        overpass.OVERPASS_API_URL = stub_overpass.url
+        geocoding.GEOCODING_API_URL = stub_nominatim.url
+        routing.OSRM_API_URL = stub_osrm.url
+        # The replayed Nominatim has no rate limit, the 1 request per second of the real one would dominate
+        geocoding.nominatim.set_rate(0)
+
+        runs = {stage: [] for stage in STAGES + ["total"]}
+        for _ in range(args.repeat):
+            clear_caches()
+            timer = StageTimer()
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                routes = plan_trip(trip, timer)
+            runs["total"].append(time.perf_counter() - started)
+            for stage in STAGES:
+                runs[stage].append(timer.times.get(stage, 0.0))
+
+    return {
+        "source": fixture["source"],
+        "recorded_at": fixture.get("recorded_at"),
+        "upstreams": fixture.get("upstreams"),
+        "elements": len(fixture["overpass_elements"]),
+        "scenic_pois": [len(route["points"]) - 2 for route in routes["scenic_routes"]],
+        "distances_km": [round(route["distance"] / 1000, 1) for route in [routes["fastest_route"]]
+                         + routes["scenic_routes"]],
+        "replay_misses": {"geocode": stub_nominatim.misses, "osrm": stub_osrm.misses},
+        "overpass_queries": stub_overpass.queries // args.repeat,
+        "stages": {stage: summary(values) for stage, values in runs.items()}
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def selected_trips(names):
+    if not names:
+        return TRIPS
+    unknown = set(names) - {trip["name"] for trip in TRIPS}
+    if unknown:
+        sys.exit(f"Unknown trips: {', '.join(sorted(unknown))}")
+    return [trip for trip in TRIPS if trip["name"] in names]
+
+
+def run(args):
+    results = {
+        "version": git_version(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "repeat": args.repeat,
+            "geocode_latency": args.geocode_latency,
+            "osrm_latency": args.osrm_latency,
+            "overpass_latency": args.overpass_latency,
+            "overpass_latency_per_sq_degree": args.overpass_latency_per_sq_degree,
+            "corridor_search": CORRIDOR_SEARCH,
+        },
+        "trips": {}
+    }
+    print(f"{'trip':<18}{'source':>10}" + "".join(f"{stage:>13}" for stage in STAGES + ["total"]))
+    for trip in selected_trips(args.trips):
+        result = run_trip(trip, args)
+        results["trips"][trip["name"]] = result
+        print(f"{trip['name']:<18}{result['source']:>10}" + "".join(
+            f"{result['stages'][stage]['median'] * 1000:>11.1f}ms" for stage in STAGES + ["total"]))
+        if not trip.get("search_only") and not all(result["scenic_pois"]):
+            print("  a scenic route got no POIs, its select_pois and tsp stages time nothing")
+        misses = result["replay_misses"]
+        if misses["geocode"] or misses["osrm"]:
+            print(f"  {misses['geocode']} geocoding and {misses['osrm']} OSRM requests were not in the fixture")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def record(args):
+    # Plans every trip once against the real servers (or the ones set with SCENIFY_*_URL) through recording
+    # proxies, and saves what they answered
+    live_urls = (geocoding.GEOCODING_API_URL, overpass.OVERPASS_API_URL, routing.OSRM_API_URL)
+    for trip in selected_trips(args.trips):
+        clear_caches()
+        with RecordingProxy(live_urls[0], geocoding.GEOCODING_HEADERS) as geocoder, \
+                RecordingProxy(live_urls[1]) as overpass_proxy, RecordingProxy(live_urls[2]) as router:
+            geocoding.GEOCODING_API_URL = geocoder.url
+            overpass.OVERPASS_API_URL = overpass_proxy.url
+            routing.OSRM_API_URL = router.url
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    plan_trip(trip, StageTimer())
+            finally:
+                geocoding.GEOCODING_API_URL, overpass.OVERPASS_API_URL, routing.OSRM_API_URL = live_urls
+            fixture = recorded_fixture(trip, geocoder, overpass_proxy, router)
+        save_fixture(fixture)
+        print(f"Recorded {trip['name']}: {len(fixture['geocode'])} places, "
+              f"{len(fixture['overpass_elements'])} elements, {len(fixture['osrm'])} routes")
+
+
+def compare(args):
+    # Exits with 1 when a stage of a trip got slower than the threshold allows, on the medians
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"{before.get('version')} -> {after.get('version')}")
+    print(f"{'trip':<18}{'stage':<14}{'before':>11}{'after':>11}{'change':>9}")
+    regressions = 0
+    for name, trip in after["trips"].items():
+        if name not in before["trips"]:
+            continue
+        for stage, timing in trip["stages"].items():
+            old = before["trips"][name]["stages"].get(stage, {}).get("median")
+            if old is None:
+                continue
+            new = timing["median"]
+            change = (new - old) / old if old > 0 else 0.0
+            # Stages below a millisecond are too noisy to flag
+            regressed = change > args.threshold and new - old > args.min_seconds
+            regressions += regressed
+            print(f"{name:<18}{stage:<14}{old * 1000:>9.1f}ms{new * 1000:>9.1f}ms{change:>+8.0%}"
+                  f"{'  slower' if regressed else ''}")
+    if regressions:
+        print(f"{regressions} stages got slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time the stages against the replayed fixtures")
+    run_parser.add_argument("--trips", nargs="+")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+    run_parser.add_argument("--geocode-latency", type=float, default=0.05)
+    run_parser.add_argument("--osrm-latency", type=float, default=0.05)
+    run_parser.add_argument("--overpass-latency", type=float, default=0.2)
+    run_parser.add_argument("--overpass-latency-per-sq-degree", type=float, default=0.01)
+
+    record_parser = commands.add_parser("record", help="record the fixtures from the real servers")
+    record_parser.add_argument("--trips", nargs="+")
+
+    compare_parser = commands.add_parser("compare", help="compare two results, exits with 1 on a regression")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--min-seconds", type=float, default=0.001)
+
+    args = parser.parse_args()
+    {"run": run, "record": record, "compare": compare}[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel returned by TieredCache.get when a key is not cached at all.
+# A cached value of None is a valid (negative) result and is returned as None.
+MISSING = object()
+
+# Optional SQLite file shared by the caches so cached results survive restarts
+CACHE_DB_PATH = os.environ.get("SCENIFY_CACHE_DB")
+
+
+class TieredCache:
+    # A small two tier cache: an in-process LRU in front of an optional SQLite table.
+    # Entries expire after `ttl` seconds, negative results (None) after `negative_ttl` seconds.
+    # Values must be JSON serializable so they can be written to the disk tier.
+    # When `weigh` is given, the memory tier is also bounded by the total weight of its values
+    # (for example the number of elements they hold) and not only by the number of entries.
+
+    def __init__(self, name, max_entries=1024, ttl=7 * 24 * 3600, negative_ttl=3600, db_path=None,
+                 max_weight=None, weigh=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.db_path = db_path
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, weight)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.name}" '
+            "(key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if value is None:
+                        self.negative_hits += 1
+                    return value
+                self._forget(key)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f'SELECT value, expires_at FROM "{self.name}" WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    if value is None:
+                        self.negative_hits += 1
+                    return value
+
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        expires_at = time.time() + (self.negative_ttl if value is None else self.ttl)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    f'INSERT OR REPLACE INTO "{self.name}" (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), expires_at)
+                )
+                self._db.commit()
+
+    def _remember(self, key, expires_at, value):
+        if key in self._entries:
+            self._forget(key)
+        weight = self.weigh(value) if self.weigh and value is not None else 0
+        self._entries[key] = (expires_at, value, weight)
+        self.weight += weight
+        # We evict least recently used entries, but always keep the newest one
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_weight is not None and self.weight > self.max_weight)
+        ):
+            _, (_, _, evicted_weight) = self._entries.popitem(last=False)
+            self.weight -= evicted_weight
+
+    def _forget(self, key):
+        _, _, weight = self._entries.pop(key)
+        self.weight -= weight
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM "{self.name}"')
+                self._db.commit()
+
+    def purge_expired(self):
+        # We drop expired rows from the disk tier, the memory tier cleans itself lazily
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute(f'DELETE FROM "{self.name}" WHERE expires_at <= ?', (time.time(),))
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "weight": self.weight,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
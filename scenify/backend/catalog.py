@@ -0,0 +1,227 @@
+# The POI catalog: the POIs of an area as columns, with everything that doesn't depend on the trip worked out
+# once, when the elements come in (overpass.cache_block for the Overpass tiles, import_osm.py for the local
+# store), instead of for every element on every request: the classification, the English name, the
+# heritage/notability score and the bit of the category. A request only merges the catalogs of its tiles,
+# picks its categories and the POIs along its way with NumPy masks, and builds the POIs that are left.
+#
+# A catalog is a dict of equally long lists, so the tile cache can keep it as JSON:
+#   osm_type              ELEMENT_TYPE_ORDER of the element, osm_id its id
+#   lat, lon
+#   name, original_name   the English name when there is one, and the OSM name
+#   type, subtype         get_best_type_and_subtype
+#   is_unesco             heritage=1
+#   is_notable            a wikipedia or wikidata tag
+#   score                 base_score, what the POI is worth before we look at where it is
+#   category              the bit of (type, subtype) in CATEGORY_BITS, 0 for the few outside of it
+#   tags_json             the raw OSM tags as JSON text, only decoded for the requests asking for them (includeTags)
+# Elements that can't become POIs (no name, no coordinates, no classification) are not part of it.
+import itertools
+import json
+import zlib
+
+import numpy as np
+
+# The POIs we look for, grouped like in the Overpass query: (comment, needs a wikipedia tag,
+# [(key, value, element types)]). The offline import in import_osm.py applies the same filters.
+POI_FILTERS = [
+    ("UNESCO World Heritage Sites", False, [
+        ("heritage", "1", ("node", "way", "relation")),
+    ]),
+    ("Major museums and cultural sites", True, [
+        ("tourism", "museum", ("node", "way")),
+        ("tourism", "gallery", ("node", "way")),
+    ]),
+    ("Notable castles and palaces", True, [
+        ("historic", "castle", ("node", "way")),
+        ("historic", "palace", ("node", "way")),
+    ]),
+    ("Notable religious sites", True, [
+        ("historic", "monastery", ("node", "way")),
+        ("historic", "cathedral", ("node", "way")),
+        ("historic", "church", ("node", "way")),
+    ]),
+    ("Notable natural features", True, [
+        ("natural", "peak", ("node",)),
+        ("natural", "volcano", ("node",)),
+        ("waterway", "waterfall", ("node",)),
+        ("natural", "beach", ("node",)),
+        ("natural", "bay", ("node",)),
+    ]),
+    ("Notable parks, gardens and viewpoints", True, [
+        ("leisure", "park", ("node", "way")),
+        ("leisure", "garden", ("node", "way")),
+        ("tourism", "viewpoint", ("node",)),
+    ]),
+    ("Historical and architectural sites", True, [
+        ("historic", "monument", ("node", "way")),
+        ("historic", "ruins", ("node", "way")),
+        ("historic", "archaeological_site", ("node", "way")),
+        ("historic", "memorial", ("node", "way")),
+    ]),
+]
+
+# key -> value -> (element types, needs a wikipedia tag), to check tags against the filters quickly
+POI_FILTER_INDEX = {}
+for _, needs_wikipedia, filters in POI_FILTERS:
+    for key, value, element_types in filters:
+        POI_FILTER_INDEX.setdefault(key, {})[value] = (element_types, needs_wikipedia)
+
+# Overpass prints nodes first, then ways, then relations, each sorted by id
+ELEMENT_TYPE_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+COLUMNS = (
+    'osm_type', 'osm_id', 'lat', 'lon', 'name', 'original_name', 'type', 'subtype', 'is_unesco', 'is_notable',
+    'score', 'category', 'tags_json'
+)
+# The NumPy type of every column once merged, the texts stay Python strings
+COLUMN_TYPES = {
+    'osm_type': np.int64, 'osm_id': np.int64, 'lat': float, 'lon': float, 'is_unesco': bool, 'is_notable': bool,
+    'score': float, 'category': np.int64
+}
+
+# Bump it after changing the columns or what goes into them: the cached tiles and the stores built by
+# another version are not used. The category bits come from POI_FILTERS, so they are part of the version.
+CATALOG_FORMAT = 2
+
+
+def matches_poi_filters(element_type, tags):
+    # True if the Overpass query returns an element of this type with these tags
+    for key, values in POI_FILTER_INDEX.items():
+        match = values.get(tags.get(key))
+        if match and element_type in match[0] and (not match[1] or 'wikipedia' in tags):
+            return True
+    return False
+
+
+def get_best_type_and_subtype(tags):
+    # We try to get more specific type/subtype classification
+    if tags.get('heritage') == '1':
+        return 'historic', 'UNESCO Site'
+
+    # Try to get the most specific classification
+    for category in ['historic', 'natural', 'leisure']:
+        if category in tags:
+            # Convert underscore to space and capitalize each word
+            subtype = tags[category].replace('_', ' ').title()
+            return category, subtype
+
+    # Tourism tag is vague so we handle the tourism category last and try to get specific subtypes
+    if 'tourism' in tags:
+        tourism_type = tags['tourism']
+        if tourism_type in ['museum', 'gallery', 'viewpoint']:
+            return 'tourism', tourism_type.title()
+
+    # For the other cases, we try to just find a better classification
+    if 'building' in tags:
+        return 'historic', tags['building'].replace('_', ' ').title()
+    if 'landuse' in tags and tags['landuse'] in ['park', 'recreation_ground']:
+        return 'leisure', 'park'
+
+    return None, None
+
+
+def base_score(heritage_level, is_notable):
+    # Score of a POI before we look at where it is
+    if heritage_level == '1':
+        return 3000  # Highest priority for heritage=1 (World Heritage Sites)
+    if heritage_level == '2':
+        return 2000  # Second highest priority for heritage=2 (National Heritage Sites)
+    if is_notable:
+        return 1000  # Wikipedia POIs get lower priority than heritage sites, but are still notable
+    return 0
+
+
+def category_key(poi_type, poi_subtype):
+    # The categories of the request match the type exactly and the subtype in any case
+    return poi_type, poi_subtype.lower()
+
+
+# Every category an element matching POI_FILTERS is classified as gets a bit, so the categories of a request
+# become one mask. The rare other ones (e.g. from a building tag) have no bit and are compared one by one.
+CATEGORY_BITS = {}
+for _, _, filters in POI_FILTERS:
+    for key, value, _ in filters:
+        poi_type, poi_subtype = get_best_type_and_subtype({key: value})
+        if poi_type is not None:
+            CATEGORY_BITS.setdefault(category_key(poi_type, poi_subtype), 1 << len(CATEGORY_BITS))
+
+CATALOG_VERSION = f"{CATALOG_FORMAT}-{zlib.crc32(json.dumps(sorted(CATEGORY_BITS.items())).encode()):08x}"
+
+
+def classify_element(el):
+    # The catalog row of an Overpass element ({"type", "id", "lat", "lon", "tags"}), None if it can't be a POI
+    tags = el.get('tags', {})
+    # If there are POIs without names or coordinates we skip them
+    if not tags.get('name') or 'lat' not in el:
+        return None
+    poi_type, poi_subtype = get_best_type_and_subtype(tags)
+    if poi_type is None:
+        return None
+
+    # We try to provide English names
+    english_name = (
+        tags.get('name:en') or  # Try official English name
+        tags.get('int_name') or  # Try international name
+        tags.get('name')  # Fallback to default name
+    )
+    # We try to get the Wikipedia title if it is abailable
+    wiki_tag = tags.get('wikipedia:en') or tags.get('wikipedia')
+    if wiki_tag and ':' in wiki_tag:
+        wiki_lang, wiki_title = wiki_tag.split(':', 1)
+        if wiki_lang == 'en':
+            english_name = wiki_title.replace('_', ' ')
+
+    is_notable = 'wikipedia' in tags or 'wikidata' in tags
+    return (
+        ELEMENT_TYPE_ORDER.get(el['type'], 3), el['id'], el['lat'], el['lon'], english_name, tags['name'],
+        poi_type, poi_subtype, tags.get('heritage') == '1', is_notable, base_score(tags.get('heritage'), is_notable),
+        CATEGORY_BITS.get(category_key(poi_type, poi_subtype), 0),
+        json.dumps(tags, ensure_ascii=False, separators=(',', ':'))
+    )
+
+
+def build_catalog(rows):
+    # A catalog from its rows, tuples in the order of COLUMNS
+    columns = list(zip(*rows)) or [()] * len(COLUMNS)
+    return {name: list(values) for name, values in zip(COLUMNS, columns)}
+
+
+def catalog_from_elements(elements):
+    return build_catalog(filter(None, map(classify_element, elements)))
+
+
+def catalog_size(catalog):
+    return len(catalog['osm_id'])
+
+
+def merge_catalogs(catalogs, bbox=None):
+    # One catalog of several (the tiles of a search), as NumPy arrays. Neighbouring tiles or store queries
+    # can hold the same element, we keep it once; with a bounding box, only the POIs inside it are kept.
+    # The POIs come in the order of the Overpass answer, by type and id.
+    merged = {}
+    for name in COLUMNS:
+        values = list(itertools.chain.from_iterable(catalog[name] for catalog in catalogs))
+        merged[name] = np.array(values, dtype=COLUMN_TYPES.get(name, object))
+    # OSM ids stay far below 2^40
+    _, rows = np.unique((merged['osm_type'] << 40) | merged['osm_id'], return_index=True)
+    if bbox:
+        lats, lons = merged['lat'][rows], merged['lon'][rows]
+        rows = rows[(lats >= bbox[0]) & (lats <= bbox[2]) & (lons >= bbox[1]) & (lons <= bbox[3])]
+    return {name: values[rows] for name, values in merged.items()}
+
+
+def category_mask(catalog, categories):
+    # Which POIs of a merged catalog are in one of the categories ({"type", "subtype"}) of the request
+    bits = 0
+    others = set()
+    for cat in categories:
+        key = category_key(cat['type'], cat['subtype'])
+        if key in CATEGORY_BITS:
+            bits |= CATEGORY_BITS[key]
+        else:
+            others.add(key)
+    mask = (catalog['category'] & bits) != 0
+    if others:
+        for i in np.flatnonzero(catalog['category'] == 0):
+            mask[i] = category_key(catalog['type'][i], catalog['subtype'][i]) in others
+    return mask
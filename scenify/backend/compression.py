@@ -0,0 +1,42 @@
+# Compression of the JSON responses, shared by app.py and asgi.py. Route responses are mostly numbers and
+# compress well; brotli is preferred when the client takes it, then gzip. The event streams are never
+# compressed, a compressor would hold the events back until it has enough data.
+import gzip
+import os
+
+import brotli
+
+# Smaller responses are sent as they are, compressing them saves nothing
+COMPRESS_MIN_BYTES = int(os.environ.get("SCENIFY_COMPRESS_MIN_BYTES", 1024))
+
+COMPRESSED_TYPES = ("application/json", "text/plain")
+
+
+def accepted_encodings(accept_encoding):
+    # The encodings of an Accept-Encoding header, without the ones refused with q=0
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if name and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.lower())
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    encodings = accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in encodings:
+            return encoding
+    return None
+
+
+def should_compress(content_type, body):
+    return len(body) >= COMPRESS_MIN_BYTES and (content_type or "").split(";")[0].strip() in COMPRESSED_TYPES
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        # Quality 5 is close to the best ratio for JSON at a fraction of the time of the default 11
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
@@ -0,0 +1,135 @@
+# The corridor search: instead of the padded bounding box of the trip, we look for POIs within
+# corridor_km of the road of the direct route. For a diagonal trip the bounding box is mostly far away
+# from the road, the corridor only covers the tiles along it, so Overpass (or the local POI store) sends
+# fewer elements and we parse fewer. It is opt-in with SCENIFY_POI_SEARCH=corridor: POIs that are off the road
+# but inside the bounding box are no longer candidates, so the scenic routes can change.
+import os
+from math import cos, radians, sqrt, pi
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, haversine
+from overpass import TILE_SIZE_DEG, tiles_for_bbox, tile_bbox
+
+CORRIDOR_SEARCH = os.environ.get("SCENIFY_POI_SEARCH", "bbox") == "corridor"
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * pi / 180
+
+
+def route_path(legs):
+    # The road of a route as (lats, lons) arrays, from its OSRM legs ([lon, lat] pairs). None when a leg
+    # could not be routed, then we fall back to the bounding box.
+    if not legs or not all(legs):
+        return None
+    coordinates = [point for leg in legs for point in leg['coordinates']]
+    if len(coordinates) < 2:
+        return None
+    path = np.asarray(coordinates, dtype=float)
+    return path[:, 1], path[:, 0]
+
+
+def thin_path(lats, lons, step_km):
+    # Keeps a point only when it is at least step_km from the last point kept. Every dropped point is then
+    # within step_km of the thinned path, which is far below the corridor width, and an OSRM geometry of
+    # tens of thousands of points shrinks to a few hundred segments.
+    kept = [0]
+    lat_step = step_km / KM_PER_DEGREE
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+    for i in range(1, len(lat_list) - 1):
+        last = kept[-1]
+        dlat = lat_list[i] - lat_list[last]
+        dlon = (lon_list[i] - lon_list[last]) * cos(radians(lat_list[i]))
+        if dlat * dlat + dlon * dlon >= lat_step * lat_step:
+            kept.append(i)
+    kept.append(len(lat_list) - 1)
+    return lats[kept], lons[kept]
+
+
+class SegmentIndex:
+    # The segments of a path bucketed in a grid of cells, every segment goes in all the cells its bounding box
+    # grown by reach_km touches. The segments within reach_km of a point are then all in the point's cell,
+    # so distances() only compares every point with the few segments nearby.
+
+    def __init__(self, lats, lons, reach_km):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.reach_km = reach_km
+        self.cell_deg = max(reach_km / KM_PER_DEGREE, 0.01)
+        lat_pad = reach_km / KM_PER_DEGREE
+        # Longitude degrees get shorter towards the poles, we pad for the highest latitude of the path
+        lon_pad = lat_pad / cos(radians(min(89.0, float(np.abs(self.lats).max()) + lat_pad)))
+
+        first_rows = np.floor((np.minimum(self.lats[:-1], self.lats[1:]) - lat_pad) / self.cell_deg).astype(int)
+        last_rows = np.floor((np.maximum(self.lats[:-1], self.lats[1:]) + lat_pad) / self.cell_deg).astype(int)
+        first_cols = np.floor((np.minimum(self.lons[:-1], self.lons[1:]) - lon_pad) / self.cell_deg).astype(int)
+        last_cols = np.floor((np.maximum(self.lons[:-1], self.lons[1:]) + lon_pad) / self.cell_deg).astype(int)
+        cells = {}
+        for segment in range(len(self.lats) - 1):
+            for row in range(first_rows[segment], last_rows[segment] + 1):
+                for col in range(first_cols[segment], last_cols[segment] + 1):
+                    cells.setdefault((row, col), []).append(segment)
+        self.cells = {cell: np.array(segments) for cell, segments in cells.items()}
+
+    def bbox(self):
+        lat_pad = self.reach_km / KM_PER_DEGREE
+        lon_pad = lat_pad / cos(radians(min(89.0, float(np.abs(self.lats).max()) + lat_pad)))
+        return (
+            float(self.lats.min()) - lat_pad, float(self.lons.min()) - lon_pad,
+            float(self.lats.max()) + lat_pad, float(self.lons.max()) + lon_pad
+        )
+
+    def distances(self, lats, lons):
+        # Distance in km from every point to the path, or infinity for the points farther than reach_km
+        # (and some a bit closer) which have no segment in their cell
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        result = np.full(len(lats), np.inf)
+        groups = {}
+        rows = np.floor(lats / self.cell_deg).astype(int)
+        cols = np.floor(lons / self.cell_deg).astype(int)
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            groups.setdefault(cell, []).append(i)
+
+        for cell, points in groups.items():
+            segments = self.cells.get(cell)
+            if segments is None:
+                continue
+            points = np.array(points)
+            point_lats, point_lons = lats[points][:, None], lons[points][:, None]
+            start_lats, start_lons = self.lats[segments][None, :], self.lons[segments][None, :]
+            end_lats, end_lons = self.lats[segments + 1][None, :], self.lons[segments + 1][None, :]
+            # We project on every segment in degree space with longitudes scaled at the point's latitude,
+            # and measure the real distance to the projected point
+            scale = np.cos(np.radians(point_lats))
+            seg_lat, seg_lon = end_lats - start_lats, (end_lons - start_lons) * scale
+            len_sq = seg_lat ** 2 + seg_lon ** 2
+            t = ((point_lats - start_lats) * seg_lat + (point_lons - start_lons) * scale * seg_lon)
+            t = np.clip(t / np.where(len_sq == 0, 1, len_sq), 0, 1)
+            closest = haversine(
+                point_lats, point_lons,
+                start_lats + t * (end_lats - start_lats), start_lons + t * (end_lons - start_lons)
+            )
+            result[points] = closest.min(axis=1)
+        return result
+
+
+class Corridor:
+    # The area within width_km of a route's road: the Overpass tiles it touches and a distance check for POIs
+
+    def __init__(self, lats, lons, width_km):
+        self.width_km = width_km
+        # A tile touches the corridor when its center is within width_km + half its diagonal of the road
+        self.tile_margin_km = TILE_SIZE_DEG * KM_PER_DEGREE * sqrt(2) / 2
+        lats, lons = thin_path(lats, lons, max(0.5, width_km / 100))
+        self.index = SegmentIndex(lats, lons, width_km + self.tile_margin_km)
+
+    def tiles(self):
+        candidates = tiles_for_bbox(*self.index.bbox())
+        centers = [tile_bbox(tile) for tile in candidates]
+        center_lats = [(min_lat + max_lat) / 2 for min_lat, _, max_lat, _ in centers]
+        center_lons = [(min_lon + max_lon) / 2 for _, min_lon, _, max_lon in centers]
+        close = self.index.distances(center_lats, center_lons) <= self.width_km + self.tile_margin_km
+        return [tile for tile, keep in zip(candidates, close) if keep]
+
+    def mask(self, lats, lons):
+        return self.index.distances(lats, lons) <= self.width_km
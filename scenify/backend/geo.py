@@ -0,0 +1,77 @@
+# Batched Haversine distances on NumPy arrays of latitudes and longitudes (in degrees).
+# Every function returns kilometers and matches calculate_distance in scenic.py up to floating-point rounding.
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def coordinates(points):
+    # Turns a list of {'lat', 'lon'} dicts into two float arrays
+    lats = np.fromiter((point['lat'] for point in points), dtype=float, count=len(points))
+    lons = np.fromiter((point['lon'] for point in points), dtype=float, count=len(points))
+    return lats, lons
+
+
+def haversine(lats1, lons1, lats2, lons2):
+    # Element-wise distance between two sets of points (NumPy broadcasting rules apply)
+    lat1, lon1 = np.radians(lats1), np.radians(lons1)
+    lat2, lon2 = np.radians(lats2), np.radians(lons2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)
+    return 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * EARTH_RADIUS_KM
+
+
+def one_to_many(point, lats, lons):
+    # Distances from a single point to every point of the arrays
+    return haversine(point['lat'], point['lon'], lats, lons)
+
+
+def distance_matrix(lats, lons):
+    # Full pairwise matrix, matrix[i][j] is the distance between point i and point j
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    return haversine(lats[:, None], lons[:, None], lats[None, :], lons[None, :])
+
+
+def path_length(lats, lons):
+    # Length of the path going through the points in order
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if len(lats) < 2:
+        return 0.0
+    return float(haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+
+
+def distances_to_line(start, end, lats, lons):
+    # Perpendicular distance from every point to the line start->end, projected in degree space
+    # exactly like distance_to_line in scenic.py
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    se_lat = end['lat'] - start['lat']
+    se_lon = end['lon'] - start['lon']
+    len_sq = se_lat ** 2 + se_lon ** 2
+    if len_sq == 0:
+        return one_to_many(start, lats, lons)
+    t = (se_lat * (lats - start['lat']) + se_lon * (lons - start['lon'])) / len_sq
+    return haversine(lats, lons, start['lat'] + t * se_lat, start['lon'] + t * se_lon)
+
+
+def reasonable_path_mask(start, end, lats, lons, detour_ratio=1.5, min_proximity_km=30):
+    # Vectorized is_poi_on_reasonable_path: True for the points that are not too close to start or end,
+    # keep the detour within detour_ratio and lie between start and end along the main travel direction
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    start_distance = one_to_many(start, lats, lons)
+    end_distance = one_to_many(end, lats, lons)
+    direct = haversine(start['lat'], start['lon'], end['lat'], end['lon'])
+
+    mask = (start_distance >= min_proximity_km) & (end_distance >= min_proximity_km)
+    mask &= start_distance + end_distance <= direct * detour_ratio
+
+    if abs(end['lat'] - start['lat']) > abs(end['lon'] - start['lon']):
+        low, high = sorted((start['lat'], end['lat']))
+        mask &= (lats >= low) & (lats <= high)
+    else:
+        low, high = sorted((start['lon'], end['lon']))
+        mask &= (lons >= low) & (lons <= high)
+    return mask
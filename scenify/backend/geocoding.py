@@ -0,0 +1,97 @@
+import os
+import unicodedata
+
+from cache import TieredCache, MISSING, CACHE_DB_PATH
+from upstream import Upstream
+
+# We define the geocoding API URL from OpenStreetMap (Nominatim)
+GEOCODING_API_URL = os.environ.get("SCENIFY_GEOCODING_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODING_HEADERS = {
+    "User-Agent": "ScenicRoutesPlanner/1.0"
+}
+GEOCODING_TIMEOUT = int(os.environ.get("SCENIFY_GEOCODING_TIMEOUT", 30))
+
+# The public Nominatim asks for no more than one request per second, 0 lifts the limit for a server of our own
+nominatim = Upstream(
+    "nominatim",
+    rate=float(os.environ.get("SCENIFY_NOMINATIM_RATE", 1)),
+    burst=int(os.environ.get("SCENIFY_NOMINATIM_BURST", 1))
+)
+
+# Most requests are for a few hundred popular places, so we keep geocoding results around.
+# Places that Nominatim doesn't know are cached for a shorter time.
+geocode_cache = TieredCache(
+    "geocode",
+    max_entries=int(os.environ.get("SCENIFY_GEOCODE_CACHE_SIZE", 4096)),
+    ttl=int(os.environ.get("SCENIFY_GEOCODE_CACHE_TTL", 30 * 24 * 3600)),
+    negative_ttl=int(os.environ.get("SCENIFY_GEOCODE_NEGATIVE_TTL", 3600)),
+    db_path=CACHE_DB_PATH
+)
+
+
+def normalize_location_query(location):
+    # "  Paris ", "paris" and "PARIS" are the same place for Nominatim, so they share a cache key
+    return " ".join(unicodedata.normalize("NFKC", location).casefold().split())
+
+
+def geocode_params(location):
+    return {
+        "q": location,
+        "format": "json",
+        "limit": 1
+    }
+
+
+def cached_geocode(key):
+    # Returns a copy of the cached result (None for unknown places), or MISSING
+    cached = geocode_cache.get(key)
+    if cached is MISSING:
+        return MISSING
+    # We hand out copies because callers add fields (like "name") to the result
+    return dict(cached) if cached else None
+
+
+def remember_geocode(key, results):
+    coords = None
+    if results:
+        coords = {
+            "lat": float(results[0]["lat"]),
+            "lon": float(results[0]["lon"])
+        }
+    # Only real answers are cached, errors and rate limits are retried next time
+    geocode_cache.set(key, coords)
+    return dict(coords) if coords else None
+
+
+def geocode_from_response(key, response):
+    if response.status_code == 200:
+        return remember_geocode(key, response.json())
+    return None
+
+
+def geocode_location(location):
+    # Function called to geocode a single location, answered from the cache when possible
+    key = normalize_location_query(location)
+    cached = cached_geocode(key)
+    if cached is not MISSING:
+        return cached
+
+    with nominatim.call(GEOCODING_API_URL) as call:
+        response = nominatim.session.get(
+            GEOCODING_API_URL, params=geocode_params(location), headers=GEOCODING_HEADERS, timeout=GEOCODING_TIMEOUT)
+        call.status, call.received = response.status_code, len(response.content)
+    return geocode_from_response(key, response)
+
+
+async def geocode_location_async(client, location):
+    # The same as geocode_location, through a shared httpx.AsyncClient
+    key = normalize_location_query(location)
+    cached = cached_geocode(key)
+    if cached is not MISSING:
+        return cached
+
+    async with nominatim.call_async(GEOCODING_API_URL) as call:
+        response = await client.get(
+            GEOCODING_API_URL, params=geocode_params(location), headers=GEOCODING_HEADERS, timeout=GEOCODING_TIMEOUT)
+        call.status, call.received = response.status_code, len(response.content)
+    return geocode_from_response(key, response)
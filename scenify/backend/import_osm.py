@@ -0,0 +1,142 @@
+# Builds the local POI store read by poi_store.py from an OSM extract, e.g. a Geofabrik country download:
+#
+#   python import_osm.py france-latest.osm.pbf pois.sqlite
+#   SCENIFY_POI_STORE=pois.sqlite python app.py
+#
+# XML extracts (.osm, .osm.gz, .osm.bz2) are read with the standard library, PBF extracts need pyosmium
+# (pip install osmium). We stream the extract and write the POIs in batches, so the memory use stays the same
+# for a city or a whole country. We keep the elements matching the Overpass query filters (catalog.POI_FILTERS)
+# and write their catalog rows (catalog.classify_element), so a store gives the same POIs as Overpass for the
+# same data. Re-run the import after changing either of them, the server refuses a store of another version.
+#
+# Only nodes are imported: the ways and relations of the Overpass answer come without coordinates, and
+# the catalog skips them.
+import argparse
+import bz2
+import gzip
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+
+from catalog import CATALOG_VERSION, COLUMNS, POI_FILTER_INDEX, classify_element, matches_poi_filters
+from poi_store import STORE_SCHEMA
+
+BATCH_SIZE = 10000
+
+
+def open_extract(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_xml_nodes(path):
+    # Yields (id, lat, lon, tags) for the tagged nodes of an .osm file
+    with open_extract(path) as f:
+        events = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(events)
+        for event, elem in events:
+            if event != 'end':
+                continue
+            if elem.tag == 'node':
+                tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                if tags:
+                    yield int(elem.get('id')), float(elem.get('lat')), float(elem.get('lon')), tags
+            if elem.tag in ('node', 'way', 'relation'):
+                # We drop the parsed elements, otherwise the whole tree stays in memory
+                root.clear()
+
+
+def read_pbf_nodes(path):
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading PBF extracts needs pyosmium: pip install osmium")
+    # pyosmium skips the nodes without any of the keys we look for before they reach Python
+    nodes = osmium.FileProcessor(path, osmium.osm.NODE).with_filter(osmium.filter.KeyFilter(*POI_FILTER_INDEX))
+    for node in nodes:
+        yield node.id, node.location.lat, node.location.lon, {tag.k: tag.v for tag in node.tags}
+
+
+def read_nodes(path):
+    if path.endswith('.pbf'):
+        return read_pbf_nodes(path)
+    return read_xml_nodes(path)
+
+
+def poi_rows(nodes):
+    # The catalog rows of the nodes, in the order of COLUMNS
+    for osm_id, lat, lon, tags in nodes:
+        if not tags.get('name') or not matches_poi_filters('node', tags):
+            continue
+        row = classify_element({"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": tags})
+        if row is not None:
+            yield row
+
+
+def write_batch(db, batch, first_id):
+    db.executemany(
+        f"INSERT INTO pois (id, {', '.join(COLUMNS)}) VALUES (?{', ?' * len(COLUMNS)})",
+        [(first_id + i,) + row for i, row in enumerate(batch)]
+    )
+    lat_column, lon_column = COLUMNS.index('lat'), COLUMNS.index('lon')
+    db.executemany(
+        "INSERT INTO poi_index (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+        [(first_id + i, row[lat_column], row[lat_column], row[lon_column], row[lon_column])
+         for i, row in enumerate(batch)]
+    )
+
+
+def import_extract(source, store_path, batch_size=BATCH_SIZE):
+    # We build the store next to the target and move it in place at the end, so a running server
+    # never opens a half written store
+    started = time.time()
+    tmp_path = store_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    db.executescript(STORE_SCHEMA)
+
+    count = 0
+    batch = []
+    for row in poi_rows(read_nodes(source)):
+        batch.append(row)
+        if len(batch) == batch_size:
+            write_batch(db, batch, count + 1)
+            db.commit()
+            count += len(batch)
+            batch = []
+            print(f"Imported {count} POIs ({time.time() - started:.1f}s)")
+    if batch:
+        write_batch(db, batch, count + 1)
+        count += len(batch)
+
+    db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+        ("source", os.path.basename(source)),
+        ("pois", str(count)),
+        ("catalog_version", CATALOG_VERSION),
+        ("imported_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    ])
+    db.commit()
+    db.close()
+    os.replace(tmp_path, store_path)
+    print(f"Imported {count} POIs from {source} into {store_path} in {time.time() - started:.1f}s")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local POI store from an OSM extract")
+    parser.add_argument("extract", help=".osm.pbf, .osm, .osm.gz or .osm.bz2 file")
+    parser.add_argument("store", help="SQLite file to write, then set SCENIFY_POI_STORE to it")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    import_extract(args.extract, args.store, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
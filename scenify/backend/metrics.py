@@ -0,0 +1,199 @@
+# Counters and histograms of what the pipeline does, exported in the Prometheus text format on /metrics:
+# the time spent in every stage of a request, the upstream calls (outcome, retries, bytes received, latency),
+# the POIs left after every filter step and what the solver did. Recording a value is a dict update under
+# a lock, cheap enough for the hot path.
+#
+# With SCENIFY_SERVER_TIMING=1 the JSON responses also get a Server-Timing header with the time of every stage
+# of that request, e.g. for the browser's network panel.
+#
+# The solver runs in worker processes, whose metrics would stay there: solver_pool records them with
+# recording() in the worker and replays them in the web process with replay().
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+SERVER_TIMING = os.environ.get("SCENIFY_SERVER_TIMING", "0") == "1"
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+# The observations recorded in a worker process instead of its own metrics, see recording()
+_recorded = contextvars.ContextVar("scenify_recorded_metrics", default=None)
+# The time per stage of the current request, see request_timings()
+_timings = contextvars.ContextVar("scenify_request_timings", default=None)
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        recorded = _recorded.get()
+        if recorded is not None:
+            recorded.append((self.name, amount, labels))
+            return
+        key = tuple((name, str(labels[name])) for name in self.label_names)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{label_text(key)} {value}" for key, value in sorted(self.values.items()))
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, label_names=(), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = list(buckets)
+        self.values = {}  # labels -> [count per bucket (the last one is +Inf), sum]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        recorded = _recorded.get()
+        if recorded is not None:
+            recorded.append((self.name, value, labels))
+            return
+        key = tuple((name, str(labels[name])) for name in self.label_names)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+            counts[0][bucket] += 1
+            counts[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{label_text(key + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(key)} {total}")
+            lines.append(f"{self.name}_count{label_text(key)} {cumulative}")
+        return lines
+
+
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+REQUESTS = Counter("scenify_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status"))
+REQUEST_SECONDS = Histogram("scenify_request_seconds", "Time to answer a request", ("endpoint",))
+STAGE_SECONDS = Histogram("scenify_stage_seconds", "Time spent in each stage of route planning", ("stage",))
+UPSTREAM_REQUESTS = Counter(
+    "scenify_upstream_requests_total", "Calls to Nominatim, Overpass and OSRM by outcome", ("service", "outcome"))
+UPSTREAM_RETRIES = Counter("scenify_upstream_retries_total", "Upstream calls that were a retry", ("service",))
+UPSTREAM_BYTES = Counter("scenify_upstream_received_bytes_total", "Bytes received from upstreams", ("service",))
+UPSTREAM_SECONDS = Histogram("scenify_upstream_seconds", "Latency of an upstream call", ("service",))
+POIS = Histogram("scenify_pois", "POIs left after each filter step of a request", ("step",), COUNT_BUCKETS)
+SOLVER_SECONDS = Histogram(
+    "scenify_solver_seconds", "Time to order the POIs of a route", ("solver",),
+    (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 5))
+SOLVER_SOLUTIONS = Histogram(
+    "scenify_solver_solutions", "Solutions OR-Tools went through for a route", (), COUNT_BUCKETS)
+SOLVER_STOPS = Counter("scenify_solver_stops_total", "Why OR-Tools stopped searching", ("reason",))
+SOLVER_OBJECTIVE_KM = Histogram(
+    "scenify_solver_objective_km", "Length of the ordered route found by the solver", ("solver",),
+    (10, 50, 100, 250, 500, 1000, 2000, 4000))
+
+
+def status_outcome(status_code):
+    if status_code == 200:
+        return "ok"
+    return "rate_limited" if status_code == 429 else "http_error"
+
+
+def record_upstream(service, outcome, started, received=0, attempt=0):
+    # One upstream call, started is its time.perf_counter() at the start. The outcome is "ok", "rate_limited",
+    # "http_error", "timeout" or "error" (no answer)
+    UPSTREAM_REQUESTS.inc(service=service, outcome=outcome)
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, service=service)
+    if received:
+        UPSTREAM_BYTES.inc(received, service=service)
+    if attempt:
+        UPSTREAM_RETRIES.inc(service=service)
+
+
+@contextlib.contextmanager
+def span(stage):
+    # Times a stage of route planning, for the histogram and for the Server-Timing of the request
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def request_timings():
+    # Starts collecting the stage times of the current request (thread or task) and returns them
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings, total):
+    stages = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    return ", ".join(stages + [f"total;dur={total * 1000:.1f}"])
+
+
+@contextlib.contextmanager
+def recording():
+    # Records the observations made inside the block in a list instead of the metrics of this process
+    observations = []
+    token = _recorded.set(observations)
+    try:
+        yield observations
+    finally:
+        _recorded.reset(token)
+
+
+def replay(observations):
+    by_name = {metric.name: metric for metric in _metrics}
+    for name, value, labels in observations:
+        metric = by_name[name]
+        if isinstance(metric, Counter):
+            metric.inc(value, **labels)
+        else:
+            metric.observe(value, **labels)
+
+
+def add_collector(collect):
+    # collect() returns (name, type, help, [(labels, value)]) tuples read when /metrics is rendered,
+    # for values kept elsewhere like the cache statistics
+    _collectors.append(collect)
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            if metric.values:
+                lines.extend(metric.render())
+    for collect in _collectors:
+        for name, metric_type, help_text, samples in collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{label_text(tuple(labels.items()))} {value}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,512 @@
+import asyncio
+import codecs
+import json
+import os
+import random
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from math import floor
+
+import httpx
+import requests
+
+from cache import TieredCache, MISSING, CACHE_DB_PATH
+from catalog import CATALOG_VERSION, POI_FILTERS, build_catalog, catalog_size, classify_element, merge_catalogs
+from singleflight import SingleFlight
+from upstream import Upstream, UpstreamUnavailable, call_later
+
+OVERPASS_API_URL = os.environ.get("SCENIFY_OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+# Every sub-query gets OVERPASS_ATTEMPTS tries, the n-th one with a timeout of n * OVERPASS_TIMEOUT seconds
+OVERPASS_ATTEMPTS = int(os.environ.get("SCENIFY_OVERPASS_ATTEMPTS", 3))
+OVERPASS_TIMEOUT = int(os.environ.get("SCENIFY_OVERPASS_TIMEOUT", 90))
+OVERPASS_BACKOFF = float(os.environ.get("SCENIFY_OVERPASS_BACKOFF", 2))
+
+# The search area is split into fixed tiles of TILE_SIZE_DEG x TILE_SIZE_DEG degrees.
+# The POI catalog of every tile is cached (see catalog.py), so trips sharing most of their corridor
+# (Paris->Lyon and Paris->Marseille) only ask Overpass for the tiles nobody has fetched yet.
+TILE_SIZE_DEG = float(os.environ.get("SCENIFY_TILE_SIZE_DEG", 0.5))
+
+# Missing tiles are fetched in blocks of QUERY_BLOCK_TILES x QUERY_BLOCK_TILES tiles
+QUERY_BLOCK_TILES = int(os.environ.get("SCENIFY_OVERPASS_BLOCK_TILES", 4))
+
+# Overpass gives every IP a few slots, OVERPASS_WORKERS bounds how many queries we run against it at once
+OVERPASS_WORKERS = int(os.environ.get("SCENIFY_OVERPASS_WORKERS", 4))
+overpass_pool = ThreadPoolExecutor(max_workers=OVERPASS_WORKERS, thread_name_prefix="overpass")
+# When Overpass is down the sub-queries fail at once, and the search goes on with the cached tiles
+overpass_api = Upstream(
+    "overpass",
+    rate=float(os.environ.get("SCENIFY_OVERPASS_RATE", 0)),
+    slots=OVERPASS_WORKERS,
+    connections=OVERPASS_WORKERS
+)
+
+tile_cache = TieredCache(
+    "overpass_tiles",
+    max_entries=int(os.environ.get("SCENIFY_TILE_CACHE_SIZE", 4096)),
+    ttl=int(os.environ.get("SCENIFY_TILE_CACHE_TTL", 7 * 24 * 3600)),
+    db_path=CACHE_DB_PATH,
+    # The memory tier is bounded by the total number of cached POIs
+    max_weight=int(os.environ.get("SCENIFY_TILE_CACHE_MAX_ELEMENTS", 500000)),
+    weigh=catalog_size
+)
+
+# Requests for the same search area at the same time (the same trip with other categories, or places that
+# geocode to the same point) share one fetch
+overpass_flights = SingleFlight("overpass")
+
+def build_query_template(poi_filters):
+    groups = []
+    for comment, needs_wikipedia, filters in poi_filters:
+        lines = [f"  // {comment}"]
+        for key, value, element_types in filters:
+            for element_type in element_types:
+                line = f'  {element_type}({{min_lat}},{{min_lon}},{{max_lat}},{{max_lon}})["{key}"="{value}"]'
+                lines.append(line + ('["wikipedia"];' if needs_wikipedia else ";"))
+        groups.append("\n".join(lines))
+    # Ways and relations come without coordinates and can't become POIs, so we don't ask for their member
+    # nodes (">; out skel qt;"): for parks and gardens those were most of the answer
+    return "\n[out:json][timeout:180];\n(\n" + "\n  \n".join(groups) + "\n);\nout body;"
+
+
+OVERPASS_QUERY_TEMPLATE = build_query_template(POI_FILTERS)
+
+
+def build_overpass_query(min_lat, min_lon, max_lat, max_lon):
+    return OVERPASS_QUERY_TEMPLATE.format(
+        min_lat=min_lat,
+        max_lat=max_lat,
+        min_lon=min_lon,
+        max_lon=max_lon
+    ).strip()
+
+
+# The answer is read in chunks of this many bytes
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+ELEMENT_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def is_poi_element(el):
+    # Only named elements with coordinates can become POIs
+    return 'lat' in el and bool(el.get('tags', {}).get('name'))
+
+
+class ElementParser:
+    # Parses the "elements" array of an Overpass answer as its chunks come in, one element at a time, and only
+    # keeps the ones that can become POIs. We never hold the whole answer, as text or as parsed JSON.
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ""
+        self.position = 0
+        self.in_elements = False
+        self.done = False
+        self.parsed = 0
+        self.received = 0
+        self.elements = []
+
+    def feed(self, chunk):
+        self.received += len(chunk)
+        if self.done:
+            return
+        self.buffer = self.buffer[self.position:] + self.text.decode(chunk)
+        self.position = 0
+        if not self.in_elements:
+            match = ELEMENTS_START.search(self.buffer)
+            if not match:
+                # The key may be cut between two chunks
+                self.position = max(0, len(self.buffer) - 32)
+                return
+            self.position = match.end()
+            self.in_elements = True
+
+        while True:
+            self.position = ELEMENT_SEPARATOR.match(self.buffer, self.position).end()
+            if self.position == len(self.buffer):
+                return
+            if self.buffer[self.position] == ']':
+                # Anything after the elements (a "remark" about a timeout) is ignored, like before
+                self.done = True
+                self.buffer = ""
+                self.position = 0
+                return
+            try:
+                el, self.position = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The element goes on in the next chunk
+                return
+            self.parsed += 1
+            if is_poi_element(el):
+                self.elements.append(el)
+
+    def close(self):
+        if not self.done:
+            raise ValueError("The Overpass answer ended in the middle of its elements")
+        return self.elements
+
+
+def parse_elements(chunks, parser=None):
+    parser = parser or ElementParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def parse_elements_async(chunks, parser=None):
+    parser = parser or ElementParser()
+    async for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def tile_of(lat, lon):
+    return floor(lat / TILE_SIZE_DEG), floor(lon / TILE_SIZE_DEG)
+
+
+def tile_key(tile):
+    # The catalog version and the tile size are part of the key so changing them never mixes up old cached tiles
+    return f"{CATALOG_VERSION}:{TILE_SIZE_DEG}:{tile[0]}:{tile[1]}"
+
+
+def tile_bbox(tile):
+    row, col = tile
+    return row * TILE_SIZE_DEG, col * TILE_SIZE_DEG, (row + 1) * TILE_SIZE_DEG, (col + 1) * TILE_SIZE_DEG
+
+
+def tiles_for_bbox(min_lat, min_lon, max_lat, max_lon):
+    min_row, min_col = tile_of(min_lat, min_lon)
+    max_row, max_col = tile_of(max_lat, max_lon)
+    return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+
+
+def overpass_backoff(attempt):
+    # Backs off with some jitter so parallel queries don't retry together
+    return OVERPASS_BACKOFF * 2 ** attempt + random.uniform(0, OVERPASS_BACKOFF)
+
+
+def query_attempt(overpass_query, attempt, label):
+    # One try of a query. Returns the elements, or None and the backoff before the next try.
+    # Raises UpstreamUnavailable when Overpass is down.
+    backoff = overpass_backoff(attempt)
+    timeout = OVERPASS_TIMEOUT * (attempt + 1)
+    try:
+        with overpass_api.call(OVERPASS_API_URL, attempt) as call:
+            with overpass_api.session.post(
+                OVERPASS_API_URL,
+                data={'data': overpass_query},
+                headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                timeout=timeout,
+                stream=True
+            ) as response:
+                call.status = response.status_code
+                if response.status_code == 200:
+                    parser = ElementParser()
+                    try:
+                        elements = parse_elements(response.iter_content(RESPONSE_CHUNK_SIZE), parser)
+                    finally:
+                        call.received = parser.received
+                    print(f"{label}: found {len(elements)} named elements (attempt {attempt + 1})")
+                    return elements, None
+
+                elif response.status_code == 429:
+                    # When we are rate limited we wait twice as long as usual
+                    backoff *= 2
+                    print(f"{label}: rate limited on attempt {attempt + 1}")
+
+                else:
+                    print(f"{label}: Overpass API error {response.status_code} on attempt {attempt + 1}")
+                    print(f"Response text: {response.text[:1000]}")
+
+    except requests.exceptions.Timeout:
+        print(f"{label}: timeout after {timeout}s on attempt {attempt + 1}")
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        print(f"{label}: error on attempt {attempt + 1}: {str(e)}")
+    return None, backoff
+
+
+def submit_query(min_lat, min_lon, max_lat, max_lon, label="Overpass"):
+    # Sends one query for the bounding box through overpass_pool. Returns a future of the raw elements,
+    # None if all the tries failed. Every sub-query retries on its own, and between two tries no thread
+    # waits: the next one goes back to the pool once the backoff is over.
+    overpass_query = build_overpass_query(min_lat, min_lon, max_lat, max_lon)
+    result = Future()
+
+    def attempt(number):
+        try:
+            elements, backoff = query_attempt(overpass_query, number, label)
+        except UpstreamUnavailable as e:
+            print(f"{label}: {str(e)}")
+            result.set_result(None)
+            return
+        except BaseException as e:
+            result.set_exception(e)
+            return
+        if elements is not None:
+            result.set_result(elements)
+        elif number < OVERPASS_ATTEMPTS - 1:
+            call_later(backoff, lambda: overpass_pool.submit(attempt, number + 1))
+        else:
+            print(f"{label}: all the tries failed")
+            result.set_result(None)
+
+    overpass_pool.submit(attempt, 0)
+    return result
+
+
+def query_overpass(min_lat, min_lon, max_lat, max_lon, label="Overpass"):
+    # Returns the raw elements of the bounding box, or None if all the tries failed
+    return submit_query(min_lat, min_lon, max_lat, max_lon, label).result()
+
+
+async def query_overpass_async(client, min_lat, min_lon, max_lat, max_lon, label="Overpass"):
+    # The same as query_overpass, through a shared httpx.AsyncClient
+    overpass_query = build_overpass_query(min_lat, min_lon, max_lat, max_lon)
+
+    for attempt in range(OVERPASS_ATTEMPTS):
+        backoff = overpass_backoff(attempt)
+        try:
+            timeout = OVERPASS_TIMEOUT * (attempt + 1)
+            async with overpass_api.call_async(OVERPASS_API_URL, attempt) as call:
+                async with client.stream(
+                    "POST", OVERPASS_API_URL, data={'data': overpass_query}, timeout=timeout
+                ) as response:
+                    call.status = response.status_code
+                    if response.status_code == 200:
+                        parser = ElementParser()
+                        try:
+                            elements = await parse_elements_async(response.aiter_bytes(RESPONSE_CHUNK_SIZE), parser)
+                        finally:
+                            call.received = parser.received
+                        print(f"{label}: found {len(elements)} named elements (attempt {attempt + 1})")
+                        return elements
+
+                    elif response.status_code == 429:
+                        backoff *= 2
+                        print(f"{label}: rate limited on attempt {attempt + 1}")
+
+                    else:
+                        await response.aread()
+                        print(f"{label}: Overpass API error {response.status_code} on attempt {attempt + 1}")
+                        print(f"Response text: {response.text[:1000]}")
+
+        except httpx.TimeoutException:
+            print(f"{label}: timeout after {timeout}s on attempt {attempt + 1}")
+        except UpstreamUnavailable as e:
+            print(f"{label}: {str(e)}")
+            return None
+        except Exception as e:
+            print(f"{label}: error on attempt {attempt + 1}: {str(e)}")
+
+        if attempt < OVERPASS_ATTEMPTS - 1:
+            await asyncio.sleep(backoff)
+
+    print(f"{label}: all the tries failed")
+    return None
+
+
+def group_tiles(tiles):
+    # Missing tiles are grouped into blocks of QUERY_BLOCK_TILES x QUERY_BLOCK_TILES tiles,
+    # every block becomes one sub-query covering the bounding box of its missing tiles.
+    # A block that would mostly query tiles we don't need (the edge of a corridor, holes left by the cache)
+    # is split into runs of neighbouring tiles in a row instead.
+    blocks = {}
+    for row, col in tiles:
+        blocks.setdefault((row // QUERY_BLOCK_TILES, col // QUERY_BLOCK_TILES), []).append((row, col))
+    grouped = []
+    for block in blocks.values():
+        min_row, min_col, max_row, max_col = block_extent(block)
+        if len(block) * 2 >= (max_row - min_row + 1) * (max_col - min_col + 1):
+            grouped.append(block)
+        else:
+            grouped.extend(tile_runs(block))
+    return grouped
+
+
+def tile_runs(tiles):
+    # Splits tiles into runs of neighbouring tiles in the same row, every run covers a rectangle
+    runs = []
+    for row, col in sorted(tiles):
+        if runs and runs[-1][-1] == (row, col - 1):
+            runs[-1].append((row, col))
+        else:
+            runs.append([(row, col)])
+    return runs
+
+
+def block_extent(block):
+    # The rectangle of tiles (min_row, min_col, max_row, max_col) covering the block
+    rows = [row for row, _ in block]
+    cols = [col for _, col in block]
+    return min(rows), min(cols), max(rows), max(cols)
+
+
+def block_bbox(block):
+    min_row, min_col, max_row, max_col = block_extent(block)
+    return tile_bbox((min_row, min_col))[:2] + tile_bbox((max_row, max_col))[2:]
+
+
+def cache_block(block, elements):
+    # Classifies the elements of a block query into the catalogs of its tiles, caches every tile and
+    # returns {tile: catalog}
+    min_row, min_col, max_row, max_col = block_extent(block)
+    query_tiles = [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+    buckets = {tile: [] for tile in query_tiles}
+    for el in elements:
+        row = classify_element(el)
+        if row is None:
+            continue
+        tile = tile_of(el['lat'], el['lon'])
+        if tile in buckets:
+            buckets[tile].append(row)
+    catalogs = {tile: build_catalog(rows) for tile, rows in buckets.items()}
+    for tile, catalog in catalogs.items():
+        tile_cache.set(tile_key(tile), catalog)
+    return catalogs
+
+
+def fetch_block(block, label):
+    # Queries Overpass for one block of tiles and caches it. Returns a future of the block's {tile: catalog},
+    # None when the block could not be fetched.
+    fetched = Future()
+
+    def cache(query):
+        try:
+            elements = query.result()
+            fetched.set_result(None if elements is None else cache_block(block, elements))
+        except Exception as e:
+            fetched.set_exception(e)
+
+    submit_query(*block_bbox(block), label=label).add_done_callback(cache)
+    return fetched
+
+
+async def fetch_block_async(client, block, label):
+    elements = await query_overpass_async(client, *block_bbox(block), label=label)
+    if elements is None:
+        return None
+    return cache_block(block, elements)
+
+
+def cached_tiles(tiles):
+    # Returns the cached tiles as {tile: catalog} and the list of tiles that are not cached yet
+    tile_catalogs = {}
+    missing = []
+    for tile in tiles:
+        cached = tile_cache.get(tile_key(tile))
+        if cached is MISSING:
+            missing.append(tile)
+        else:
+            tile_catalogs[tile] = cached
+    print(f"{len(tiles) - len(missing)} of {len(tiles)} tiles found in the cache")
+    return tile_catalogs, missing
+
+
+def add_fetched_blocks(tile_catalogs, blocks, results, tile_count):
+    # A failed sub-query only leaves a hole in the coverage
+    failed_tiles = 0
+    for block, buckets in zip(blocks, results):
+        if buckets is None:
+            failed_tiles += len(block)
+            continue
+        tile_catalogs.update((tile, buckets[tile]) for tile in block)
+    if failed_tiles:
+        print(f"Could not fetch {failed_tiles} of {tile_count} tiles, continuing with partial coverage")
+
+
+def merge_tiles(tile_catalogs, bbox=None):
+    # One catalog of the tiles, with only the POIs inside the bounding box when there is one
+    return merge_catalogs(list(tile_catalogs.values()), bbox)
+
+
+def bbox_key(min_lat, min_lon, max_lat, max_lon):
+    return f"{min_lat:.5f},{min_lon:.5f},{max_lat:.5f},{max_lon:.5f}"
+
+
+def tiles_flight_key(tiles):
+    # The tiles of a corridor, as compact as the list allows
+    return f"tiles:{TILE_SIZE_DEG}:" + ";".join(f"{row},{col}" for row, col in sorted(tiles))
+
+
+def fetch_catalog(min_lat, min_lon, max_lat, max_lon):
+    # Returns the POI catalog of the bounding box, or None if we got nothing at all
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+    return overpass_flights.do(bbox_key(*bbox), collect_catalog, tiles_for_bbox(*bbox), bbox)
+
+
+async def fetch_catalog_async(client, min_lat, min_lon, max_lat, max_lon, progress=None):
+    # progress(tiles done, tiles in total) is called as the sub-queries finish. A call that joins an identical
+    # one already in flight only gets the result.
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+    return await overpass_flights.do_async(
+        bbox_key(*bbox), collect_catalog_async, client, tiles_for_bbox(*bbox), bbox, progress)
+
+
+def fetch_tile_catalog(tiles):
+    # Returns the POI catalog of the given tiles (a corridor), or None if we got nothing at all
+    return overpass_flights.do(tiles_flight_key(tiles), collect_catalog, tiles)
+
+
+async def fetch_tile_catalog_async(client, tiles, progress=None):
+    return await overpass_flights.do_async(
+        tiles_flight_key(tiles), collect_catalog_async, client, tiles, None, progress)
+
+
+def warm_tiles(tiles):
+    # Fetches the tiles that are not cached yet into the tile cache, without merging them. The batch planner
+    # warms the tiles shared by many trips at once, so they are grouped into as few sub-queries as possible.
+    # Returns the number of tiles that could not be fetched.
+    _, missing = cached_tiles(tiles)
+    if not missing:
+        return 0
+    blocks = group_tiles(missing)
+    print(f"Sending {len(blocks)} Overpass sub-queries for {len(missing)} tiles")
+    futures = [fetch_block(block, f"Sub-query {i + 1}/{len(blocks)}") for i, block in enumerate(blocks)]
+    return sum(len(block) for block, future in zip(blocks, futures) if future.result() is None)
+
+
+def collect_catalog(tiles, bbox=None):
+    # Builds the catalog of the tiles from cached tiles where possible.
+    # The tiles that are not cached yet are fetched as parallel sub-queries through a bounded pool.
+    tile_catalogs, missing = cached_tiles(tiles)
+
+    if missing:
+        blocks = group_tiles(missing)
+        print(f"Sending {len(blocks)} Overpass sub-queries for {len(missing)} tiles")
+        futures = [fetch_block(block, f"Sub-query {i + 1}/{len(blocks)}") for i, block in enumerate(blocks)]
+        add_fetched_blocks(tile_catalogs, blocks, [future.result() for future in futures], len(tiles))
+        if not tile_catalogs:
+            return None
+
+    return merge_tiles(tile_catalogs, bbox)
+
+
+async def collect_catalog_async(client, tiles, bbox=None, progress=None):
+    # The same as collect_catalog, with the sub-queries running concurrently on the event loop
+    tile_catalogs, missing = cached_tiles(tiles)
+    tiles_done = len(tiles) - len(missing)
+    if progress:
+        progress(tiles_done, len(tiles))
+
+    if missing:
+        blocks = group_tiles(missing)
+        print(f"Sending {len(blocks)} Overpass sub-queries for {len(missing)} tiles")
+
+        async def fetch_and_report(i, block):
+            nonlocal tiles_done
+            buckets = await fetch_block_async(client, block, f"Sub-query {i + 1}/{len(blocks)}")
+            tiles_done += len(block)
+            if progress:
+                progress(tiles_done, len(tiles))
+            return buckets
+
+        results = await asyncio.gather(*(fetch_and_report(i, block) for i, block in enumerate(blocks)))
+        add_fetched_blocks(tile_catalogs, blocks, results, len(tiles))
+        if not tile_catalogs:
+            return None
+
+    return merge_tiles(tile_catalogs, bbox)
@@ -0,0 +1,405 @@
+# Plans the direct and scenic routes of a trip. plan_routes runs the steps one after the other and is used by
+# the Flask app, plan_routes_async runs the upstream calls concurrently on an event loop and is used by asgi.py.
+# stream_routes(_async) plan the same routes while reporting every stage, for the streaming endpoints.
+import asyncio
+import json
+import threading
+
+import httpx
+
+from corridor import CORRIDOR_SEARCH, route_path
+from geocoding import geocode_cache, geocode_location, geocode_location_async, normalize_location_query
+from metrics import add_collector, span
+from overpass import tile_cache, overpass_flights
+from pois import fetch_all_pois, fetch_all_pois_async, point_json
+from polyline import compact_path, path_zoom, without_repeats
+from routing import get_route_legs, get_route_legs_async, leg_cache
+from scenic import calculate_distance, route_from_order
+from singleflight import SingleFlight
+from solver_pool import solve_route_profiles, compact_problem, order_profiles
+from upstream import UpstreamUnavailable
+
+# We set detour factors and POI counts (as a share of poiCount) for the scenic route types
+SCENIC_ROUTE_PROFILES = [
+    # 50% extra distance for rapid scenic route
+    {"name": "Balanced Scenic Route", "detour": 1.5, "poi_share": 0.5, "goal": "prioritizing travel time"},
+    # 100% extra distance for explorer scenic route
+    {"name": "Most Scenic Route", "detour": 2.0, "poi_share": 1, "goal": "maximizing attractions"},
+]
+
+# When a trip trends, many users ask for it within seconds. Identical requests in flight at the same time
+# share one computation (the shared response keeps the location names of the first request).
+route_flights = SingleFlight("routes")
+
+
+def cache_metrics():
+    # The statistics of /api/cache/stats and /api/coalescing/stats for /metrics
+    caches = [cache.stats() for cache in (geocode_cache, tile_cache, leg_cache)]
+    flights = [flights.stats() for flights in (route_flights, overpass_flights)]
+    return [
+        ("scenify_cache_lookups_total", "counter", "Cache lookups answered from memory, from disk or missed", [
+            ({"cache": stats["name"], "result": result}, value)
+            for stats in caches
+            for result, value in (
+                ("memory", stats["hits"] - stats["disk_hits"]), ("disk", stats["disk_hits"]), ("miss", stats["misses"])
+            )
+        ]),
+        ("scenify_cache_entries", "gauge", "Entries in the memory tier of a cache",
+         [({"cache": stats["name"]}, stats["entries"]) for stats in caches]),
+        ("scenify_coalesced_calls_total", "counter", "Calls that joined an identical one already in flight",
+         [({"flight": stats["name"]}, stats["deduplicated"]) for stats in flights]),
+        ("scenify_in_flight", "gauge", "Distinct calls in flight",
+         [({"flight": stats["name"]}, stats["in_flight"]) for stats in flights]),
+    ]
+
+
+add_collector(cache_metrics)
+
+
+class RoutePlanningError(Exception):
+    # Raised for trips we can't plan because of the request itself, answered with a 400
+    pass
+
+
+def route_request_key(start_location, end_location, max_pois, categories):
+    # The categories are a set, their order in the request doesn't change the routes
+    selected = sorted((str(cat.get('type')), str(cat.get('subtype')).lower()) for cat in categories)
+    return json.dumps([
+        normalize_location_query(start_location), normalize_location_query(end_location), max_pois, selected
+    ])
+
+
+def profile_limits(max_pois):
+    return [(profile["detour"], int(max_pois * profile["poi_share"])) for profile in SCENIC_ROUTE_PROFILES]
+
+
+def check_locations(start_location, end_location, start_coords, end_coords):
+    if not start_coords:
+        raise RoutePlanningError(f"Could not geocode start location: '{start_location}'.")
+    if not end_coords:
+        raise RoutePlanningError(f"Could not geocode end location: '{end_location}'.")
+    start_coords["name"] = start_location
+    end_coords["name"] = end_location
+
+
+def route_with_paths(route_points, legs):
+    #We add real route paths and total distance on actual roads between consecutive points
+    route_points = [point_json(point) for point in route_points]
+    if len(route_points) < 2:
+        return route_points
+    paths = []
+    total_distance = 0
+    for i, route_data in enumerate(legs):
+        if route_data:
+            paths.extend(route_data['coordinates'])
+            total_distance += route_data['distance']
+        else:
+        # If OSRM fails we calculate it using the Haversine formula
+            total_distance += calculate_distance(route_points[i], route_points[i + 1])
+
+    print(f"Final route distance (OSRM): {total_distance:.1f}km")
+
+    return {
+        "points": route_points,
+        "path": without_repeats(paths),
+        "distance": total_distance * 1000  # We convert km to meters because other services expect meters
+    }
+
+
+def fastest_route_response(route_points, legs):
+    return {
+        "name": "Direct Route",
+        **route_with_paths(route_points, legs),
+        "description": "Direct route from start to destination"
+    }
+
+
+def scenic_route_response(profile, route_points, poi_count, legs):
+    return {
+        "name": profile["name"],
+        **route_with_paths(route_points, legs),
+        "description": f"Optimized route with {poi_count} points of interest, {profile['goal']}"
+    }
+
+
+def build_response(fastest_route, scenic_routes, route_legs):
+    # route_legs holds the legs of the fastest route first, then the legs of every scenic route
+    return {
+        "fastest_route": fastest_route_response(fastest_route, route_legs[0]),
+        "scenic_routes": [
+            scenic_route_response(profile, route, poi_count, legs)
+            for profile, (route, poi_count), legs in zip(SCENIC_ROUTE_PROFILES, scenic_routes, route_legs[1:])
+        ]
+    }
+
+
+def direct_path(fastest_legs):
+    # The road of the direct route we search for POIs along, or None to search the bounding box of the trip
+    if not CORRIDOR_SEARCH:
+        return None
+    return route_path(fastest_legs)
+
+
+def requested_path_zoom(data):
+    # The zoom the paths are simplified for when the request asks for "pathFormat": "polyline",
+    # or None for the full paths as [lon, lat] pairs
+    if data.get('pathFormat') != 'polyline':
+        return None
+    return path_zoom(data.get('pathZoom'))
+
+
+def requested_tags(data):
+    # The raw OSM tags of the POIs are only part of the points with "includeTags": true
+    return bool(data.get('includeTags'))
+
+
+def response_point(point, include_tags):
+    if include_tags or 'tags' not in point:
+        return point
+    return {key: value for key, value in point.items() if key != 'tags'}
+
+
+def compact_route(route, zoom, include_tags=False):
+    # The route as the request asked for it: with its path simplified for the zoom and encoded as a polyline
+    # (zoom not None), and without the tags of its POIs unless include_tags
+    route = dict(route)
+    if "points" in route:
+        route["points"] = [response_point(point, include_tags) for point in route["points"]]
+    if zoom is not None:
+        route["polyline"] = compact_path(route.pop("path", []), zoom)
+    return route
+
+
+def compact_routes(routes, zoom, include_tags=False):
+    return {
+        "fastest_route": compact_route(routes["fastest_route"], zoom, include_tags),
+        "scenic_routes": [compact_route(route, zoom, include_tags) for route in routes["scenic_routes"]]
+    }
+
+
+def compact_event(event, data, zoom, include_tags=False):
+    # The route and done events of the streaming endpoints carry paths as well, the solved events points
+    if event == "route":
+        return event, {**data, "route": compact_route(data["route"], zoom, include_tags)}
+    if event == "done":
+        return event, compact_routes(data, zoom, include_tags)
+    if event == "solved":
+        return event, {**data, "points": [response_point(point, include_tags) for point in data["points"]]}
+    return event, data
+
+
+def plan_routes(start_location, end_location, max_pois, categories):
+    key = route_request_key(start_location, end_location, max_pois, categories)
+    return route_flights.do(key, compute_routes, start_location, end_location, max_pois, categories)
+
+
+async def plan_routes_async(client, start_location, end_location, max_pois, categories):
+    key = route_request_key(start_location, end_location, max_pois, categories)
+    return await route_flights.do_async(
+        key, compute_routes_async, client, start_location, end_location, max_pois, categories)
+
+
+def compute_routes(start_location, end_location, max_pois, categories):
+    # This is where we geocode start and end locations
+    with span("geocode"):
+        start_coords = geocode_location(start_location)
+        end_coords = geocode_location(end_location)
+    check_locations(start_location, end_location, start_coords, end_coords)
+
+    # All the legs of a route come from a single OSRM call through every point of the route.
+    # The direct route goes first, in corridor mode we search for POIs along its road.
+    fastest_route = [start_coords, end_coords]
+    with span("route_direct"):
+        fastest_legs = get_route_legs(fastest_route)
+
+    print("Searching for points of interest:")
+    with span("fetch_pois"):
+        all_pois = fetch_all_pois(start_coords, end_coords, categories, direct_path(fastest_legs))
+    print(f"Found a number of {len(all_pois)} POIs")
+
+    # All the scenic route profiles are solved at the same time in the solver pool
+    with span("solve"):
+        scenic_routes = solve_route_profiles(start_coords, end_coords, all_pois, profile_limits(max_pois))
+
+    with span("route_paths"):
+        route_legs = [fastest_legs] + [get_route_legs(route) for route, _ in scenic_routes]
+        return build_response(fastest_route, scenic_routes, route_legs)
+
+
+async def compute_routes_async(client, start_location, end_location, max_pois, categories):
+    # Both ends are geocoded at the same time
+    with span("geocode"):
+        start_coords, end_coords = await asyncio.gather(
+            geocode_location_async(client, start_location),
+            geocode_location_async(client, end_location)
+        )
+    check_locations(start_location, end_location, start_coords, end_coords)
+
+    # In corridor mode the direct route is routed first, we search for POIs along its road.
+    # Otherwise it is routed with the scenic routes.
+    fastest_route = [start_coords, end_coords]
+    fastest_legs = None
+    if CORRIDOR_SEARCH:
+        with span("route_direct"):
+            fastest_legs = await get_route_legs_async(client, fastest_route)
+
+    print("Searching for points of interest:")
+    with span("fetch_pois"):
+        all_pois = await fetch_all_pois_async(
+            client, start_coords, end_coords, categories, direct_path=direct_path(fastest_legs))
+    print(f"Found a number of {len(all_pois)} POIs")
+
+    # Solving is CPU work, it waits on the solver pool from a thread so the event loop keeps serving requests
+    loop = asyncio.get_running_loop()
+    with span("solve"):
+        scenic_routes = await loop.run_in_executor(
+            None, solve_route_profiles, start_coords, end_coords, all_pois, profile_limits(max_pois))
+
+    # The OSRM legs of all the routes are fetched at the same time
+    routes = ([] if CORRIDOR_SEARCH else [fastest_route]) + [route for route, _ in scenic_routes]
+    with span("route_paths"):
+        route_legs = await asyncio.gather(*(get_route_legs_async(client, points) for points in routes))
+    if CORRIDOR_SEARCH:
+        route_legs = [fastest_legs] + route_legs
+    return build_response(fastest_route, scenic_routes, route_legs)
+
+
+def sse_event(event, data):
+    # One Server-Sent Event, its data is a single line of JSON
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_routes_async(client, start_location, end_location, max_pois, categories):
+    # Yields (event, data) pairs while the routes are planned:
+    #   geocoded  {"start", "end"}
+    #   tiles     {"done", "total"}, every time Overpass tiles come in
+    #   pois      {"count"}
+    #   solved    {"index", "name", "points", "poi_count"}, as soon as a scenic route is solved
+    #   route     {"kind": "fastest" or "scenic", "index", "route"}, as soon as a route has its road geometry
+    #   done      the full response, the same as /api/routes returns
+    #   error     {"error"}, instead of done
+    # The direct route only needs the geocoded ends, so it arrives after about one OSRM round trip.
+    events = asyncio.Queue()
+    task = asyncio.ensure_future(
+        compute_streamed_routes(client, start_location, end_location, max_pois, categories, events.put_nowait))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+
+        try:
+            routes = task.result()
+        except (RoutePlanningError, UpstreamUnavailable) as e:
+            yield "error", {"error": str(e)}
+            return
+        except Exception as e:
+            print(f"Error streaming routes: {str(e)}")
+            yield "error", {"error": "Unable to generate routes"}
+            return
+        yield "done", routes
+    finally:
+        # The client went away, we stop working for it
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def compute_streamed_routes(client, start_location, end_location, max_pois, categories, emit):
+    # The stages overlap here, every route adds its own time to route_direct, solve and route_paths
+    with span("geocode"):
+        start_coords, end_coords = await asyncio.gather(
+            geocode_location_async(client, start_location),
+            geocode_location_async(client, end_location)
+        )
+    check_locations(start_location, end_location, start_coords, end_coords)
+    emit(("geocoded", {"start": start_coords, "end": end_coords}))
+
+    async def route_fastest(points):
+        with span("route_direct"):
+            legs = await get_route_legs_async(client, points)
+        route = fastest_route_response(points, legs)
+        emit(("route", {"kind": "fastest", "index": 0, "route": route}))
+        return route, legs
+
+    # The direct route is routed while we wait for Overpass. In corridor mode Overpass waits for it,
+    # we search for POIs along its road.
+    fastest_task = asyncio.ensure_future(route_fastest([start_coords, end_coords]))
+    try:
+        path = direct_path((await fastest_task)[1]) if CORRIDOR_SEARCH else None
+        print("Searching for points of interest:")
+        with span("fetch_pois"):
+            all_pois = await fetch_all_pois_async(
+                client, start_coords, end_coords, categories,
+                progress=lambda done, total: emit(("tiles", {"done": done, "total": total})),
+                direct_path=path
+            )
+        print(f"Found a number of {len(all_pois)} POIs")
+        emit(("pois", {"count": len(all_pois)}))
+
+        loop = asyncio.get_running_loop()
+        if all_pois:
+            with span("solve"):
+                pois, problem = await loop.run_in_executor(
+                    None, compact_problem, start_coords, end_coords, all_pois)
+
+        async def route_scenic(index, profile, limits):
+            # Every profile is solved on its own, so the first one solved is the first one shown
+            if all_pois:
+                with span("solve"):
+                    orders = await loop.run_in_executor(None, order_profiles, problem, [limits])
+                route_points, poi_count = route_from_order(start_coords, end_coords, pois, orders[0])
+            else:
+                route_points, poi_count = [start_coords, end_coords], 0
+            emit(("solved", {
+                "index": index, "name": profile["name"],
+                "points": [point_json(point) for point in route_points], "poi_count": poi_count
+            }))
+            with span("route_paths"):
+                legs = await get_route_legs_async(client, route_points)
+            route = scenic_route_response(profile, route_points, poi_count, legs)
+            emit(("route", {"kind": "scenic", "index": index, "route": route}))
+            return route
+
+        scenic_routes = await asyncio.gather(*(
+            route_scenic(index, profile, limits)
+            for index, (profile, limits) in enumerate(zip(SCENIC_ROUTE_PROFILES, profile_limits(max_pois)))
+        ))
+        return {"fastest_route": (await fastest_task)[0], "scenic_routes": list(scenic_routes)}
+    finally:
+        if not fastest_task.done():
+            fastest_task.cancel()
+
+
+# The event loop the Flask streams run on, on a thread of its own, and the httpx client they share.
+# Started by the first stream.
+_stream_loop = None
+_stream_client = None
+_stream_lock = threading.Lock()
+
+
+def stream_loop():
+    global _stream_loop, _stream_client
+    with _stream_lock:
+        if _stream_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="stream-loop", daemon=True).start()
+            _stream_client = httpx.AsyncClient(timeout=30)
+            _stream_loop = loop
+        return _stream_loop, _stream_client
+
+
+def stream_routes(start_location, end_location, max_pois, categories):
+    # stream_routes_async for the Flask app: the request thread waits for every event of the shared loop
+    loop, client = stream_loop()
+    events = stream_routes_async(client, start_location, end_location, max_pois, categories)
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(events.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        asyncio.run_coroutine_threadsafe(events.aclose(), loop).result()
@@ -0,0 +1,67 @@
+# A local, read-only store of the POI elements of an OSM extract, built by import_osm.py.
+# It holds the POI catalog (see catalog.py) of the elements the Overpass query would return in a SQLite file
+# with an R-tree index on their coordinates, so the search area of a trip is answered in milliseconds and
+# without depending on the public Overpass servers. When SCENIFY_POI_STORE points to a store, fetch_all_pois
+# uses it.
+import os
+import sqlite3
+import threading
+
+from catalog import CATALOG_VERSION, COLUMNS, build_catalog
+
+POI_STORE_PATH = os.environ.get("SCENIFY_POI_STORE")
+
+STORE_SCHEMA = """
+CREATE TABLE pois (
+    id INTEGER PRIMARY KEY,
+    osm_type INTEGER NOT NULL,
+    osm_id INTEGER NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    name TEXT NOT NULL,
+    original_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    subtype TEXT NOT NULL,
+    is_unesco INTEGER NOT NULL,
+    is_notable INTEGER NOT NULL,
+    score REAL NOT NULL,
+    category INTEGER NOT NULL,
+    tags_json TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE poi_index USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class PoiStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        if self.meta.get('catalog_version') != CATALOG_VERSION:
+            raise ValueError(f"The POI store {path} was built by another version of import_osm.py, re-run the import")
+
+    def query(self, min_lat, min_lon, max_lat, max_lon):
+        # Returns the catalog of the POIs inside the bounding box, sorted by id like the Overpass answer.
+        # The R-tree keeps 32-bit coordinates, so we check the exact ones as well.
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join('p.' + column for column in COLUMNS)} FROM poi_index i JOIN pois p ON p.id = i.id "
+                "WHERE i.max_lat >= ? AND i.min_lat <= ? AND i.max_lon >= ? AND i.min_lon <= ? "
+                "AND p.lat BETWEEN ? AND ? AND p.lon BETWEEN ? AND ? ORDER BY p.osm_id",
+                (min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon)
+            ).fetchall()
+        return build_catalog(rows)
+
+
+def open_poi_store(path=POI_STORE_PATH):
+    if not path:
+        return None
+    store = PoiStore(path)
+    print(f"Using the local POI store {path} ({store.meta.get('pois', '?')} POIs from {store.meta.get('source')})")
+    return store
+
+
+poi_store = open_poi_store()
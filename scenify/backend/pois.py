@@ -0,0 +1,203 @@
+import json
+from math import radians, cos
+
+import numpy as np
+
+from catalog import catalog_from_elements, category_mask, merge_catalogs
+from corridor import Corridor
+from geo import reasonable_path_mask
+from metrics import POIS
+from overpass import (
+    fetch_catalog, fetch_catalog_async, fetch_tile_catalog, fetch_tile_catalog_async, tile_runs, tile_bbox,
+    tiles_for_bbox
+)
+from poi_store import poi_store
+from scenic import calculate_distance
+
+
+class Poi:
+    # A POI as the solver and the response need it, built from a row of the POI catalog (see catalog.py).
+    # score is its base score, worked out when the catalog was built, and it is not part of the response.
+    # tags_json holds the raw OSM tags as JSON text, they are only decoded for the points of a response.
+    # poi['lat'] and poi.get('is_notable') work like with a dict, so the geometry and scenic helpers
+    # take POIs and plain {'lat', 'lon'} points alike.
+    __slots__ = (
+        'name', 'original_name', 'lat', 'lon', 'is_unesco', 'is_notable', 'type', 'subtype', 'score', 'tags_json'
+    )
+
+    FIELDS = __slots__
+
+    def __init__(self, name, original_name, lat, lon, is_unesco, is_notable, poi_type, poi_subtype, score,
+                 tags_json):
+        self.name = name
+        self.original_name = original_name
+        self.lat = lat
+        self.lon = lon
+        self.is_unesco = is_unesco
+        self.is_notable = is_notable
+        self.type = poi_type
+        self.subtype = poi_subtype
+        self.score = score
+        self.tags_json = tags_json
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+
+    def as_dict(self, with_tags=False):
+        poi = {
+            "name": self.name,
+            "original_name": self.original_name,
+            "lat": self.lat,
+            "lon": self.lon,
+            "is_unesco": self.is_unesco,
+            "is_notable": self.is_notable,
+            "type": self.type,
+            "subtype": self.subtype
+        }
+        if with_tags:
+            poi["tags"] = json.loads(self.tags_json)
+        return poi
+
+
+def point_json(point):
+    # The points of a route are the start and end dicts with the POIs in between. The POIs keep their tags
+    # here, the response drops them unless the request asks for them (see pipeline.response_point).
+    return point.as_dict(with_tags=True) if isinstance(point, Poi) else point
+
+
+def corridor_width(start_coords, end_coords):
+    # How far from the trip we look for POIs, in km
+    total_distance = calculate_distance(start_coords, end_coords)
+    return min(250, max(50, total_distance * 0.2))
+
+
+def search_area(start_coords, end_coords):
+    # This function returns the bounding box (min_lat, min_lon, max_lat, max_lon) we search for POIs in
+    corridor_km = corridor_width(start_coords, end_coords)
+
+    lat_km_per_degree = 111
+    lon_km_per_degree = 111 * cos(radians((start_coords['lat'] + end_coords['lat']) / 2)) #Longitude varies depending on latitude (it’s largest at the equator and minimized toward the poles)
+    
+    lat_padding = corridor_km / lat_km_per_degree #Calculates how many degrees of latitude correspond to half the corridor width (in kilometers)
+    lon_padding = corridor_km / lon_km_per_degree
+    
+    min_lat = min(start_coords['lat'], end_coords['lat']) - lat_padding
+    max_lat = max(start_coords['lat'], end_coords['lat']) + lat_padding
+    min_lon = min(start_coords['lon'], end_coords['lon']) - lon_padding
+    max_lon = max(start_coords['lon'], end_coords['lon']) + lon_padding
+
+    print(f"Search area: ({min_lat:.4f}, {min_lon:.4f}) to ({max_lat:.4f}, {max_lon:.4f})")
+    print(f"Corridor width: {corridor_km:.1f}km")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def search_corridor(start_coords, end_coords, direct_path):
+    # The tiles within the corridor width of the direct route's road, direct_path is its (lats, lons)
+    corridor = Corridor(*direct_path, corridor_width(start_coords, end_coords))
+    tiles = corridor.tiles()
+    print(f"Search corridor: {len(tiles)} tiles within {corridor.width_km:.1f}km of the direct route")
+    return corridor, tiles
+
+
+def store_tile_catalog(tiles):
+    # One store query per run of tiles. A POI right on the edge of two runs comes back twice, the merge keeps one.
+    return merge_catalogs([
+        poi_store.query(*(tile_bbox(run[0])[:2] + tile_bbox(run[-1])[2:])) for run in tile_runs(tiles)
+    ])
+
+
+def search_tiles(start_coords, end_coords, direct_path=None):
+    # Where we search for the POIs of a trip, as (corridor, tiles, bbox). With the road of the direct route
+    # it is the corridor along it and bbox is None, otherwise the bounding box of the trip and no corridor.
+    if direct_path is not None:
+        corridor, tiles = search_corridor(start_coords, end_coords, direct_path)
+        return corridor, tiles, None
+    bbox = search_area(start_coords, end_coords)
+    return None, tiles_for_bbox(*bbox), bbox
+
+
+def fetch_search_pois(start_coords, end_coords, categories, search):
+    corridor, tiles, bbox = search
+    if poi_store is not None:
+        # The local store built from an OSM extract answers instead of Overpass
+        catalog = store_tile_catalog(tiles) if bbox is None else merge_catalogs([poi_store.query(*bbox)])
+    elif bbox is None:
+        catalog = fetch_tile_catalog(tiles)
+    else:
+        catalog = fetch_catalog(*bbox)
+    if catalog is None:
+        return []
+    return pois_from_catalog(catalog, start_coords, end_coords, categories, corridor)
+
+
+def fetch_all_pois(start_coords, end_coords, categories=[], direct_path=None):
+    #This function fetches the needed POIs within the calculated corridor.
+    # With the road of the direct route we only search along it, otherwise in the bounding box of the trip.
+    return fetch_search_pois(start_coords, end_coords, categories, search_tiles(start_coords, end_coords, direct_path))
+
+
+async def fetch_all_pois_async(client, start_coords, end_coords, categories=[], progress=None, direct_path=None):
+    corridor = None
+    if poi_store is not None:
+        # A store query takes a few milliseconds, we don't hand it to a thread
+        if direct_path is not None:
+            corridor, tiles = search_corridor(start_coords, end_coords, direct_path)
+            catalog = store_tile_catalog(tiles)
+        else:
+            catalog = merge_catalogs([poi_store.query(*search_area(start_coords, end_coords))])
+        if progress:
+            progress(1, 1)
+    elif direct_path is not None:
+        corridor, tiles = search_corridor(start_coords, end_coords, direct_path)
+        catalog = await fetch_tile_catalog_async(client, tiles, progress=progress)
+    else:
+        catalog = await fetch_catalog_async(client, *search_area(start_coords, end_coords), progress=progress)
+    if catalog is None:
+        return []
+    return pois_from_catalog(catalog, start_coords, end_coords, categories, corridor)
+
+
+def pois_from_catalog(catalog, start_coords, end_coords, categories, corridor=None):
+    # Picks the POIs of the selected categories along the way from a merged catalog.
+    # With a corridor, the POIs also have to be within its width of the road.
+    total = len(catalog['osm_id'])
+    print(f"Using {total} POIs inside the search area")
+
+    # We check if the POIs match any of the selected categories by the user.
+    # Always include UNESCO sites (heritage=1), they are unmissable
+    candidates = np.flatnonzero(catalog['is_unesco'] | category_mask(catalog, categories))
+
+    # We keep the POIs that are on a reasonable path, checking all the candidates at once
+    rows = candidates
+    if len(candidates):
+        lats, lons = catalog['lat'][candidates], catalog['lon'][candidates]
+        on_path = reasonable_path_mask(start_coords, end_coords, lats, lons, detour_ratio=2.0)
+        if corridor is not None:
+            on_path &= corridor.mask(lats, lons)
+        rows = candidates[on_path]
+
+    # We sort the POIs by significance: UNESCO sites first, after that the notable (Wikipedia/Wikidata) sites,
+    # in the order of the catalog otherwise
+    rows = rows[np.lexsort((rows, ~catalog['is_notable'][rows], ~catalog['is_unesco'][rows]))]
+    pois = [Poi(*values) for values in zip(*(catalog[field][rows].tolist() for field in Poi.__slots__))]
+
+    print(f"Found {int(catalog['is_unesco'].sum())} UNESCO sites and {int(catalog['is_notable'].sum())} "
+          f"Wikipedia/Wikidata-referenced sites")
+    print(f"Filtered to {len(pois)} valid high-value POIs after category filtering")
+    POIS.observe(total, step="elements")
+    POIS.observe(len(candidates), step="categories")
+    POIS.observe(len(pois), step="on_path")
+    return pois
+
+
+def pois_from_elements(elements, start_coords, end_coords, categories, corridor=None):
+    # The same from raw Overpass elements
+    return pois_from_catalog(
+        merge_catalogs([catalog_from_elements(elements)]), start_coords, end_coords, categories, corridor)
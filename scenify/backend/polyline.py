@@ -0,0 +1,135 @@
+# Compact route geometry for the responses. The OSRM geometry (overview=full) has a point every few meters,
+# far more than a map shows. With "pathFormat": "polyline" a route path is simplified with Douglas-Peucker
+# to what is visible at the requested zoom (half a pixel) and sent as an encoded polyline
+# (https://developers.google.com/maps/documentation/utilities/polylinealgorithm) instead of a list of
+# [lon, lat] pairs.
+from math import cos, radians
+
+import numpy as np
+
+# Web Mercator meters per pixel at zoom 0 on the equator, for 256 px tiles
+METERS_PER_PIXEL_ZOOM_0 = 156543.03392
+METERS_PER_DEGREE = 111195.0
+DEFAULT_PATH_ZOOM = 16
+MAX_PATH_ZOOM = 20
+# Ranges of up to this many points are simplified without NumPy
+SHORT_RANGE = 64
+
+
+def without_repeats(coordinates):
+    # Drops every point equal to the one before, the legs of a route share their joining point
+    kept = []
+    for point in coordinates:
+        if not kept or point[0] != kept[-1][0] or point[1] != kept[-1][1]:
+            kept.append(point)
+    return kept
+
+
+def zoom_tolerance(zoom, latitude):
+    # Half a pixel at this zoom and latitude, in degrees of latitude
+    meters_per_pixel = METERS_PER_PIXEL_ZOOM_0 * cos(radians(latitude)) / 2 ** zoom
+    return meters_per_pixel / 2 / METERS_PER_DEGREE
+
+
+def simplify(coordinates, tolerance):
+    # Douglas-Peucker on [lon, lat] pairs, tolerance in degrees of latitude. Longitudes are scaled by the
+    # cosine of the mean latitude so the tolerance is the same in every direction. The ranges still to
+    # look at are kept on a stack. Long ranges are measured at once with NumPy, the short ones (most of
+    # them at high zooms) in plain Python, where NumPy's overhead per call would dominate.
+    if len(coordinates) < 3:
+        return list(coordinates)
+    points = np.asarray(coordinates, dtype=float)
+    x = points[:, 0] * cos(radians(float(points[:, 1].mean())))
+    y = points[:, 1]
+    x_list, y_list = x.tolist(), y.tolist()
+    tolerance_sq = tolerance * tolerance
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = x_list[first], y_list[first]
+        dx, dy = x_list[last] - x0, y_list[last] - y0
+        length_sq = dx * dx + dy * dy
+        if last - first > SHORT_RANGE:
+            px, py = x[first + 1:last] - x0, y[first + 1:last] - y0
+            if length_sq == 0:
+                distances_sq = px * px + py * py
+            else:
+                # Distance to the segment, not to the infinite line, so loops and U-turns are kept
+                t = np.clip((px * dx + py * dy) / length_sq, 0, 1)
+                distances_sq = (px - t * dx) ** 2 + (py - t * dy) ** 2
+            farthest = int(distances_sq.argmax())
+            farthest_sq = float(distances_sq[farthest])
+            split = first + 1 + farthest
+        else:
+            farthest_sq, split = -1.0, first
+            for i in range(first + 1, last):
+                px, py = x_list[i] - x0, y_list[i] - y0
+                t = 0.0 if length_sq == 0 else min(1.0, max(0.0, (px * dx + py * dy) / length_sq))
+                distance_sq = (px - t * dx) ** 2 + (py - t * dy) ** 2
+                if distance_sq > farthest_sq:
+                    farthest_sq, split = distance_sq, i
+        if farthest_sq > tolerance_sq:
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep].tolist()
+
+
+def encode_polyline(coordinates, precision=5):
+    # [lon, lat] pairs to an encoded polyline, which lists latitude first
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lon = 0
+    for lon, lat in coordinates:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return "".join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    # The reverse of encode_polyline, returns [lon, lat] pairs
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lon / factor, lat / factor])
+    return coordinates
+
+
+def path_zoom(value):
+    # The zoom of a request, clamped to what the map can show
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PATH_ZOOM
+    return max(0, min(MAX_PATH_ZOOM, zoom))
+
+
+def compact_path(coordinates, zoom):
+    if not coordinates:
+        return ""
+    latitude = max(abs(lat) for _, lat in coordinates)
+    return encode_polyline(simplify(coordinates, zoom_tolerance(zoom, min(latitude, 85.0))))
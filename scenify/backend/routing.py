@@ -0,0 +1,219 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import TieredCache, MISSING, CACHE_DB_PATH
+from upstream import Upstream, UpstreamUnavailable
+
+OSRM_API_URL = os.environ.get("SCENIFY_OSRM_URL", "http://router.project-osrm.org")
+OSRM_TIMEOUT = int(os.environ.get("SCENIFY_OSRM_TIMEOUT", 30))
+OSRM_WORKERS = int(os.environ.get("SCENIFY_OSRM_WORKERS", 8))
+
+# One pooled session with keep-alive for every OSRM call, instead of a new connection per leg.
+# When OSRM is down the legs are left out and the routes fall back to Haversine distances.
+osrm = Upstream(
+    "osrm", rate=float(os.environ.get("SCENIFY_OSRM_RATE", 0)), connections=OSRM_WORKERS
+)
+
+# Legs are cached on their rounded endpoints (5 decimals is about 1 m), so the start->first POI and
+# last POI->end legs shared by the returned routes, and popular POIs across users, are only routed once.
+# The memory tier is bounded by the total number of geometry points it holds.
+leg_cache = TieredCache(
+    "osrm_legs",
+    max_entries=int(os.environ.get("SCENIFY_LEG_CACHE_SIZE", 20000)),
+    ttl=int(os.environ.get("SCENIFY_LEG_CACHE_TTL", 7 * 24 * 3600)),
+    db_path=CACHE_DB_PATH,
+    max_weight=int(os.environ.get("SCENIFY_LEG_CACHE_MAX_POINTS", 2000000)),
+    weigh=lambda leg: len(leg['coordinates'])
+)
+
+# Used to fetch legs one by one (concurrently) when a multi-waypoint call fails
+routing_pool = ThreadPoolExecutor(max_workers=OSRM_WORKERS, thread_name_prefix="osrm")
+
+
+def osrm_url(points):
+    waypoints = ";".join(f"{point['lon']},{point['lat']}" for point in points)
+    return f"{OSRM_API_URL}/route/v1/driving/{waypoints}?overview=full&geometries=geojson"
+
+
+def parse_osrm_response(response):
+    if response.status_code == 200:
+        data = response.json()
+        if data.get('routes'):
+            return data['routes'][0], data.get('waypoints', [])
+    return None
+
+
+def osrm_route(points):
+    # Asks OSRM for one route through all the points and returns the parsed route and waypoints, or None
+    url = osrm_url(points)
+    with osrm.call(url) as call:
+        response = osrm.session.get(url, timeout=OSRM_TIMEOUT)
+        call.status, call.received = response.status_code, len(response.content)
+    return parse_osrm_response(response)
+
+
+async def osrm_route_async(client, points):
+    url = osrm_url(points)
+    async with osrm.call_async(url) as call:
+        response = await client.get(url, timeout=OSRM_TIMEOUT)
+        call.status, call.received = response.status_code, len(response.content)
+    return parse_osrm_response(response)
+
+
+def leg_key(start_coords, end_coords):
+    return f"{start_coords['lat']:.5f},{start_coords['lon']:.5f};{end_coords['lat']:.5f},{end_coords['lon']:.5f}"
+
+
+def leg_from_result(key, result):
+    if result:
+        route, _ = result
+        leg = {
+            'coordinates': route['geometry']['coordinates'],
+            'distance': route['distance'] / 1000  # Convert to kilometers
+        }
+        leg_cache.set(key, leg)
+        return leg
+    return None
+
+
+def get_route_path(start_coords, end_coords):
+    # This function is used to get the actual route path and distance between two points using OSRM
+    key = leg_key(start_coords, end_coords)
+    cached = leg_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    try:
+        return leg_from_result(key, osrm_route([start_coords, end_coords]))
+    except Exception as e:
+        print(f"Error getting route path: {str(e)}")
+        return None
+
+
+async def get_route_path_async(client, start_coords, end_coords):
+    key = leg_key(start_coords, end_coords)
+    cached = leg_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    try:
+        return leg_from_result(key, await osrm_route_async(client, [start_coords, end_coords]))
+    except Exception as e:
+        print(f"Error getting route path: {str(e)}")
+        return None
+
+
+def split_geometry(coordinates, waypoints):
+    # OSRM gives one geometry for the whole route, we cut it where it passes through each waypoint.
+    # Every leg keeps both its endpoints, like a route asked for that leg alone.
+    cuts = [0]
+    for waypoint in waypoints[1:-1]:
+        lon, lat = waypoint['location']
+        start = cuts[-1]
+        best_index, best_distance = start, None
+        for index in range(start, len(coordinates)):
+            distance = (coordinates[index][0] - lon) ** 2 + (coordinates[index][1] - lat) ** 2
+            if best_distance is None or distance < best_distance:
+                best_index, best_distance = index, distance
+            # The geometry goes exactly through the snapped waypoint, so the first match is the right one
+            if distance < 1e-10:
+                break
+        cuts.append(best_index)
+    cuts.append(len(coordinates) - 1)
+    return [coordinates[cuts[i]:cuts[i + 1] + 1] for i in range(len(cuts) - 1)]
+
+
+def legs_from_result(points, result):
+    # Splits a route through all the points into its legs, or returns None if OSRM didn't route every leg
+    if result:
+        route, waypoints = result
+        legs = route.get('legs', [])
+        if len(legs) == len(points) - 1 and len(waypoints) == len(points):
+            leg_coordinates = split_geometry(route['geometry']['coordinates'], waypoints)
+            return [
+                {'coordinates': coordinates, 'distance': leg['distance'] / 1000}
+                for coordinates, leg in zip(leg_coordinates, legs)
+            ]
+    return None
+
+
+def cached_legs(points):
+    # Returns the cache keys of the legs, the cached legs (MISSING where not cached) and the
+    # (first, last) leg indices of every run of consecutive uncached legs
+    keys = [leg_key(points[i], points[i + 1]) for i in range(len(points) - 1)]
+    legs = [leg_cache.get(key) for key in keys]
+    runs = []
+    i = 0
+    while i < len(legs):
+        if legs[i] is not MISSING:
+            i += 1
+            continue
+        j = i
+        while j < len(legs) and legs[j] is MISSING:
+            j += 1
+        runs.append((i, j))
+        i = j
+    return keys, legs, runs
+
+
+def add_fetched_legs(keys, legs, first, fetched):
+    for offset, leg in enumerate(fetched):
+        legs[first + offset] = leg
+        if leg is not None:
+            leg_cache.set(keys[first + offset], leg)
+
+
+def get_route_legs(points):
+    # Returns one {'coordinates', 'distance'} entry per consecutive pair of points, or None for the legs
+    # OSRM could not route. Cached legs are reused, and every run of consecutive uncached legs is
+    # fetched with a single OSRM call through its points.
+    if len(points) < 2:
+        return []
+    keys, legs, runs = cached_legs(points)
+    for i, j in runs:
+        add_fetched_legs(keys, legs, i, fetch_route_legs(points[i:j + 1]))
+    return legs
+
+
+async def get_route_legs_async(client, points):
+    # The same as get_route_legs, with the runs of uncached legs fetched concurrently
+    if len(points) < 2:
+        return []
+    keys, legs, runs = cached_legs(points)
+    fetched = await asyncio.gather(*(fetch_route_legs_async(client, points[i:j + 1]) for i, j in runs))
+    for (i, _), run_legs in zip(runs, fetched):
+        add_fetched_legs(keys, legs, i, run_legs)
+    return legs
+
+
+def fetch_route_legs(points):
+    # We first try a single call through all the points, and if it fails
+    # we fetch the legs concurrently, one call per leg.
+    try:
+        legs = legs_from_result(points, osrm_route(points))
+        if legs is not None:
+            return legs
+        print("Multi-waypoint OSRM route failed, fetching the legs one by one")
+    except UpstreamUnavailable as e:
+        print(f"Skipping the OSRM legs: {str(e)}")
+        return [None] * (len(points) - 1)
+    except Exception as e:
+        print(f"Error getting multi-waypoint route: {str(e)}")
+
+    return list(routing_pool.map(lambda i: get_route_path(points[i], points[i + 1]), range(len(points) - 1)))
+
+
+async def fetch_route_legs_async(client, points):
+    try:
+        legs = legs_from_result(points, await osrm_route_async(client, points))
+        if legs is not None:
+            return legs
+        print("Multi-waypoint OSRM route failed, fetching the legs one by one")
+    except UpstreamUnavailable as e:
+        print(f"Skipping the OSRM legs: {str(e)}")
+        return [None] * (len(points) - 1)
+    except Exception as e:
+        print(f"Error getting multi-waypoint route: {str(e)}")
+
+    return list(await asyncio.gather(*(
+        get_route_path_async(client, points[i], points[i + 1]) for i in range(len(points) - 1)
+    )))
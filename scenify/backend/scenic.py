@@ -0,0 +1,251 @@
+# The route planning itself: distances, POI filtering, POI selection and ordering.
+# Nothing here talks to the network, so worker processes can import it without the web app.
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+from catalog import base_score
+from geo import coordinates, haversine, distance_matrix, path_length, distances_to_line
+from metrics import POIS
+from spatial import UnitVectorGrid
+from tsp import order_path
+
+def calculate_distance(point1, point2):
+    # We use this function to calculate the distance between two points using the Haversine formula. The returned value is the distance in kilometers.
+    # First we convert the latitude and longitude from degrees to radians
+    lat1, lon1 = radians(point1['lat']), radians(point1['lon'])
+    lat2, lon2 = radians(point2['lat']), radians(point2['lon'])
+    
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    r = 6371  # Radius of Earth in kilometers
+    
+    return c * r
+
+def distance_to_line(start, end, point):
+    # This function returns the perpendicular distance in km from `point` to the line origin->destination.
+    # We convert lat/lon to a vector in degrees
+    vec_se = [end['lat'] - start['lat'], end['lon'] - start['lon']]
+    vec_sp = [point['lat'] - start['lat'], point['lon'] - start['lon']]
+    
+    # Dot product and squared length
+    dot = vec_se[0]*vec_sp[0] + vec_se[1]*vec_sp[1]
+    len_sq = vec_se[0]**2 + vec_se[1]**2
+    
+    if len_sq == 0:
+        return calculate_distance(start, point)  # start == end corner case
+    
+    # Projection scalar
+    t = dot / len_sq
+    # Projected point (in degrees)
+    proj = [start['lat'] + t * vec_se[0], start['lon'] + t * vec_se[1]]
+    
+    # Return Haversine distance between `point` and its projection
+    return calculate_distance(point, {'lat': proj[0], 'lon': proj[1]})
+
+def is_poi_on_reasonable_path(start, end, poi, detour_ratio=1.5, min_proximity_km=30):
+    #This function returns True if:
+    #   1. The detour to visit the POI is reasonable (within detour_ratio)
+    #   2. The POI is not "beyond" the start/end points in terms of travel direction
+    #   3. The POI is not too close to start or end points (min_proximity_km)
+
+    # We check minimum distance from start and end points
+    start_distance = calculate_distance(start, poi)
+    end_distance = calculate_distance(end, poi)
+    
+    if start_distance < min_proximity_km or end_distance < min_proximity_km:
+        return False
+
+    # Then we check the detour ratio
+    direct = calculate_distance(start, end)
+    via_poi = calculate_distance(start, poi) + calculate_distance(poi, end)
+    
+    if via_poi > direct * detour_ratio:
+        return False
+
+    # Then we check if POI is between start and end in terms of direction
+    route_dir = get_route_direction(start, end)
+    
+    if route_dir == 'ns':
+        # For north-south routes, check latitude
+        if start['lat'] < end['lat']:  # Heading north
+            return poi['lat'] >= start['lat'] and poi['lat'] <= end['lat']
+        else:  # Heading south
+            return poi['lat'] <= start['lat'] and poi['lat'] >= end['lat']
+    else:  # east-west route
+        # For east-west routes, check longitude
+        if start['lon'] < end['lon']:  # Heading east
+            return poi['lon'] >= start['lon'] and poi['lon'] <= end['lon']
+        else:  # Heading west
+            return poi['lon'] <= start['lon'] and poi['lon'] >= end['lon']
+
+def get_route_direction(start, end):
+    #Used to determine if the route is primarily north-south or east-west.
+
+    lat_diff = abs(end['lat'] - start['lat'])
+    lon_diff = abs(end['lon'] - start['lon'])
+    return 'ns' if lat_diff > lon_diff else 'ew'
+
+def are_pois_too_close(poi1, poi2, min_distance_km=5):
+    # Used to check if two POIs are closer than 5km to each other
+    distance = calculate_distance(poi1, poi2)
+    return distance < min_distance_km
+
+def filter_pois_by_min_distance(pois, min_distance_km=5):
+    # This function filters POIs to ensure they are at least 5km apart by using are_pois_too_close function.
+    if not pois:
+        return []
+        
+    # We sort POIs again to makes sure the more notabile ones will be selected
+    sorted_pois = sorted(pois, key=lambda x: x.get('is_notable', False), reverse=True)
+    filtered_pois = [sorted_pois[0]] 
+
+    # The selected POIs go into a spatial grid, so we only compare a POI with the few selected ones around it
+    selected_grid = UnitVectorGrid(min_distance_km)
+    selected_grid.add(sorted_pois[0])
+    
+    # We try to add each remaining POI
+    for poi in sorted_pois[1:]:
+        too_close = False
+        for selected_poi in selected_grid.nearby(poi):
+            if are_pois_too_close(poi, selected_poi, min_distance_km):
+                too_close = True
+                break
+        
+        if not too_close:
+            filtered_pois.append(poi)
+            selected_grid.add(poi)
+    
+    print(f"Filtered from {len(pois)} to {len(filtered_pois)} POIs based on {min_distance_km}km minimum distance")
+    POIS.observe(len(filtered_pois), step="min_distance")
+    return filtered_pois
+
+def poi_base_score(poi):
+    # Score of a POI before we look at where it is. The POIs of the catalog come with it,
+    # plain dicts get it from their tags
+    score = poi.get('score')
+    if score is not None:
+        return score
+    return base_score(poi.get('tags', {}).get('heritage'), poi.get('is_notable', False))
+
+def poi_arrays(pois):
+    # The compact form of the POIs the solver needs: latitudes, longitudes and base scores
+    lats, lons = coordinates(pois)
+    return lats, lons, np.array([poi_base_score(poi) for poi in pois], dtype=float)
+
+# The insertion selection looks at the candidates in blocks of at least this many
+INSERTION_BLOCK = 128
+
+def select_pois_by_insertion(start_point, end_point, lats, lons, max_total_distance, max_pois):
+    # We go through the candidates in order and insert each one at the position of the current path where it
+    # adds the least distance, as long as the path stays within max_total_distance.
+    # The scan only moves forward, so every candidate is looked at once, against the path as it is when the scan
+    # gets to it: we compute the distances to the path for a block of candidates at a time, and the candidates
+    # after the last selected POI are mostly never computed. A block without any fitting candidate makes the
+    # next one twice as big, so a long scan takes few steps.
+    # Returns the indices of the selected candidates in path order and the path length.
+    path = [-1, -1]  # start and end are not candidates
+    path_lats, path_lons = [start_point['lat'], end_point['lat']], [start_point['lon'], end_point['lon']]
+    legs = np.array([calculate_distance(start_point, end_point)])
+    current_distance = legs[0]
+
+    position = 0
+    block_size = INSERTION_BLOCK
+    while position < len(lats) and len(path) - 2 < max_pois:
+        block = slice(position, position + block_size)
+        to_path = haversine(
+            np.array(path_lats)[:, None], np.array(path_lons)[:, None], lats[block], lons[block]).T
+        # Extra distance of putting each candidate between path[j] and path[j + 1], for every j
+        insertion_costs = to_path[:, :-1] + to_path[:, 1:] - legs
+        best_slots = insertion_costs.argmin(axis=1)
+        best_costs = insertion_costs[np.arange(len(to_path)), best_slots]
+        fitting = np.flatnonzero(current_distance + best_costs <= max_total_distance)
+        if not len(fitting):
+            position += len(to_path)
+            block_size *= 2
+            continue
+
+        first = fitting[0]
+        index = position + first
+        slot = best_slots[first]
+        path.insert(slot + 1, index)
+        path_lats.insert(slot + 1, lats[index])
+        path_lons.insert(slot + 1, lons[index])
+        legs = np.concatenate([legs[:slot], to_path[first, slot:slot + 2], legs[slot + 1:]])
+        current_distance += best_costs[first]
+        position = index + 1
+        block_size = INSERTION_BLOCK
+
+    return path[1:-1], float(current_distance)
+
+def solve_scenic_route(start_point, end_point, pois, max_detour_factor=1.5, max_pois=15):
+    # Solve for a scenic route that:
+    #   1. Starts at start_point
+    #   2. Ends visit end_point
+    #   3. Includes up to max_pois points that don't exceed max_detour_factor
+    #   4. Prioritizes notable POIs
+    #   5. Ensures POIs are at least 5km apart
+
+    print(f"\nCalculating the scenic route with {len(pois)} POIs and max detour factor {max_detour_factor}")
+    
+    if not pois:
+        return [start_point, end_point], 0
+
+    pois = filter_pois_by_min_distance(pois, min_distance_km=5)
+    order = order_scenic_route(start_point, end_point, *poi_arrays(pois), max_detour_factor, max_pois)
+    return route_from_order(start_point, end_point, pois, order)
+
+def order_scenic_route(start_point, end_point, lats, lons, base_scores, max_detour_factor=1.5, max_pois=15):
+    # Selects and orders the POIs of a scenic route from their compact form (see poi_arrays).
+    # Returns the indices of the selected POIs in visiting order.
+    direct_distance = calculate_distance(start_point, end_point)
+    max_total_distance = direct_distance * max_detour_factor
+    print(f"Direct distance: {direct_distance:.1f}km")
+    print(f"Maximum allowed distance: {max_total_distance:.1f}km")
+
+    # Sort POIs by score, we substract distance from direct route to prefer POIs closer to the route
+    scores = base_scores - distances_to_line(start_point, end_point, lats, lons)
+    by_score = np.argsort(-scores, kind='stable')
+
+    selected, current_distance = select_pois_by_insertion(
+        start_point, end_point, lats[by_score], lons[by_score], max_total_distance, max_pois
+    )
+    selected = [int(by_score[i]) for i in selected]
+
+    print(f"Selected {len(selected)} POIs")
+    POIS.observe(len(selected), step="selected")
+    print(f"Total route distance: {current_distance:.1f}km")
+    
+    # If we found POIs, solve the order using TSP (Traveling Salesman Problem)
+    if not selected:
+        return []
+
+    # All the distances (in meters) are computed once, the solver only reads them
+    points_lats = np.concatenate([[start_point['lat']], lats[selected], [end_point['lat']]])
+    points_lons = np.concatenate([[start_point['lon']], lons[selected], [end_point['lon']]])
+    matrix = (distance_matrix(points_lats, points_lons) * 1000).astype(int).tolist()
+    return [selected[i - 1] for i in order_path(matrix)[1:-1]]
+
+def route_from_order(start_point, end_point, pois, order):
+    # Builds the route (start, POIs, end) returned by solve_scenic_route from the ordered POI indices
+    if not order:
+        return [start_point, end_point], 0
+    selected_pois = [pois[i] for i in order]
+
+    # Print in console selected heritage=1 POIs
+    heritage_1_selected = [poi for poi in selected_pois if poi.get('is_unesco')]
+    if heritage_1_selected:
+        print("\nSelected heritage=1 POIs:")
+        for poi in heritage_1_selected:
+            print(f"  - {poi['name']}")
+
+    ordered_route = [start_point] + selected_pois + [end_point]
+
+    # Calculate the final route distance after optimization (using Haversine formula)
+    final_distance = path_length(*coordinates(ordered_route))
+    print(f"Final optimized route distance: {final_distance:.1f}km")
+
+    return ordered_route, len(selected_pois)
@@ -0,0 +1,106 @@
+# Coalesces identical calls that run at the same time: the first caller for a key does the work, the
+# callers that arrive while it is in flight wait for it and get the same result (or the same error).
+# Nothing is kept once the call is done, caching the result is the job of the caches.
+import asyncio
+import os
+import threading
+import weakref
+
+COALESCE_REQUESTS = os.environ.get("SCENIFY_COALESCE_REQUESTS", "1") != "0"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self, name, enabled=COALESCE_REQUESTS):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Tasks are bound to their event loop, so async calls are coalesced per loop
+        self._tasks = weakref.WeakKeyDictionary()
+        self.calls = 0
+        self.deduplicated = 0
+
+    def _count(self, shared):
+        with self._lock:
+            self.calls += 1
+            if shared:
+                self.deduplicated += 1
+
+    def do(self, key, fn, *args):
+        if not self.enabled:
+            self._count(False)
+            return fn(*args)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._count(not leader)
+
+        if not leader:
+            print(f"{self.name}: joining an identical call already in flight")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            # Even when the leader is interrupted (KeyboardInterrupt, SystemExit) the waiters get its error
+            # instead of a None result
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn, *args):
+        if not self.enabled:
+            self._count(False)
+            return await fn(*args)
+        loop = asyncio.get_running_loop()
+        # Other threads run event loops too (the one of the Flask event streams) and read the stats, so the task
+        # dicts only change under the lock
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            leader = task is None
+            if leader:
+                # The work runs in its own task, so a caller that goes away doesn't cancel it for the others
+                task = tasks[key] = asyncio.ensure_future(fn(*args))
+        self._count(not leader)
+
+        if leader:
+            task.add_done_callback(lambda done: self._finish(tasks, key, done))
+        else:
+            print(f"{self.name}: joining an identical call already in flight")
+        return await asyncio.shield(task)
+
+    def _finish(self, tasks, key, task):
+        with self._lock:
+            tasks.pop(key, None)
+        # We look at the error so a failed call nobody waits for anymore isn't reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls) + sum(len(tasks) for tasks in list(self._tasks.values()))
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "deduplicated": self.deduplicated,
+                "in_flight": in_flight,
+                "deduplicated_rate": self.deduplicated / self.calls if self.calls else 0.0
+            }
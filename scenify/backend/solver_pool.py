@@ -0,0 +1,95 @@
+# Solves several scenic route profiles (detour factor + number of POIs) for the same POIs at the same time,
+# each one in a worker process. The workers stay alive between requests with OR-Tools already imported,
+# and they only receive the compact form of the POIs (coordinates and base scores), not the full dicts.
+# The metrics a worker records are sent back with the order and added to the ones of the web process.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import recording, replay
+from scenic import filter_pois_by_min_distance, poi_arrays, order_scenic_route, route_from_order
+
+# 0 solves the profiles one after the other in the web process
+SOLVER_PROCESSES = int(os.environ.get("SCENIFY_SOLVER_PROCESSES", 2))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _warm_up():
+    # Runs once in every worker, so the first request doesn't pay for loading OR-Tools
+    from tsp import solve_path_with_ortools
+    solve_path_with_ortools([[0, 1, 2, 3], [1, 0, 1, 2], [2, 1, 0, 1], [3, 2, 1, 0]])
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # We spawn the workers instead of forking them, the web process already runs threads
+            _pool = ProcessPoolExecutor(
+                max_workers=SOLVER_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def order_scenic_route_recorded(*args):
+    # order_scenic_route in a worker, returns the order and the metrics it recorded
+    with recording() as observations:
+        order = order_scenic_route(*args)
+    return order, observations
+
+
+def recorded_order(future):
+    order, observations = future.result()
+    replay(observations)
+    return order
+
+
+def compact_problem(start_point, end_point, pois):
+    # The minimum distance filter doesn't depend on the profile, we only run it once.
+    # Returns the filtered POIs and the compact form of the problem sent to the workers.
+    pois = filter_pois_by_min_distance(pois, min_distance_km=5)
+    lats, lons, base_scores = poi_arrays(pois)
+    start = {'lat': start_point['lat'], 'lon': start_point['lon']}
+    end = {'lat': end_point['lat'], 'lon': end_point['lon']}
+    return pois, (start, end, lats, lons, base_scores)
+
+
+def order_profiles(problem, profiles):
+    # Returns the visiting order (indices into the filtered POIs) of every profile
+    if SOLVER_PROCESSES > 0:
+        try:
+            pool = get_pool()
+            futures = [
+                pool.submit(order_scenic_route_recorded, *problem, detour, max_pois) for detour, max_pois in profiles
+            ]
+            return [recorded_order(future) for future in futures]
+        except BrokenProcessPool:
+            print("The solver pool broke down, solving in this process")
+            _reset_pool()
+    return [order_scenic_route(*problem, detour, max_pois) for detour, max_pois in profiles]
+
+
+def solve_route_profiles(start_point, end_point, pois, profiles):
+    # profiles is a list of (max_detour_factor, max_pois) pairs.
+    # Returns one (route, number of POIs) pair per profile, like solve_scenic_route does.
+    print(f"\nCalculating {len(profiles)} scenic routes with {len(pois)} POIs")
+    if not pois:
+        return [([start_point, end_point], 0) for _ in profiles]
+
+    pois, problem = compact_problem(start_point, end_point, pois)
+    orders = order_profiles(problem, profiles)
+    return [route_from_order(start_point, end_point, pois, order) for order in orders]
@@ -0,0 +1,36 @@
+# A grid of buckets over 3D unit vectors, used to find the points near a given point in roughly constant time.
+# Working on the unit sphere instead of lat/lon keeps the cells the same size everywhere,
+# with no special cases near the poles or the antimeridian.
+from math import radians, sin, cos, floor
+
+EARTH_RADIUS_KM = 6371
+
+
+def unit_vector(lat, lon):
+    lat, lon = radians(lat), radians(lon)
+    return cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat)
+
+
+class UnitVectorGrid:
+    # Two points closer than radius_km along the surface are closer than radius_km / R in a straight line,
+    # so they always end up in the same or in neighbouring cells when the cell side is radius_km / R.
+    # nearby() returns a superset of the items within radius_km, callers do the exact distance check.
+
+    def __init__(self, radius_km):
+        # A tiny margin so rounding never pushes a point at exactly radius_km two cells away
+        self.cell_size = radius_km / EARTH_RADIUS_KM * (1 + 1e-9)
+        self.cells = {}
+
+    def _cell(self, lat, lon):
+        x, y, z = unit_vector(lat, lon)
+        return floor(x / self.cell_size), floor(y / self.cell_size), floor(z / self.cell_size)
+
+    def add(self, point):
+        self.cells.setdefault(self._cell(point['lat'], point['lon']), []).append(point)
+
+    def nearby(self, point):
+        cx, cy, cz = self._cell(point['lat'], point['lon'])
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    yield from self.cells.get((cx + dx, cy + dy, cz + dz), ())
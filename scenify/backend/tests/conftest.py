@@ -0,0 +1,6 @@
+# The backend modules import each other by name (import cache, import upstream), so the tests need the backend
+# directory on the path wherever pytest is started from
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
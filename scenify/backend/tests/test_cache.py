@@ -0,0 +1,75 @@
+import pytest
+
+import cache
+from cache import MISSING, TieredCache
+
+
+class Clock:
+    # Stands in for the time module of cache.py, the tests move it forward by hand
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_their_ttl(clock):
+    c = TieredCache("test", ttl=60, negative_ttl=10)
+    c.set("paris", {"lat": 48.85})
+    clock.now += 59
+    assert c.get("paris") == {"lat": 48.85}
+    clock.now += 2
+    assert c.get("paris") is MISSING
+    assert c.stats()["entries"] == 0
+
+
+def test_negative_entries_use_their_own_ttl(clock):
+    c = TieredCache("test", ttl=60, negative_ttl=10)
+    c.set("nowhere", None)
+    assert c.get("nowhere") is None
+    assert c.stats()["negative_hits"] == 1
+    clock.now += 11
+    assert c.get("nowhere") is MISSING
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = TieredCache("test", max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is MISSING
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+
+
+def test_disk_tier_outlives_the_memory_tier(tmp_path, clock):
+    db_path = str(tmp_path / "cache.sqlite")
+    TieredCache("test", ttl=60, db_path=db_path).set("paris", [48.85, 2.35])
+    reopened = TieredCache("test", ttl=60, db_path=db_path)
+    assert reopened.get("paris") == [48.85, 2.35]
+    assert reopened.stats()["disk_hits"] == 1
+    clock.now += 61
+    assert TieredCache("test", ttl=60, db_path=db_path).get("paris") is MISSING
+    assert reopened.purge_expired() == 1
+
+
+def test_weight_bound_evicts_but_keeps_the_newest_entry():
+    c = TieredCache("test", max_entries=100, max_weight=5, weigh=len)
+    c.set("a", [1, 2])
+    c.set("b", [1, 2])
+    c.set("c", [1, 2])
+    assert c.get("a") is MISSING
+    assert c.stats()["weight"] == 4
+    c.set("big", list(range(10)))
+    assert c.get("b") is MISSING and c.get("c") is MISSING
+    assert c.get("big") == list(range(10))
+    assert c.stats()["weight"] == 10
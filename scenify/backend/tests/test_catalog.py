@@ -0,0 +1,50 @@
+import json
+
+from catalog import build_catalog, catalog_from_elements, category_mask, classify_element, merge_catalogs
+
+
+def element(id, lat, lon, el_type="node", **tags):
+    return {"type": el_type, "id": id, "lat": lat, "lon": lon, "tags": tags}
+
+
+ELEMENTS = [
+    element(1, 48.85, 2.35, name="Musée du Louvre", tourism="museum", wikipedia="en:Louvre"),
+    element(2, 48.80, 2.12, name="Château de Versailles", historic="castle", heritage="1"),
+    element(3, 45.83, 6.86, name="Mont Blanc", natural="peak", wikidata="Q583"),
+    element(4, 47.32, 5.04, name="Tour de Bar", building="tower"),
+    element(5, 47.00, 5.00, tourism="museum"),
+]
+
+
+def test_classify_element():
+    row = dict(zip(
+        ("osm_type", "osm_id", "lat", "lon", "name", "original_name", "type", "subtype", "is_unesco",
+         "is_notable", "score", "category", "tags_json"),
+        classify_element(ELEMENTS[0])
+    ))
+    assert row["name"] == "Louvre" and row["original_name"] == "Musée du Louvre"
+    assert (row["type"], row["subtype"]) == ("tourism", "Museum")
+    assert row["is_notable"] and not row["is_unesco"] and row["score"] == 1000
+    assert json.loads(row["tags_json"]) == ELEMENTS[0]["tags"]
+    assert classify_element(ELEMENTS[1])[6:11] == ("historic", "UNESCO Site", True, False, 3000)
+    # No name, no POI
+    assert classify_element(ELEMENTS[4]) is None
+
+
+def test_merge_keeps_every_element_once():
+    first = catalog_from_elements(ELEMENTS[:3])
+    second = catalog_from_elements(ELEMENTS[1:4])
+    merged = merge_catalogs([first, second, build_catalog([])])
+    assert merged["osm_id"].tolist() == [1, 2, 3, 4]
+    inside = merge_catalogs([first, second], bbox=(48.0, 2.0, 49.0, 3.0))
+    assert inside["osm_id"].tolist() == [1, 2]
+
+
+def test_category_mask():
+    catalog = merge_catalogs([catalog_from_elements(ELEMENTS)])
+    categories = [{"type": "tourism", "subtype": "museum"}, {"type": "natural", "subtype": "Peak"}]
+    assert catalog["osm_id"][category_mask(catalog, categories)].tolist() == [1, 3]
+    # Categories without a bit (from a building tag) are compared one by one
+    others = [{"type": "historic", "subtype": "tower"}]
+    assert catalog["osm_id"][category_mask(catalog, others)].tolist() == [4]
+    assert not category_mask(catalog, []).any()
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from overpass import ElementParser, is_poi_element, parse_elements
+
+ELEMENTS = [
+    {"type": "node", "id": 1, "lat": 48.8584, "lon": 2.2945, "tags": {"name": "Tour Eiffel", "tourism": "viewpoint"}},
+    {"type": "node", "id": 2, "lat": 41.4036, "lon": 2.1744,
+     "tags": {"name": "Basílica de la Sagrada Família", "historic": "church", "note": "[ ] { } , \""}},
+    {"type": "node", "id": 3, "lat": 45.0, "lon": 7.0, "tags": {"natural": "peak"}},
+    {"type": "way", "id": 4, "tags": {"name": "Château de Chambord", "historic": "castle"}},
+    {"type": "node", "id": 5, "lat": 35.0116, "lon": 135.7681, "tags": {"name": "清水寺", "historic": "monastery"}},
+]
+
+ANSWER = json.dumps({
+    "version": 0.6,
+    "osm3s": {"copyright": "The data included in this document is from www.openstreetmap.org."},
+    "elements": ELEMENTS,
+    "remark": "runtime error: Query timed out"
+}, ensure_ascii=False, indent=1).encode("utf-8")
+
+POIS = [el for el in ELEMENTS if is_poi_element(el)]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 31, 64, 1000, len(ANSWER)])
+def test_any_chunk_boundary_gives_the_same_elements(size):
+    # One byte chunks cut the "elements" key, the elements and the multi-byte characters of the names
+    parser = ElementParser()
+    assert parse_elements(chunked(ANSWER, size), parser) == POIS
+    assert parser.parsed == len(ELEMENTS)
+    assert parser.received == len(ANSWER)
+
+
+def test_every_split_in_two():
+    for split in range(1, len(ANSWER)):
+        assert parse_elements([ANSWER[:split], ANSWER[split:]]) == POIS
+
+
+def test_compact_answer():
+    answer = json.dumps({"elements": ELEMENTS}, separators=(",", ":")).encode()
+    assert parse_elements(chunked(answer, 5)) == POIS
+
+
+def test_empty_elements():
+    assert parse_elements([b'{"elements": [', b' ]}']) == []
+
+
+def test_truncated_answer_fails():
+    with pytest.raises(ValueError):
+        parse_elements(chunked(ANSWER[:len(ANSWER) // 2], 10))
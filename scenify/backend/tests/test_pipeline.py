@@ -0,0 +1,46 @@
+import json
+
+from pipeline import compact_event, compact_routes, requested_tags
+from pois import Poi, point_json
+
+TAGS = {"name": "Mont Saint-Michel", "heritage": "1", "historic": "monastery", "wikidata": "Q20892"}
+
+
+def route():
+    poi = Poi("Mont Saint-Michel", "Mont Saint-Michel", 48.636, -1.511, True, True, "historic", "UNESCO Site", 3000,
+              json.dumps(TAGS))
+    start, end = {"lat": 48.85, "lon": 2.35, "name": "Paris"}, {"lat": 47.22, "lon": -1.55, "name": "Nantes"}
+    return {"name": "Most Scenic Route", "points": [start, point_json(poi), end],
+            "path": [[2.35, 48.85], [-1.511, 48.636], [-1.55, 47.22]], "distance": 700000}
+
+
+def routes():
+    return {"fastest_route": route(), "scenic_routes": [route(), route()]}
+
+
+def test_tags_only_on_request():
+    assert not requested_tags({})
+    assert requested_tags({"includeTags": True})
+    plain = compact_routes(routes(), None)
+    assert all("tags" not in point for point in plain["scenic_routes"][0]["points"])
+    assert plain["scenic_routes"][0]["path"] == route()["path"]
+    tagged = compact_routes(routes(), None, include_tags=True)
+    assert tagged["scenic_routes"][1]["points"][1]["tags"] == TAGS
+    assert "tags" not in tagged["scenic_routes"][1]["points"][0]
+
+
+def test_polyline_routes_keep_the_requested_tags():
+    tagged = compact_routes(routes(), 12, include_tags=True)
+    assert "path" not in tagged["fastest_route"] and tagged["fastest_route"]["polyline"]
+    assert tagged["fastest_route"]["points"][1]["tags"] == TAGS
+
+
+def test_stream_events_drop_the_tags():
+    solved = {"index": 1, "name": "Most Scenic Route", "points": route()["points"], "poi_count": 1}
+    assert "tags" not in compact_event("solved", solved, None)[1]["points"][1]
+    assert compact_event("solved", solved, None, include_tags=True)[1]["points"][1]["tags"] == TAGS
+    event, data = compact_event("route", {"kind": "scenic", "index": 1, "route": route()}, None)
+    assert "tags" not in data["route"]["points"][1]
+    event, data = compact_event("done", routes(), None, include_tags=True)
+    assert data["scenic_routes"][0]["points"][1]["tags"] == TAGS
+    assert compact_event("pois", {"count": 3}, None) == ("pois", {"count": 3})
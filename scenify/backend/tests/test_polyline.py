@@ -0,0 +1,78 @@
+import random
+from math import cos, radians
+
+import pytest
+
+from polyline import decode_polyline, encode_polyline, simplify, without_repeats
+
+
+def test_encode_matches_the_reference_example():
+    # The example of the polyline algorithm documentation, as [lon, lat] pairs
+    points = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert encode_polyline(points) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@") == points
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_decode_gives_back_the_rounded_points(precision):
+    rng = random.Random(precision)
+    points = [[rng.uniform(-180, 180), rng.uniform(-85, 85)] for _ in range(200)]
+    decoded = decode_polyline(encode_polyline(points, precision), precision)
+    assert len(decoded) == len(points)
+    for (lon, lat), (decoded_lon, decoded_lat) in zip(points, decoded):
+        assert decoded_lon == pytest.approx(lon, abs=0.6 / 10 ** precision)
+        assert decoded_lat == pytest.approx(lat, abs=0.6 / 10 ** precision)
+
+
+def test_without_repeats():
+    assert without_repeats([[1, 2], [1, 2], [3, 4], [3, 4], [1, 2]]) == [[1, 2], [3, 4], [1, 2]]
+
+
+def segment_distance(point, start, end, scale):
+    px, py = (point[0] - start[0]) * scale, point[1] - start[1]
+    dx, dy = (end[0] - start[0]) * scale, end[1] - start[1]
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else min(1.0, max(0.0, (px * dx + py * dy) / length_sq))
+    return ((px - t * dx) ** 2 + (py - t * dy) ** 2) ** 0.5
+
+
+def random_walk(count, seed):
+    rng = random.Random(seed)
+    lon, lat = 2.35, 48.85
+    points = []
+    for _ in range(count):
+        lon += rng.uniform(-0.001, 0.001)
+        lat += rng.uniform(-0.001, 0.001)
+        points.append([lon, lat])
+    return points
+
+
+@pytest.mark.parametrize("count", [3, 10, 64, 65, 500, 5000])
+@pytest.mark.parametrize("tolerance", [1e-5, 1e-4, 1e-3])
+def test_simplified_path_stays_within_the_tolerance(count, tolerance):
+    points = random_walk(count, count)
+    simplified = simplify(points, tolerance)
+    assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    # The kept points are points of the path, in their order
+    kept = [points.index(point) for point in simplified]
+    assert kept == sorted(kept)
+    scale = cos(radians(sum(lat for _, lat in points) / len(points)))
+    for first, last in zip(kept, kept[1:]):
+        for point in points[first + 1:last]:
+            assert segment_distance(point, points[first], points[last], scale) <= tolerance
+
+
+def test_straight_line_keeps_its_ends():
+    points = [[2.0 + i * 0.01, 48.0 + i * 0.01] for i in range(100)]
+    assert simplify(points, 1e-6) == [points[0], points[-1]]
+
+
+def test_u_turn_is_kept():
+    # Every point is on the line through the ends, but the path goes past the end and back
+    points = [[0.0, 0.0], [0.0, 1.0], [0.0, 2.0], [0.0, 1.5]]
+    assert simplify(points, 0.01) == [[0.0, 0.0], [0.0, 2.0], [0.0, 1.5]]
+
+
+def test_short_paths_are_unchanged():
+    assert simplify([], 0.1) == []
+    assert simplify([[1.0, 2.0], [3.0, 4.0]], 0.1) == [[1.0, 2.0], [3.0, 4.0]]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize("error", [ValueError("Overpass is down"), Interrupted()])
+def test_waiters_get_the_error_of_the_leader(error):
+    flights = SingleFlight("test", enabled=True)
+    release = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        release.wait(5)
+        raise error
+
+    outcomes = []
+
+    def join():
+        try:
+            outcomes.append(flights.do("key", fail))
+        except BaseException as e:
+            outcomes.append(e)
+
+    leader = threading.Thread(target=join)
+    leader.start()
+    wait_for(lambda: calls)
+    waiter = threading.Thread(target=join)
+    waiter.start()
+    wait_for(lambda: flights.stats()["deduplicated"] == 1)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert outcomes == [error, error]
+    assert len(calls) == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_a_failed_call_is_not_kept():
+    flights = SingleFlight("test", enabled=True)
+    with pytest.raises(ValueError):
+        flights.do("key", int, "not a number")
+    assert flights.do("key", int, "42") == 42
+
+
+def test_async_waiters_get_the_error_of_the_leader():
+    flights = SingleFlight("test", enabled=True)
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("Overpass is down")
+
+    async def main():
+        outcomes = await asyncio.gather(
+            flights.do_async("key", fail), flights.do_async("key", fail), return_exceptions=True
+        )
+        assert flights.stats()["in_flight"] == 0
+        return outcomes
+
+    outcomes = asyncio.run(main())
+    assert [type(outcome) for outcome in outcomes] == [ValueError, ValueError]
+    assert outcomes[0] is outcomes[1]
+    assert len(calls) == 1
+
+
+def test_a_waiter_going_away_does_not_cancel_the_call():
+    flights = SingleFlight("test", enabled=True)
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "routes"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do_async("key", slow))
+        second = asyncio.ensure_future(flights.do_async("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "routes"
@@ -0,0 +1,39 @@
+import itertools
+import random
+
+import pytest
+
+from tsp import order_path, path_cost, solve_exact_path
+
+
+def random_matrix(n, seed, symmetric=True):
+    rng = random.Random(seed)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(n):
+            if i != j and (not symmetric or i < j):
+                matrix[i][j] = rng.uniform(1, 100)
+                if symmetric:
+                    matrix[j][i] = matrix[i][j]
+    return matrix
+
+
+def brute_force_cost(matrix):
+    n = len(matrix)
+    return min(path_cost(matrix, [0, *middle, n - 1]) for middle in itertools.permutations(range(1, n - 1)))
+
+
+@pytest.mark.parametrize("n", [4, 5, 6, 7, 8])
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_exact_path_is_as_short_as_brute_force(n, symmetric):
+    for seed in range(5):
+        matrix = random_matrix(n, seed, symmetric)
+        order = solve_exact_path(matrix)
+        assert order[0] == 0 and order[-1] == n - 1
+        assert sorted(order) == list(range(n))
+        assert path_cost(matrix, order) == pytest.approx(brute_force_cost(matrix))
+
+
+def test_short_paths_keep_their_order():
+    assert order_path(random_matrix(3, 0)) == [0, 1, 2]
+    assert order_path(random_matrix(2, 0)) == [0, 1]
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import upstream
+from upstream import CircuitBreaker, Slots, TokenBucket, Upstream, UpstreamUnavailable
+
+
+class Clock:
+    # Stands in for the time module of upstream.py, the tests move it forward by hand
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream, "time", clock)
+    return clock
+
+
+def test_breaker_opens_after_failures_in_a_row(clock):
+    breaker = CircuitBreaker("test", failures=3, reset=30)
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("test", failures=1, reset=30)
+    breaker.record(False)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_successful_trial_closes_the_breaker(clock):
+    breaker = CircuitBreaker("test", failures=1, reset=30)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker("test", failures=5, reset=30)
+    for _ in range(5):
+        breaker.record(False)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_cancelled_trial_lets_another_one_through(clock):
+    breaker = CircuitBreaker("test", failures=1, reset=30)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(None)
+    assert breaker.allow()
+
+
+def test_open_breaker_fails_calls_at_once(clock):
+    service = Upstream("test", slots=1)
+    service.breaker = CircuitBreaker("test", failures=1, reset=30)
+    service.breaker.record(False)
+    with pytest.raises(UpstreamUnavailable):
+        with service.call("http://example.org/api"):
+            pass
+    assert service.stats()["rejected"] == 1
+    assert service.stats()["breaker"] == "open"
+
+
+def test_token_bucket_spaces_the_calls(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(10) == pytest.approx(1)
+    assert bucket.reserve(10) == pytest.approx(2)
+    assert bucket.reserve(1.5) is None
+    clock.now += 10
+    assert bucket.reserve(0) == 0
+
+
+def test_slots_are_shared_by_threads_and_event_loops():
+    slots = Slots(3)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def enter():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+
+    def leave():
+        with lock:
+            running[0] -= 1
+
+    def thread_calls():
+        for _ in range(20):
+            slots.acquire()
+            enter()
+            time.sleep(0.001)
+            leave()
+            slots.release()
+
+    async def loop_calls():
+        async def call():
+            for _ in range(10):
+                await slots.acquire_async()
+                enter()
+                await asyncio.sleep(0.001)
+                leave()
+                slots.release()
+        await asyncio.gather(*(call() for _ in range(3)))
+
+    threads = [threading.Thread(target=thread_calls) for _ in range(3)]
+    threads += [threading.Thread(target=asyncio.run, args=(loop_calls(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert peak[0] <= 3
+    assert slots.used == 0 and not slots.waiting
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    slots = Slots(1)
+
+    async def main():
+        await slots.acquire_async()
+        waiting = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        assert len(slots.waiting) == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert not slots.waiting
+        slots.release()
+        # The slot is free again, not held by the cancelled waiter
+        await asyncio.wait_for(slots.acquire_async(), 1)
+        slots.release()
+
+    asyncio.run(main())
+    assert slots.used == 0
+
+
+def test_waiter_cancelled_after_its_turn_passes_the_slot_on():
+    slots = Slots(1)
+
+    async def main():
+        await slots.acquire_async()
+        first = asyncio.ensure_future(slots.acquire_async())
+        second = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        # The slot goes to the first waiter, which is cancelled before it runs
+        slots.release()
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        assert first.cancelled()
+        slots.release()
+
+    asyncio.run(main())
+    assert slots.used == 0 and not slots.waiting
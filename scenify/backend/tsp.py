@@ -0,0 +1,135 @@
+# Orders the points of a route: start at the first point, end at the last one and visit all the others
+# with the shortest total distance. Works on a precomputed integer distance matrix (in meters).
+import os
+import time
+
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from metrics import SOLVER_OBJECTIVE_KM, SOLVER_SECONDS, SOLVER_SOLUTIONS, SOLVER_STOPS
+
+# Up to this many POIs we solve the order exactly with dynamic programming and skip OR-Tools. Held-Karp
+# doubles (and more) with every POI: about 8ms for 10 POIs, 18ms for 11, 40-75ms for 12 and 100ms for 13,
+# while OR-Tools with its time limit takes 40-60ms around there. Up to 11 the exact order is also the quicker one.
+EXACT_SOLVER_MAX_POIS = int(os.environ.get("SCENIFY_EXACT_SOLVER_MAX_POIS", 11))
+
+# The OR-Tools time limit grows with the number of points, up to SOLVER_MAX_SECONDS
+SOLVER_MAX_SECONDS = float(os.environ.get("SCENIFY_SOLVER_MAX_SECONDS", 2))
+SOLVER_SECONDS_PER_POINT = float(os.environ.get("SCENIFY_SOLVER_SECONDS_PER_POINT", 0.05))
+
+# The search also stops once this many solutions (per point) in a row did not improve the best one
+SOLVER_STALL_SOLUTIONS_PER_POINT = int(os.environ.get("SCENIFY_SOLVER_STALL_SOLUTIONS_PER_POINT", 25))
+
+
+def order_path(matrix):
+    # Returns the indices of the points in visiting order, always starting with 0 and ending with n - 1
+    n = len(matrix)
+    if n <= 3:
+        return list(range(n))
+    if n - 2 <= EXACT_SOLVER_MAX_POIS:
+        return solve_exact_path(matrix)
+    return solve_path_with_ortools(matrix)
+
+
+def path_cost(matrix, order):
+    return sum(matrix[order[i]][order[i + 1]] for i in range(len(order) - 1))
+
+
+def solve_exact_path(matrix):
+    # Held-Karp dynamic programming over the subsets of the middle points, O(2^k * k^2) for k middle points
+    started = time.perf_counter()
+    n = len(matrix)
+    k = n - 2
+    full = (1 << k) - 1
+    infinity = float('inf')
+    # best[mask][j] is the shortest path from the start through the points in mask, ending at middle point j
+    best = [[infinity] * k for _ in range(full + 1)]
+    parent = [[-1] * k for _ in range(full + 1)]
+    for j in range(k):
+        best[1 << j][j] = matrix[0][j + 1]
+
+    for mask in range(1, full + 1):
+        row = best[mask]
+        for j in range(k):
+            cost = row[j]
+            if cost == infinity:
+                continue
+            from_row = matrix[j + 1]
+            for nxt in range(k):
+                if mask & (1 << nxt):
+                    continue
+                next_mask = mask | (1 << nxt)
+                new_cost = cost + from_row[nxt + 1]
+                if new_cost < best[next_mask][nxt]:
+                    best[next_mask][nxt] = new_cost
+                    parent[next_mask][nxt] = j
+
+    last = min(range(k), key=lambda j: best[full][j] + matrix[j + 1][n - 1])
+    order = [n - 1]
+    mask = full
+    while last != -1:
+        order.append(last + 1)
+        mask, last = mask & ~(1 << last), parent[mask][last]
+    order.append(0)
+    order.reverse()
+    length_km = path_cost(matrix, order) / 1000
+    SOLVER_SECONDS.observe(time.perf_counter() - started, solver="exact")
+    SOLVER_OBJECTIVE_KM.observe(length_km, solver="exact")
+    print(f"Solved the order of {k} POIs exactly, length {length_km:.1f}km")
+    return order
+
+
+def solve_path_with_ortools(matrix):
+    n = len(matrix)
+    manager = pywrapcp.RoutingIndexManager(n, 1, [0], [n - 1])
+    routing = pywrapcp.RoutingModel(manager)
+
+    # The matrix lives on the C++ side, so evaluating an arc never calls back into Python
+    transit_index = routing.RegisterTransitMatrix(matrix)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.local_search_metaheuristic = (
+        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    time_limit = min(SOLVER_MAX_SECONDS, 0.1 + SOLVER_SECONDS_PER_POINT * n)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+
+    # Guided local search never stops by itself, we end it early when it stops improving
+    stall_limit = SOLVER_STALL_SOLUTIONS_PER_POINT * n
+    progress = {"best": None, "solutions": 0, "stalled": 0}
+
+    def on_solution():
+        cost = routing.CostVar().Value()
+        progress["solutions"] += 1
+        if progress["best"] is None or cost < progress["best"]:
+            progress["best"] = cost
+            progress["stalled"] = 0
+        else:
+            progress["stalled"] += 1
+            if progress["stalled"] >= stall_limit:
+                routing.solver().FinishCurrentSearch()
+
+    routing.AddAtSolutionCallback(on_solution)
+
+    started = time.perf_counter()
+    solution = routing.SolveWithParameters(search_parameters)
+    elapsed = time.perf_counter() - started
+    SOLVER_SECONDS.observe(elapsed, solver="ortools")
+    SOLVER_SOLUTIONS.observe(progress["solutions"])
+    if not solution:
+        SOLVER_STOPS.inc(reason="no_solution")
+        print(f"OR-Tools found no solution in {elapsed:.2f}s, keeping the selection order")
+        return list(range(n))
+
+    order = []
+    index = routing.Start(0)
+    while not routing.IsEnd(index):
+        order.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    order.append(manager.IndexToNode(index))
+    SOLVER_STOPS.inc(reason="stalled" if progress["stalled"] >= stall_limit else "time_limit")
+    SOLVER_OBJECTIVE_KM.observe(solution.ObjectiveValue() / 1000, solver="ortools")
+    print(f"OR-Tools ordered {n - 2} POIs in {elapsed:.2f}s after {progress['solutions']} solutions "
+          f"(limit {time_limit:.2f}s), length {solution.ObjectiveValue() / 1000:.1f}km")
+    return order
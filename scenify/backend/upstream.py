@@ -0,0 +1,392 @@
+# The client layer every call to Nominatim, Overpass and OSRM goes through. Every service gets:
+#   - one pooled requests.Session, so the calls reuse their keep-alive connections instead of a new TCP+TLS
+#     handshake each (the async calls go through the pooled httpx.AsyncClient of the caller)
+#   - a token bucket limiting its request rate, e.g. the 1 request per second Nominatim asks for.
+#     A call that would wait more than UPSTREAM_MAX_WAIT seconds for its turn fails at once instead
+#   - slots bounding the calls in flight at the same time across the process, Overpass only gives every IP a
+#     few. The worker threads and the calls on every event loop (the ASGI app, the Flask streams) share them
+#   - a circuit breaker: after BREAKER_FAILURES failed calls in a row the service is considered down and calls
+#     fail at once with UpstreamUnavailable for BREAKER_RESET seconds, then a single trial call decides whether
+#     it is back. The callers fall back to what they have: Haversine distances for OSRM, cached tiles for Overpass
+#   - latency statistics per host, on /api/upstream/stats and /metrics
+# Retries never sleep in a worker thread: call_later hands the next try back to the pool once the backoff is over.
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import add_collector, record_upstream, status_outcome
+
+BREAKER_FAILURES = int(os.environ.get("SCENIFY_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("SCENIFY_BREAKER_RESET", 30))
+UPSTREAM_MAX_WAIT = float(os.environ.get("SCENIFY_UPSTREAM_MAX_WAIT", 10))
+
+# The latency percentiles are computed over the last calls to every host
+LATENCY_WINDOW = 1000
+
+_upstreams = []
+
+
+class UpstreamUnavailable(Exception):
+    # Raised instead of calling a service that is down or too busy, answered with a 503
+    pass
+
+
+class TokenBucket:
+    # `rate` calls per second, with up to `burst` of them saved up. A call takes a token, or reserves
+    # the next one and waits for it, so waiting calls go out one after the other at the rate.
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        # Returns the seconds to wait before the call may go, or None (and reserves nothing) when
+        # that would be more than max_wait
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class Slots:
+    # At most `size` calls at once, taken by threads (acquire) and by coroutines on any event loop
+    # (acquire_async) alike. A released slot goes to the call that has waited longest, whichever kind it is.
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.lock = threading.Lock()
+        # How to hand a slot to every waiting call, in the order they came
+        self.waiting = deque()
+
+    def acquire(self):
+        with self.lock:
+            if self.used < self.size and not self.waiting:
+                self.used += 1
+                return
+            ready = threading.Event()
+            self.waiting.append(ready.set)
+        try:
+            ready.wait()
+        except BaseException:
+            self.give_up(ready.set)
+            raise
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.used < self.size and not self.waiting:
+                self.used += 1
+                return
+            ready = loop.create_future()
+
+            def grant():
+                # Raises RuntimeError when the loop is closed
+                loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+            self.waiting.append(grant)
+        try:
+            await ready
+        except BaseException:
+            self.give_up(grant)
+            raise
+
+    def give_up(self, grant):
+        # A waiting call was cancelled: it leaves the queue, or passes on the slot it was handed meanwhile
+        with self.lock:
+            try:
+                self.waiting.remove(grant)
+                return
+            except ValueError:
+                pass
+        self.release()
+
+    def release(self):
+        with self.lock:
+            while self.waiting:
+                try:
+                    self.waiting.popleft()()
+                    return
+                except RuntimeError:
+                    pass
+            self.used -= 1
+
+
+class CircuitBreaker:
+    # Closed, calls go through. Open after `failures` failed calls in a row, calls fail at once.
+    # Half open `reset` seconds later, one trial call goes through and closes it, or opens it again.
+
+    def __init__(self, name, failures, reset):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.failed = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.trial or time.monotonic() >= self.opened_at + self.reset:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() < self.opened_at + self.reset:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok):
+        # ok is None for a call that got no answer either way (cancelled), it only ends a trial
+        with self.lock:
+            if ok is None:
+                self.trial = False
+            elif ok:
+                if self.opened_at is not None:
+                    print(f"{self.name} is back, closing its circuit breaker")
+                self.failed = 0
+                self.opened_at = None
+                self.trial = False
+            else:
+                self.failed += 1
+                if self.trial or (self.opened_at is None and self.failed >= self.failures):
+                    print(f"{self.name} failed {self.failed} times in a row, failing fast for {self.reset:.0f}s")
+                    self.opened_at = time.monotonic()
+                    self.trial = False
+
+
+class Call:
+    # What the caller tells about one upstream call: the HTTP status and the bytes it received
+
+    def __init__(self, attempt):
+        self.attempt = attempt
+        self.status = None
+        self.received = 0
+        self.started = time.perf_counter()
+
+
+class HostStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(share):
+            return round(latencies[min(len(latencies) - 1, int(share * len(latencies)))] * 1000, 1)
+
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency_ms": {
+                "p50": percentile(0.5), "p95": percentile(0.95), "max": round(latencies[-1] * 1000, 1)
+            } if latencies else None
+        }
+
+
+class Upstream:
+
+    def __init__(self, name, rate=0.0, burst=1, slots=0, connections=10):
+        self.name = name
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = None
+        self.set_rate(rate, burst)
+        self.set_slots(slots)
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURES, BREAKER_RESET)
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+        self.hosts = {}
+        self.lock = threading.Lock()
+        _upstreams.append(self)
+
+    def set_rate(self, rate, burst=1):
+        # 0 lifts the rate limit, e.g. for a self-hosted server
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+
+    def set_slots(self, slots):
+        # 0 doesn't bound the calls in flight
+        self.slots = slots
+        self._slots = Slots(slots) if slots else None
+
+    def admit(self):
+        # Returns the seconds the call has to wait for its turn, or raises UpstreamUnavailable
+        if not self.breaker.allow():
+            with self.lock:
+                self.rejected += 1
+            raise UpstreamUnavailable(f"{self.name} is unavailable, try again later")
+        wait = self.bucket.reserve(UPSTREAM_MAX_WAIT) if self.bucket else 0.0
+        with self.lock:
+            if wait is None:
+                self.rejected += 1
+            else:
+                self.throttled_seconds += wait
+        if wait is None:
+            self.breaker.record(None)
+            raise UpstreamUnavailable(f"Too many requests waiting for {self.name}, try again later")
+        return wait
+
+    @contextlib.contextmanager
+    def call(self, url, attempt=0):
+        # Wraps one call to the service at url: the body sets the status (and the bytes received) on the Call
+        wait = self.admit()
+        slots = self._slots
+        try:
+            if wait:
+                time.sleep(wait)
+            if slots is not None:
+                slots.acquire()
+        except BaseException:
+            self.breaker.record(None)
+            raise
+        try:
+            with self.measure(url, attempt) as call:
+                yield call
+        finally:
+            if slots is not None:
+                slots.release()
+
+    @contextlib.asynccontextmanager
+    async def call_async(self, url, attempt=0):
+        wait = self.admit()
+        slots = self._slots
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            if slots is not None:
+                await slots.acquire_async()
+        except BaseException:
+            self.breaker.record(None)
+            raise
+        try:
+            with self.measure(url, attempt) as call:
+                yield call
+        finally:
+            if slots is not None:
+                slots.release()
+
+    @contextlib.contextmanager
+    def measure(self, url, attempt):
+        call = Call(attempt)
+        try:
+            yield call
+        except (requests.exceptions.Timeout, httpx.TimeoutException):
+            self.finish(url, call, "timeout")
+            raise
+        except Exception:
+            self.finish(url, call, "error")
+            raise
+        except BaseException:
+            # Cancelled, the call got no answer
+            self.breaker.record(None)
+            raise
+        self.finish(url, call, status_outcome(call.status) if call.status is not None else "ok")
+
+    def finish(self, url, call, outcome):
+        elapsed = time.perf_counter() - call.started
+        # A 429 or a bad request is an answer, only no answer or a server error counts against the breaker
+        failed = outcome in ("timeout", "error") or (call.status or 0) >= 500
+        record_upstream(self.name, outcome, call.started, call.received, call.attempt)
+        host = urlsplit(url).netloc
+        with self.lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = self.hosts[host] = HostStats()
+            stats.calls += 1
+            stats.failures += failed
+            stats.latencies.append(elapsed)
+        self.breaker.record(not failed)
+
+    def stats(self):
+        with self.lock:
+            hosts = {host: stats.as_dict() for host, stats in self.hosts.items()}
+            rejected, throttled = self.rejected, self.throttled_seconds
+        return {
+            "name": self.name,
+            "breaker": self.breaker.state,
+            "rate": self.bucket.rate if self.bucket else None,
+            "slots": self.slots or None,
+            "rejected": rejected,
+            "throttled_seconds": round(throttled, 3),
+            "hosts": hosts
+        }
+
+
+def upstream_stats():
+    return {upstream.name: upstream.stats() for upstream in _upstreams}
+
+
+def upstream_metrics():
+    stats = [upstream.stats() for upstream in _upstreams]
+    return [
+        ("scenify_upstream_breaker_open", "gauge", "1 while the circuit breaker of a service is open or half open",
+         [({"service": s["name"]}, int(s["breaker"] != "closed")) for s in stats]),
+        ("scenify_upstream_rejected_total", "counter", "Calls failed at once by the breaker or the rate limit",
+         [({"service": s["name"]}, s["rejected"]) for s in stats]),
+        ("scenify_upstream_throttled_seconds_total", "counter", "Time calls waited for the rate limit",
+         [({"service": s["name"]}, s["throttled_seconds"]) for s in stats]),
+    ]
+
+
+add_collector(upstream_metrics)
+
+
+# The calls scheduled by call_later, as (time, sequence, fn)
+_later = []
+_later_sequence = itertools.count()
+_later_ready = threading.Condition()
+_later_thread = None
+
+
+def call_later(delay, fn):
+    # Runs fn on a scheduler thread after delay seconds. fn has to be quick, it should only hand the work over
+    # (submit it to a pool), so a retry waiting for its backoff doesn't hold a worker.
+    global _later_thread
+    with _later_ready:
+        heapq.heappush(_later, (time.monotonic() + delay, next(_later_sequence), fn))
+        if _later_thread is None:
+            _later_thread = threading.Thread(target=_run_later, name="upstream-later", daemon=True)
+            _later_thread.start()
+        _later_ready.notify()
+
+
+def _run_later():
+    while True:
+        with _later_ready:
+            while not _later or _later[0][0] > time.monotonic():
+                _later_ready.wait(_later[0][0] - time.monotonic() if _later else None)
+            _, _, fn = heapq.heappop(_later)
+        try:
+            fn()
+        except Exception as e:
+            print(f"Error in a scheduled upstream call: {str(e)}")
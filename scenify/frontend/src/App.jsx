@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { Container, CssBaseline, ThemeProvider, createTheme, Box, Button } from '@mui/material';
+import { Container, CssBaseline, ThemeProvider, createTheme, Box, Button, Alert } from '@mui/material';
 import RestartAltIcon from '@mui/icons-material/RestartAlt';
 import { BrowserRouter as Router, Routes, Route, useNavigate } from 'react-router-dom';
 import 'ol/ol.css'; 
@@ -181,6 +181,12 @@ const MainApp = () => {
               Plan New Route
             </Button>
 
+            {error && (
+              <Alert severity="error" onClose={() => setError(null)} sx={{ width: '100%', maxWidth: '600px' }}>
+                {error}
+              </Alert>
+            )}
+
             <Box sx={{ width: '100%' }}>
               <RouteList 
                 routes={routes} 
@@ -6,6 +6,7 @@ import { OSM } from 'ol/source';
 import Feature from 'ol/Feature';
 import Point from 'ol/geom/Point';
 import LineString from 'ol/geom/LineString';
+import Polyline from 'ol/format/Polyline';
 import { Vector as VectorLayer } from 'ol/layer';
 import { Vector as VectorSource } from 'ol/source';
 import { Style, Icon, Stroke, Circle, Fill } from 'ol/style';
@@ -79,10 +80,18 @@ const MapDisplay = ({ selectedRoute, loading }) => {
   const updateMap = (route) => {
     if (!route?.points || route.points.length < 2) return;
     const vectorSource = new VectorSource();
-    if (route.path && route.path.length > 0) {
-      const pathCoords = route.path.map(coord => fromLonLat([coord[0], coord[1]]));
+    let geometry = null;
+    if (route.polyline) {
+      geometry = new Polyline().readGeometry(route.polyline, {
+        dataProjection: 'EPSG:4326',
+        featureProjection: 'EPSG:3857'
+      });
+    } else if (route.path && route.path.length > 0) {
+      geometry = new LineString(route.path.map(coord => fromLonLat([coord[0], coord[1]])));
+    }
+    if (geometry) {
       const routeFeature = new Feature({
-        geometry: new LineString(pathCoords)
+        geometry
       });
 
       routeFeature.setStyle(new Style({
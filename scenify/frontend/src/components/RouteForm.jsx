@@ -10,7 +10,7 @@ import {
   Fade,
   ToggleButton
 } from '@mui/material';
-import axios from 'axios';
+import { streamRoutes } from '../services/routeService';
 import MuseumIcon from '@mui/icons-material/Museum';
 import CastleIcon from '@mui/icons-material/Castle';
 import AccountBalanceIcon from '@mui/icons-material/AccountBalance';
@@ -24,7 +24,20 @@ import PhotoCameraIcon from '@mui/icons-material/PhotoCamera';
 import SwitchAccessShortcutIcon from '@mui/icons-material/SwitchAccessShortcut';
 import WarningAmberIcon from '@mui/icons-material/WarningAmber';
 
-const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000/api';
+const progressMessage = (event, data) => {
+  switch (event) {
+    case 'geocoded':
+      return 'Found both locations, searching for points of interest...';
+    case 'tiles':
+      return `Searching for points of interest (${Math.round((100 * data.done) / Math.max(data.total, 1))}%)`;
+    case 'pois':
+      return `Found ${data.count} points of interest, planning the scenic routes...`;
+    case 'solved':
+      return `Planned the ${data.name} with ${data.poi_count} points of interest`;
+    default:
+      return null;
+  }
+};
 
 const CATEGORIES = [
   { id: 'museum', label: 'Museum', icon: <MuseumIcon />, type: 'tourism', subtype: 'museum' },
@@ -132,28 +145,38 @@ const RouteForm = ({
     setError(null);
     setIsSubmitting(true);
     setProgressMessages([]);
+    // Once the direct route is shown, App shows the map instead of this form, which is unmounted: the errors
+    // that come after it go to App (setError), not to the form
+    let routeShown = false;
     
     try {
       const selectedCategoryDetails = CATEGORIES
         .filter(cat => selectedCategories.includes(cat.id))
         .map(cat => ({ type: cat.type, subtype: cat.subtype }));
 
-      const response = await axios.post(`${API_URL}/routes`, {
+      // The routes come in one by one, the map shows the direct route while the scenic ones are planned
+      const scenicRoutes = [];
+      const routesData = await streamRoutes(
         startLocation,
         endLocation,
-        poiCount: 15,
-        categories: selectedCategoryDetails
-      });
-      
-      const routesData = response.data;
-      
-      if (routesData.error) {
-        console.error('API returned error:', routesData.error);
-        const formattedError = formatErrorMessage(routesData.error);
-        setFormError(formattedError);
-        return;
-      }
-      
+        15,
+        selectedCategoryDetails,
+        (event, data) => {
+          const message = progressMessage(event, data);
+          if (message) {
+            setProgressMessages(messages => [...messages, message]);
+          }
+          if (event === 'route' && data.kind === 'fastest') {
+            routeShown = true;
+            setRoutes(current => ({ ...current, fastest_route: data.route }));
+            setSelectedRoute(data.route);
+          } else if (event === 'route') {
+            scenicRoutes[data.index] = data.route;
+            setRoutes(current => ({ ...current, scenic_routes: scenicRoutes.filter(Boolean) }));
+          }
+        }
+      );
+
       const safeRoutesData = {
         fastest_route: routesData.fastest_route || null,
         scenic_routes: routesData.scenic_routes || []
@@ -161,19 +184,23 @@ const RouteForm = ({
       
       setRoutes(safeRoutesData);
       if (safeRoutesData.fastest_route) {
-        setSelectedRoute(safeRoutesData.fastest_route);
+        setSelectedRoute(current => current || safeRoutesData.fastest_route);
       }
     } catch (err) {
       console.error('Error fetching routes:', err);
-      if (err.response && err.response.data && err.response.data.error) {
-        const formattedError = formatErrorMessage(err.response.data.error);
-        setFormError(formattedError);
+      const message = err.message && !(err instanceof TypeError)
+        ? formatErrorMessage(err.message)
+        : 'Unable to generate routes at the moment. Please try again later.';
+      if (routeShown) {
+        setError(`Not every scenic route could be planned. ${message}`);
       } else {
-        setFormError('Unable to generate routes at the moment. Please try again later.');
+        setFormError(message);
       }
     } finally {
       setLoading(false);
-      setIsSubmitting(false);
+      if (!routeShown) {
+        setIsSubmitting(false);
+      }
     }
   };
 
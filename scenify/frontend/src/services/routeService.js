@@ -31,4 +31,62 @@ export const getRoutes = async (startLocation, endLocation, poiCount = 15, onPro
     console.error('Error fetching routes:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+// The deepest zoom the route paths are drawn at without visible simplification
+const PATH_ZOOM = 16;
+
+const parseEvent = (block) => {
+  let event = 'message';
+  let data = '';
+  block.split('\n').forEach((line) => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data += line.slice(5).trim();
+    }
+  });
+  return { event, data: data ? JSON.parse(data) : null };
+};
+
+// Plans the routes through the streaming endpoint. onEvent(event, data) is called for every stage
+// (geocoded, tiles, pois, solved, route) as the backend reports it, and the promise resolves to the
+// same routes /api/routes returns. The route paths come as encoded polylines simplified for PATH_ZOOM.
+export const streamRoutes = async (startLocation, endLocation, poiCount = 15, categories = [], onEvent) => {
+  const response = await fetch(`${API_URL}/routes/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      startLocation, endLocation, poiCount, categories, pathFormat: 'polyline', pathZoom: PATH_ZOOM
+    })
+  });
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.error || `Request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let separator = buffer.indexOf('\n\n');
+    while (separator !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, separator));
+      buffer = buffer.slice(separator + 2);
+      if (event === 'done') {
+        return data;
+      }
+      if (event === 'error') {
+        throw new Error(data.error);
+      }
+      onEvent?.(event, data);
+      separator = buffer.indexOf('\n\n');
+    }
+  }
+  throw new Error('The route stream ended early');
+};